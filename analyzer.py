@@ -0,0 +1,187 @@
+import json, re
+import xml.etree.ElementTree as ET
+
+from validate_xml import REQUIRED
+
+REQ_TAGS = set(REQUIRED)
+CLOUDMAPPING_SECTIONS = ["Compute", "Networking", "Data", "Messaging", "Identity"]
+
+# Vendor specificity hint (helps IaC)
+VENDOR_TERMS = ["Lambda", "API Gateway", "S3", "DynamoDB", "Aurora", "EKS", "KMS",
+                "Cloud Run", "GKE", "Pub/Sub", "Cloud SQL", "Secret Manager",
+                "Azure Functions", "AKS", "Event Grid", "Service Bus", "Key Vault", "Cosmos"]
+
+CHUNK = 1 << 16
+_SECTION_BY_LOWER = {s.lower(): s for s in CLOUDMAPPING_SECTIONS}
+
+def _trie_pattern(terms: list[str]) -> str:
+    """Factor common prefixes into one regex (e.g. Cloud (?:Run|SQL)) so every term is tried in a single scan."""
+    trie: dict = {}
+    for t in terms:
+        node = trie
+        for ch in t:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node) -> str:
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if "" in node:
+            return f"(?:{'|'.join(alts)})?" if alts else ""
+        return alts[0] if len(alts) == 1 else f"(?:{'|'.join(alts)})"
+    return emit(trie)
+
+class TermMatcher:
+    """All vendor terms compiled into one word-bounded automaton; reports which distinct terms occur."""
+
+    def __init__(self, terms: list[str]):
+        self.terms = list(terms)
+        self._re = re.compile(r"\b(" + _trie_pattern(self.terms) + r")\b")
+
+    def hits(self, text: str) -> set[str]:
+        found = set()
+        for m in self._re.finditer(text):
+            found.add(m.group(1))
+            if len(found) == len(self.terms):
+                break
+        return found
+
+VENDOR_MATCHER = TermMatcher(VENDOR_TERMS)
+
+_NUM_ATTR = re.compile(r'\s*"?\d')  # attribute value starts with a digit (quotes optional, as before)
+
+class _Walk:
+    """Accumulates structural facts from whichever walker (XML events, JSON values, tag scan) runs."""
+
+    def __init__(self):
+        self.tags: set[str] = set()
+        self.sections = {s: False for s in CLOUDMAPPING_SECTIONS}
+        self.p95 = self.rps = self.availability = False
+
+    def start(self, tag: str, attrs: dict) -> None:
+        self.tags.add(tag)
+        if not self.p95 and any(_NUM_ATTR.match(str(v)) for k, v in attrs.items() if k == "p95_ms"):
+            self.p95 = True
+        if not self.rps and "Throughput" in tag and _NUM_ATTR.match(str(attrs.get("rps", ""))):
+            self.rps = True
+        if not self.availability and "Availability" in tag and _NUM_ATTR.match(str(attrs.get("target", ""))):
+            self.availability = True
+
+    def end(self, tag: str) -> None:
+        s = _SECTION_BY_LOWER.get(tag.lower())
+        if s:
+            self.sections[s] = True
+
+    def metrics(self, text: str, fmt: str, parse_ok: bool) -> dict:
+        present = self.tags & REQ_TAGS
+        vendor = VENDOR_MATCHER.hits(text)
+        return {
+            "format": fmt,
+            "parse_ok": parse_ok,
+            "required_tags_present": len(present),
+            "missing_tags": sorted(REQ_TAGS - present),
+            "cloudmapping_coverage_count": sum(1 for v in self.sections.values() if v),
+            "cloudmapping_sections": dict(self.sections),
+            "nfr_p95_ms_present": self.p95,
+            "nfr_rps_present": self.rps,
+            "availability_target_present": self.availability,
+            "vendor_specific_hits": len(vendor),
+            "vendor_terms": sorted(vendor),
+            "bytes": len(text),
+        }
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _walk_xml(text: str, w: _Walk) -> int | None:
+    """
+    Feed the document through an incremental pull parser in chunks; elements
+    are cleared as they close. Returns None when the whole document parsed,
+    else the offset of the chunk where parsing failed.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    i = max(text.find("<"), 0)
+    try:
+        while i < len(text):
+            parser.feed(text[i:i + CHUNK])
+            for event, el in parser.read_events():
+                tag = _local(el.tag)
+                if event == "start":
+                    w.start(tag, el.attrib)
+                else:
+                    w.end(tag)
+                    el.clear()
+            i += CHUNK
+        parser.close()
+        for event, el in parser.read_events():
+            if event == "end":
+                w.end(_local(el.tag))
+        return None
+    except ET.ParseError:
+        return i
+
+_TAG = re.compile(r"<(/?)([A-Za-z_][\w.:-]*)((?:\s[^<>]*?)?)/?>")
+_ATTR = re.compile(r'([\w:.-]+)\s*=\s*"?([^"\s>]*)')
+
+def _scan_tags(text: str, w: _Walk) -> None:
+    """Tolerant single-regex tag scan for malformed/truncated XML or XML embedded in other text."""
+    for m in _TAG.finditer(text):
+        close, tag, attrs = m.groups()
+        if close:
+            w.end(tag)
+        else:
+            w.start(tag, dict(_ATTR.findall(attrs)))
+            if m.group(0).endswith("/>"):
+                w.end(tag)
+
+def _walk_json(value, w: _Walk, key: str = "") -> None:
+    """Keys act as tags; dict members as attributes; string values that hold XML are tag-scanned."""
+    stack = [(key, value)]
+    while stack:
+        k, v = stack.pop()
+        if isinstance(v, dict):
+            if k:
+                w.start(k, {a: b for a, b in v.items() if isinstance(b, (str, int, float))})
+                if v:
+                    w.end(k)
+            stack.extend(v.items())
+        elif isinstance(v, list):
+            stack.extend((k, x) for x in v)
+        elif isinstance(v, str):
+            if k:
+                w.tags.add(k)
+            if "<" in v:
+                _scan_tags(v, w)
+
+def _strip_fence(text: str) -> str:
+    s = text.strip()
+    if s.startswith("```"):
+        s = s.split("\n", 1)[1] if "\n" in s else ""
+        if s.rstrip().endswith("```"):
+            s = s.rstrip()[:-3]
+    return s
+
+def analyze(text: str) -> dict:
+    """
+    One structural walk over a candidate (XML via pull parser, JSON via the
+    decoder), producing the judge's auto metrics. Malformed XML falls back to
+    a tolerant tag scan so truncated candidates still get partial credit.
+    """
+    w = _Walk()
+    body = _strip_fence(text)
+    if body[:1] in "{[" and body:
+        try:
+            _walk_json(json.loads(body), w)
+            return w.metrics(text, "json", True)
+        except ValueError:
+            _scan_tags(body, w)
+            return w.metrics(text, "json", False)
+    failed_at = _walk_xml(body, w)
+    if failed_at is not None:
+        # keep what parsed; tag-scan only from the failing chunk on (with a little
+        # overlap for a tag that straddled the chunk boundary)
+        _scan_tags(body[max(failed_at - 1024, 0):], w)
+    return w.metrics(text, "xml", failed_at is None)
+
+def auto_metrics(text: str) -> dict:
+    """Hint features for the judge (same keys the regex version produced, plus format/parse_ok/vendor_terms)."""
+    return analyze(text)
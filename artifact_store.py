@@ -0,0 +1,282 @@
+"""
+Content-addressed, compressed storage for run outputs.
+
+    runs/.blobs/<aa>/<sha256>.gz      one blob per distinct file content (.zst when
+                                      the zstandard package is installed)
+    runs/<STAMP>/artifacts.json       manifest: name -> {sha256, size, codec}
+
+Runners write plain files while they work and pack the run dir when they
+finish (autopack; RUNS_PACK=0 keeps plain files), so identical outputs across
+runs (brd_document.json, replayed judge responses, ...) are stored once.
+Readers go through list_names / exists / read_text, which see loose files
+first and then the manifest, so packed and unpacked runs look the same and
+nothing globs the whole tree.
+
+    python artifact_store.py migrate [--dry-run]      pack every run folder
+    python artifact_store.py pack STAMP [STAMP ...]   / unpack STAMP
+    python artifact_store.py ls STAMP                 (reads only the manifest)
+    python artifact_store.py cat STAMP NAME
+    python artifact_store.py gc                       drop blobs no manifest points at
+"""
+import os, json, gzip, hashlib, pathlib, argparse, threading
+
+from assets import RUNS_DIR
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip is always available
+    zstandard = None
+
+BLOBS_NAME = ".blobs"
+ARTIFACTS_NAME = "artifacts.json"
+CODEC = os.environ.get("RUNS_CODEC", "zst" if zstandard else "gz")
+if CODEC == "zst" and zstandard is None:
+    raise SystemExit("RUNS_CODEC=zst needs the zstandard package (pip install zstandard)")
+AUTO_PACK = os.environ.get("RUNS_PACK", "1") != "0"
+
+# --- blobs ---
+def blobs_dir(runs_dir: pathlib.Path = RUNS_DIR) -> pathlib.Path:
+    return runs_dir / BLOBS_NAME
+
+def _blob_path(sha: str, codec: str, runs_dir: pathlib.Path = RUNS_DIR) -> pathlib.Path:
+    return blobs_dir(runs_dir) / sha[:2] / f"{sha}.{codec}"
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zst":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zst":
+        if zstandard is None:
+            raise SystemExit("this run was packed with zstd; pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def put_blob(data: bytes, runs_dir: pathlib.Path = RUNS_DIR, codec: str = CODEC) -> tuple[str, str, int]:
+    """Store `data` once; returns (sha256, codec, bytes newly written - 0 when the content was already there)."""
+    sha = hashlib.sha256(data).hexdigest()
+    for c in (codec, "gz", "zst"):
+        if _blob_path(sha, c, runs_dir).exists():
+            return sha, c, 0
+    path = _blob_path(sha, codec, runs_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    packed = _compress(data, codec)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(packed)
+    os.replace(tmp, path)
+    return sha, codec, len(packed)
+
+def get_blob(sha: str, codec: str, runs_dir: pathlib.Path = RUNS_DIR) -> bytes:
+    data = _decompress(_blob_path(sha, codec, runs_dir).read_bytes(), codec)
+    if hashlib.sha256(data).hexdigest() != sha:
+        raise ValueError(f"blob {sha[:12]} is corrupt")
+    return data
+
+# --- manifests ---
+def _runs_root(run_dir: pathlib.Path) -> pathlib.Path:
+    """The runs/ folder a run dir lives in (run dirs may nest, e.g. runs/<STAMP>/code)."""
+    for p in (run_dir, *run_dir.parents):
+        if (p / BLOBS_NAME).is_dir():
+            return p
+    return RUNS_DIR
+
+# parsed manifests by path, valid while (mtime_ns, size, inode) match; manifests are replaced, never edited
+_manifests: dict[pathlib.Path, tuple[tuple, dict]] = {}
+_manifests_lock = threading.Lock()
+
+def load_manifest(run_dir: pathlib.Path) -> dict[str, dict]:
+    """name -> {sha256, size, codec}; shared between callers, so treat it as read-only."""
+    path = run_dir / ARTIFACTS_NAME
+    try:
+        st = path.stat()
+    except OSError:
+        return {}
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _manifests.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    try:
+        files = json.loads(path.read_text(encoding="utf-8")).get("files", {})
+    except (OSError, ValueError):
+        return {}
+    with _manifests_lock:
+        _manifests[path] = (stamp, files)
+    return files
+
+def _save_manifest(run_dir: pathlib.Path, files: dict[str, dict]) -> None:
+    path = run_dir / ARTIFACTS_NAME
+    if not files:
+        path.unlink(missing_ok=True)
+        return
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps({"files": dict(sorted(files.items()))}, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+# --- transparent reads: loose file first, then the manifest ---
+def list_names(run_dir: pathlib.Path) -> list[str]:
+    """Artifact names in one run (loose files and packed entries); subfolders are separate runs."""
+    loose = {p.name for p in run_dir.iterdir() if p.is_file() and p.name != ARTIFACTS_NAME
+             and not p.name.endswith(".tmp")} if run_dir.is_dir() else set()
+    return sorted(loose | set(load_manifest(run_dir)))
+
+def exists(run_dir: pathlib.Path, name: str) -> bool:
+    return (run_dir / name).is_file() or name in load_manifest(run_dir)
+
+def read_bytes(run_dir: pathlib.Path, name: str) -> bytes:
+    path = run_dir / name
+    if path.is_file():
+        return path.read_bytes()
+    entry = load_manifest(run_dir).get(name)
+    if entry is None:
+        raise FileNotFoundError(path)
+    return get_blob(entry["sha256"], entry["codec"], _runs_root(run_dir))
+
+def read_text(run_dir: pathlib.Path, name: str, errors: str = "strict") -> str:
+    return read_bytes(run_dir, name).decode("utf-8", errors=errors)
+
+def digest(run_dir: pathlib.Path, name: str) -> str:
+    """sha256 of an artifact; free for packed files (it is the blob name)."""
+    path = run_dir / name
+    if not path.is_file():
+        entry = load_manifest(run_dir).get(name)
+        if entry is not None:
+            return entry["sha256"]
+    return hashlib.sha256(read_bytes(run_dir, name)).hexdigest()
+
+def materialize(run_dir: pathlib.Path, name: str) -> pathlib.Path:
+    """
+    Make `name` a loose file again (for writers that append or merge into it);
+    the loose copy shadows the packed one until the next pack.
+    """
+    path = run_dir / name
+    if not path.is_file() and name in load_manifest(run_dir):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(read_bytes(run_dir, name))
+    return path
+
+# --- packing ---
+def pack_run(run_dir: pathlib.Path, runs_dir: pathlib.Path = RUNS_DIR, dry_run: bool = False) -> dict:
+    """
+    Move every loose file of a run (and of nested run folders) into blobs.
+    Blobs are written before the manifest and files are removed last, so an
+    interrupted pack never loses data. Returns byte counts for the report.
+    """
+    stats = {"files": 0, "bytes": 0, "stored": 0}
+    files = dict(load_manifest(run_dir))
+    for p in sorted(run_dir.iterdir()):
+        if p.is_dir():
+            for k, v in pack_run(p, runs_dir, dry_run).items():
+                stats[k] += v
+            continue
+        if p.name == ARTIFACTS_NAME or p.name.endswith(".tmp"):
+            continue
+        data = p.read_bytes()
+        stats["files"] += 1
+        stats["bytes"] += len(data)
+        if dry_run:
+            sha = hashlib.sha256(data).hexdigest()
+            if not any(_blob_path(sha, c, runs_dir).exists() for c in ("gz", "zst")):
+                stats["stored"] += len(_compress(data, CODEC))
+            continue
+        sha, codec, written = put_blob(data, runs_dir)
+        stats["stored"] += written
+        files[p.name] = {"sha256": sha, "size": len(data), "codec": codec}
+    if not dry_run and stats["files"]:
+        _save_manifest(run_dir, files)
+        for name in files:
+            (run_dir / name).unlink(missing_ok=True)
+    return stats
+
+def autopack(run_dir: pathlib.Path, runs_dir: pathlib.Path = RUNS_DIR) -> dict | None:
+    """Pack a run when its runner is done (unless RUNS_PACK=0); prints a one-line report."""
+    if not AUTO_PACK or not run_dir.is_dir():
+        return None
+    stats = pack_run(run_dir, runs_dir)
+    if stats["files"]:
+        print(f"packed {stats['files']} file(s) in {run_dir.name}: {_mb(stats['bytes'])} -> "
+              f"{_mb(stats['stored'])} of new blobs")
+    return stats
+
+def unpack_run(run_dir: pathlib.Path) -> int:
+    """Restore a run's packed files (and nested runs') as plain files; returns how many were written."""
+    n = 0
+    for p in run_dir.iterdir():
+        if p.is_dir():
+            n += unpack_run(p)
+    for name in load_manifest(run_dir):
+        if not (run_dir / name).is_file():
+            materialize(run_dir, name)
+            n += 1
+    (run_dir / ARTIFACTS_NAME).unlink(missing_ok=True)
+    return n
+
+def run_dirs(runs_dir: pathlib.Path = RUNS_DIR) -> list[pathlib.Path]:
+    return sorted(d for d in runs_dir.iterdir() if d.is_dir() and not d.name.startswith("."))
+
+def gc(runs_dir: pathlib.Path = RUNS_DIR) -> tuple[int, int]:
+    """Delete blobs no manifest references; returns (blobs removed, bytes freed)."""
+    live = set()
+    for m in runs_dir.rglob(ARTIFACTS_NAME):
+        live |= {e["sha256"] for e in load_manifest(m.parent).values()}
+    removed = freed = 0
+    root = blobs_dir(runs_dir)
+    for blob in (root.glob("*/*") if root.is_dir() else ()):
+        if blob.name.split(".")[0] not in live:
+            freed += blob.stat().st_size
+            blob.unlink()
+            removed += 1
+    return removed, freed
+
+def _mb(n: int) -> str:
+    return f"{n / 1e6:.2f} MB"
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compressed, deduplicated storage for runs/")
+    ap.add_argument("--runs-dir", type=pathlib.Path, default=RUNS_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sp = sub.add_parser("migrate", help="pack every run folder")
+    sp.add_argument("--dry-run", action="store_true", help="only report what packing would save")
+    sp = sub.add_parser("pack")
+    sp.add_argument("stamps", nargs="+")
+    sp = sub.add_parser("unpack")
+    sp.add_argument("stamps", nargs="+")
+    sp = sub.add_parser("ls")
+    sp.add_argument("stamp")
+    sp = sub.add_parser("cat")
+    sp.add_argument("stamp")
+    sp.add_argument("name")
+    sub.add_parser("gc")
+    args = ap.parse_args(argv)
+    runs = args.runs_dir
+
+    if args.cmd in ("migrate", "pack"):
+        dirs = run_dirs(runs) if args.cmd == "migrate" else [runs / s for s in args.stamps]
+        total = {"files": 0, "bytes": 0, "stored": 0}
+        for d in dirs:
+            if not d.is_dir():
+                raise SystemExit(f"no such run: {d}")
+            for k, v in pack_run(d, runs, getattr(args, "dry_run", False)).items():
+                total[k] += v
+        verb = "would store" if getattr(args, "dry_run", False) else "stored"
+        print(f"{len(dirs)} run(s), {total['files']} file(s): {_mb(total['bytes'])} -> {verb} {_mb(total['stored'])} "
+              f"of new blobs")
+    elif args.cmd == "unpack":
+        for s in args.stamps:
+            print(f"{s}: {unpack_run(runs / s)} file(s) restored")
+    elif args.cmd == "ls":
+        run_dir = runs / args.stamp
+        files = load_manifest(run_dir)
+        for name in list_names(run_dir):
+            e = files.get(name)
+            where = "loose" if (run_dir / name).is_file() else f"{e['codec']} {e['sha256'][:12]}"
+            size = (run_dir / name).stat().st_size if where == "loose" else e["size"]
+            print(f"{name} | {size} | {where}")
+    elif args.cmd == "cat":
+        print(read_text(runs / args.stamp, args.name, errors="replace"), end="")
+    elif args.cmd == "gc":
+        removed, freed = gc(runs)
+        print(f"removed {removed} blob(s), freed {_mb(freed)}")
+
+if __name__ == "__main__":
+    main()
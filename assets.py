@@ -0,0 +1,237 @@
+import os, json, hashlib, pathlib
+from collections import Counter
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from types import MappingProxyType
+
+import context_pack
+from context_pack import ContextIndex, FileEntry, make_entry
+
+# --- setup paths ---
+ROOT = pathlib.Path(__file__).resolve().parent
+RUNS_DIR = pathlib.Path(os.environ.get("LLM_RUNS_DIR", ROOT / "runs"))  # override for offline benches
+
+SCHEMA_PATH = ROOT / "final_schema.json"
+BRD_PATH    = ROOT / "resources" / "brd_summary.md"
+GUARD_PATH  = ROOT / "resources" / "guardrails.md"
+RULES_PATH  = ROOT / "resources" / "architecture_rules.xml"
+
+# generic Terraform templates (patterns agent outputs) and translated Python (code build agent)
+TF_ROOT   = ROOT / "infra" / "patterns" / "templates"
+PY_ROOT   = ROOT / "src"
+TREES     = [(TF_ROOT, "*.tf"), (PY_ROOT, "*.py")]
+
+# Token budgets per packed code block (roughly what the old 350 KB byte caps allowed)
+TF_TOKEN_BUDGET = int(os.environ.get("TF_TOKEN_BUDGET", "100000"))
+PY_TOKEN_BUDGET = int(os.environ.get("PY_TOKEN_BUDGET", "100000"))
+
+# Persisted between processes so unchanged files are never re-read
+SNAPSHOT_CACHE = RUNS_DIR / ".assets_snapshot.json"
+# Derived index entries (keywords, summaries, BM25 term counts) keyed by rel + sha256
+INDEX_CACHE = RUNS_DIR / ".assets_index.json"
+# Written into every run dir to tie outputs (and judge results) to their inputs
+MANIFEST_NAME = "assets_snapshot.json"
+
+@dataclass(frozen=True)
+class FileRecord:
+    rel: str
+    mtime_ns: int
+    size: int
+    sha256: str
+
+class StaleSnapshot(RuntimeError):
+    """A file's content no longer matches the sha256 its snapshot record trusted from (mtime, size)."""
+
+class Snapshot:
+    """
+    Immutable view of every asset file: (path, mtime, size, sha256).
+    `id` is a short hash over the sorted (path, sha256) pairs, so two runs that
+    saw byte-identical inputs share an id regardless of mtimes. Text is read
+    on first use (files hashed while snapshotting are kept from that read) and
+    checked against the recorded sha256; a mismatch raises StaleSnapshot.
+    """
+
+    def __init__(self, records: dict[str, FileRecord], texts: dict[str, str] | None = None):
+        self.files = MappingProxyType(dict(sorted(records.items())))
+        self._texts = dict(texts or {})
+        digest = hashlib.sha256()
+        for rel, r in self.files.items():
+            digest.update(f"{rel}\0{r.sha256}\n".encode("utf-8"))
+        self.id = digest.hexdigest()[:16]
+
+    def read(self, rel: str) -> str:
+        if rel not in self.files:
+            return ""
+        if rel not in self._texts:
+            try:
+                text = (ROOT / rel).read_text(encoding="utf-8")
+            except Exception:
+                text = ""
+            if hashlib.sha256(text.encode("utf-8")).hexdigest() != self.files[rel].sha256:
+                raise StaleSnapshot(rel)
+            self._texts[rel] = text
+        return self._texts[rel]
+
+    def text(self, path: pathlib.Path) -> str:
+        return self.read(str(path.relative_to(ROOT)))
+
+    def under(self, root: pathlib.Path, suffix: str) -> list[FileRecord]:
+        prefix = str(root.relative_to(ROOT)) + os.sep
+        return [r for rel, r in self.files.items() if rel.startswith(prefix) and rel.endswith(suffix)]
+
+    def manifest(self) -> dict:
+        return {
+            "snapshot_id": self.id,
+            "files": [asdict(r) for r in self.files.values()],
+        }
+
+    def write_manifest(self, out_dir: pathlib.Path) -> pathlib.Path:
+        out = out_dir / MANIFEST_NAME
+        out.write_text(json.dumps(self.manifest(), indent=2), encoding="utf-8")
+        return out
+
+def _asset_paths() -> list[pathlib.Path]:
+    paths = [SCHEMA_PATH, BRD_PATH, GUARD_PATH, RULES_PATH]
+    for root, pattern in TREES:
+        if root.exists():
+            paths += sorted(root.rglob(pattern))
+    return paths
+
+def _load_cache(cache: pathlib.Path) -> dict[str, FileRecord]:
+    try:
+        raw = json.loads(cache.read_text(encoding="utf-8"))
+        return {r["rel"]: FileRecord(**r) for r in raw.get("files", [])}
+    except Exception:
+        return {}
+
+def take_snapshot(cache: pathlib.Path | None = None) -> Snapshot:
+    """
+    Stat every asset file and re-hash only those whose (mtime, size) changed since
+    the persisted snapshot, which holds no file bodies. Missing/unreadable files
+    are skipped. The persisted copy is rewritten only when something changed.
+    """
+    cache = cache or SNAPSHOT_CACHE
+    prev = _load_cache(cache)
+    records, texts, changed = {}, {}, False
+    for p in _asset_paths():
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        rel = str(p.relative_to(ROOT))
+        old = prev.get(rel)
+        if old and old.mtime_ns == st.st_mtime_ns and old.size == st.st_size:
+            records[rel] = old
+            continue
+        try:
+            text = p.read_text(encoding="utf-8")
+        except Exception:
+            continue
+        records[rel] = FileRecord(rel, st.st_mtime_ns, st.st_size,
+                                  hashlib.sha256(text.encode("utf-8")).hexdigest())
+        texts[rel] = text
+        changed = True
+    snap = Snapshot(records, texts)
+    if changed or set(prev) != set(records):
+        try:
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"snapshot_id": snap.id,
+                                       "files": [asdict(r) for r in snap.files.values()]}),
+                           encoding="utf-8")
+            os.replace(tmp, cache)
+        except OSError:
+            pass  # read-only checkout: still usable, just not incremental
+    return snap
+
+@dataclass(frozen=True)
+class Assets:
+    snapshot_id: str
+    SCHEMA: str
+    BRD: str
+    GUARD: str
+    RULES: str
+    tf_index: ContextIndex
+    py_index: ContextIndex
+
+@lru_cache(maxsize=1)
+def snapshot() -> Snapshot:
+    return take_snapshot()
+
+def _index_version() -> str:
+    # Entries are only valid for the code that derived them
+    return hashlib.sha256(pathlib.Path(context_pack.__file__).read_bytes()).hexdigest()[:16]
+
+def _entry_from_json(raw: dict) -> FileEntry:
+    return FileEntry(rel=raw["rel"], text=raw["text"], sha256=raw["sha256"], tokens=raw["tokens"],
+                     keywords=tuple(raw["keywords"]), summary=raw["summary"],
+                     summary_tokens=raw["summary_tokens"], tf=Counter(raw["tf"]), length=raw["length"])
+
+def _entry_to_json(e: FileEntry) -> dict:
+    raw = asdict(e)
+    raw["tf"] = dict(e.tf)
+    return raw
+
+def load_entries(snap: Snapshot, records: list[FileRecord], cache: pathlib.Path | None = None) -> list[FileEntry]:
+    """
+    FileEntry per record, re-derived only for files whose sha256 changed since the
+    persisted index (which also holds the text, so a warm load opens no asset file).
+    The persisted copy is rewritten only when something changed.
+    """
+    cache = cache or INDEX_CACHE
+    version = _index_version()
+    try:
+        raw = json.loads(cache.read_text(encoding="utf-8"))
+        prev = raw["entries"] if raw.get("version") == version else {}
+    except Exception:
+        prev = {}
+    entries, changed = [], False
+    for r in records:
+        old = prev.get(r.rel)
+        if old and old["sha256"] == r.sha256:
+            entries.append(_entry_from_json(old))
+        else:
+            entries.append(make_entry(r.rel, snap.read(r.rel)))
+            changed = True
+    if changed:
+        merged = {rel: v for rel, v in prev.items() if rel in snap.files}
+        merged.update((e.rel, _entry_to_json(e)) for e in entries)
+        try:
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"version": version, "entries": merged}), encoding="utf-8")
+            os.replace(tmp, cache)
+        except OSError:
+            pass  # read-only checkout: rebuilt per process
+    return entries
+
+def _build_assets(snap: Snapshot) -> Assets:
+    return Assets(
+        snapshot_id=snap.id,
+        SCHEMA=snap.text(SCHEMA_PATH),
+        BRD=snap.text(BRD_PATH),
+        GUARD=snap.text(GUARD_PATH),
+        RULES=snap.text(RULES_PATH),
+        tf_index=ContextIndex(load_entries(snap, snap.under(TF_ROOT, ".tf"))),
+        py_index=ContextIndex(load_entries(snap, snap.under(PY_ROOT, ".py"))),
+    )
+
+@lru_cache(maxsize=1)
+def load_assets() -> Assets:
+    """The shared, memoized asset blobs and code indexes for this process."""
+    try:
+        return _build_assets(snapshot())
+    except StaleSnapshot:
+        # A file changed without its (mtime, size) changing: drop the persisted
+        # snapshot so every file is re-stat'ed and re-hashed, then build again
+        snapshot.cache_clear()
+        SNAPSHOT_CACHE.unlink(missing_ok=True)
+        return _build_assets(snapshot())
+
+def run_snapshot_id(run_dir: pathlib.Path) -> str | None:
+    """Snapshot id recorded in a run dir, if the run wrote one."""
+    import artifact_store  # imports this module
+    try:
+        return json.loads(artifact_store.read_text(run_dir, MANIFEST_NAME)).get("snapshot_id")
+    except Exception:
+        return None
@@ -0,0 +1,89 @@
+"""
+Microbenchmark: legacy regex auto_metrics / ElementTree validate_xml vs the
+single-pass analyzer, over a directory of multi-MB candidates.
+
+    python bench/bench_analyzer.py [--dir DIR] [--mb 4] [--files 6]
+
+Without --dir, candidates are synthesized from the XML/JSON outputs in runs/
+(each repeated until it reaches --mb megabytes).
+"""
+import argparse, pathlib, re, sys, tempfile, time
+import xml.etree.ElementTree as ET
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from analyzer import analyze, VENDOR_TERMS, CLOUDMAPPING_SECTIONS, _strip_fence
+from validate_xml import validate_xml, REQUIRED
+
+# --- legacy implementations (as they were in judge_prompts.py / validate_xml.py) ---
+def legacy_auto_metrics(x: str):
+    m = {}
+    present = [t for t in REQUIRED if re.search(fr"<{t}\b", x)]
+    m["required_tags_present"] = len(present)
+    sec_ok = {s: bool(re.search(fr"<{s}\b[^>]*>.*?</{s}>", x, flags=re.S | re.I)) for s in CLOUDMAPPING_SECTIONS}
+    m["cloudmapping_coverage_count"] = sum(1 for v in sec_ok.values() if v)
+    m["nfr_p95_ms_present"] = bool(re.search(r'p95_ms="?\d+', x))
+    m["nfr_rps_present"] = bool(re.search(r'Throughput[^>]*rps="?\d+', x))
+    m["availability_target_present"] = bool(re.search(r'Availability[^>]*target="?\d', x))
+    m["vendor_specific_hits"] = sum(1 for t in VENDOR_TERMS if re.search(fr"\b{re.escape(t)}\b", x))
+    return m
+
+def legacy_validate_xml(xml_text: str):
+    try:
+        root = ET.fromstring(xml_text)
+    except ET.ParseError as e:
+        return False, f"ParseError: {e}"
+    missing = [t for t in REQUIRED if root.find(f".//{t}") is None]
+    return (False, f"Missing sections: {', '.join(missing)}") if missing else (True, "OK")
+
+def synthesize(out: pathlib.Path, mb: float, files: int) -> None:
+    """Grow real run outputs to ~mb MB: XML by repeating the body inside the root, JSON as-is repeated in an array."""
+    sources = sorted((ROOT / "runs").glob("*/*.xml"))[:files]
+    target = int(mb * 1024 * 1024)
+    for i, src in enumerate(sources):
+        text = _strip_fence(src.read_text(encoding="utf-8"))
+        root = re.search(r"<[A-Za-z][^>]*>", text)
+        close = text.rfind("</")
+        if legacy_validate_xml(text)[0] and root and close > root.end():
+            # valid document: repeat the root's children so it stays well-formed
+            body = text[root.end():close]
+            reps = max(1, target // max(len(body), 1))
+            text = text[:root.end()] + body * reps + text[close:]
+        else:
+            text = text * max(1, target // max(len(text), 1))
+        (out / f"cand_{i:02d}.xml").write_text(text, encoding="utf-8")
+
+def timed(fn, texts):
+    t0 = time.perf_counter()
+    for t in texts:
+        fn(t)
+    return time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--dir", type=pathlib.Path)
+    ap.add_argument("--mb", type=float, default=4)
+    ap.add_argument("--files", type=int, default=6)
+    a = ap.parse_args()
+
+    tmp = None
+    d = a.dir
+    if d is None:
+        tmp = tempfile.TemporaryDirectory()
+        d = pathlib.Path(tmp.name)
+        synthesize(d, a.mb, a.files)
+    texts = [p.read_text(encoding="utf-8") for p in sorted(d.iterdir()) if p.is_file()]
+    total_mb = sum(len(t) for t in texts) / 1024 / 1024
+
+    print(f"{len(texts)} candidates, {total_mb:.1f} MB total\n")
+    print("stage | legacy s | analyzer s | speedup")
+    for label, old, new in [("auto_metrics", legacy_auto_metrics, analyze),
+                            ("validate_xml", legacy_validate_xml, validate_xml)]:
+        t_old, t_new = timed(old, texts), timed(new, texts)
+        print(f"{label} | {t_old:.3f} | {t_new:.3f} | {t_old / t_new:.1f}x")
+    if tmp:
+        tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Cold-start import cost of the src/ handlers, from `python -X importtime`:
+
+    python bench/bench_cold_start.py [--repeat 5]
+
+Each handler module is imported in a fresh interpreter with lazy clients
+(the default) and with RUNTIME_EAGER=1 (clients built at import, as the
+handlers used to do). Reports the median cumulative import time of the
+module and the boto3 import + client builds within it, then the runtime's startup profile for the
+first request (boto3 import + client / resource builds that the lazy mode defers). Lazy mode
+does not save that work, it moves it out of the import into the first request that uses it.
+"""
+import argparse, json, os, pathlib, statistics, subprocess, sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+MODULES = {
+    "src.ops.health": "",
+    "src.orders.handlers": "resource:dynamodb,events",
+    "src.inventory.handlers": "dynamodb,events",
+    "src.ingestor.process_csv": "s3,events",
+    "src.receipts.worker": "s3",
+}
+
+def import_ms(module: str, eager: bool) -> tuple[float, float]:
+    """(cumulative import ms of the module, ms of boto3 import + client builds done during it)."""
+    env = {**os.environ, "RUNTIME_EAGER": "1" if eager else "0"}
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    code = f"import {module}, json; from src.common import runtime; print(json.dumps(runtime.profile()))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+    cumulative = 0.0
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and line.split("|")[-1].strip() == module:
+            cumulative = int(line.split("|")[1]) / 1000
+    p = json.loads(proc.stdout)
+    aws = sum(p["imports"].values()) + sum(p["clients"].values()) + sum(p["resources"].values())
+    return cumulative, aws
+
+def first_request_ms(module: str, touch: str) -> dict:
+    env = {**os.environ, "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1")}
+    out = subprocess.run([sys.executable, "-m", "src.common.runtime", module, "--touch", touch], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    import_ms(next(iter(MODULES)), False)   # warm the bytecode cache so every run below is comparable
+    print("module | lazy import ms | eager import ms | boto3+clients ms (eager) | moved to first request ms")
+    for module in MODULES:
+        lazy = [import_ms(module, False)[0] for _ in range(args.repeat)]
+        eager = [import_ms(module, True) for _ in range(args.repeat)]
+        lazy_ms, eager_ms = statistics.median(lazy), statistics.median(e[0] for e in eager)
+        boto_ms = statistics.median(e[1] for e in eager)
+        print(f"{module} | {lazy_ms:.1f} | {eager_ms:.1f} | {boto_ms:.1f} | {eager_ms - lazy_ms:.1f}")
+
+    print("\nfirst request (lazy): what the deferred work costs when a handler first touches its clients")
+    print("module | boto3 import ms | client / resource builds ms")
+    for module, touch in MODULES.items():
+        if touch:
+            p = first_request_ms(module, touch)
+            print(f"{module} | {p['imports'].get('boto3', 0):.1f} | "
+                  + ", ".join([f"{k} {v:.1f}" for k, v in p["clients"].items()]
+                              + [f"{k} (resource) {v:.1f}" for k, v in p["resources"].items()]))
+
+if __name__ == "__main__":
+    main()
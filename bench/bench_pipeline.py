@@ -0,0 +1,174 @@
+"""
+End-to-end offline benchmark: habeeba_run.py -> run.py -> judge_prompts.py
+against bench/fake_anthropic.py, plus in-process timings of the CPU-bound
+stages (asset gathering, templating/packing, JSON coercion, auto metrics).
+
+    python bench/bench_pipeline.py [--ttft fixed:0.05] [--tps 2000] [--error-rate 0]
+                                   [--stream] [--save-baseline] [--tolerance 0.3]
+
+Every script runs as its own process with outputs in a temp LLM_RUNS_DIR and
+a cold response cache. Per stage it reports wall time, CPU time (user+sys of
+that process) and peak RSS; throughput is model calls per wall second.
+
+Results are compared with bench/baseline_pipeline.json (CPU time and peak RSS
+only; wall time depends on the simulated latency). A stage more than
+--tolerance worse than the baseline is reported and the exit code is 1.
+--save-baseline writes the current numbers as the new baseline.
+"""
+import argparse, json, os, pathlib, platform, subprocess, sys, tempfile, time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+BASELINE = pathlib.Path(__file__).resolve().parent / "baseline_pipeline.json"
+
+import httpx
+from fake_anthropic import start
+
+def run_script(name: str, argv: list[str], env: dict) -> dict:
+    """Run one pipeline script; per-process CPU and peak RSS come from wait4's rusage."""
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, str(ROOT / name), *argv], cwd=ROOT, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    out = proc.stdout.read()
+    _, status, ru = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - t0
+    if proc.returncode:
+        sys.stdout.write(out.decode(errors="replace")[-3000:])
+        raise SystemExit(f"{name} exited with {proc.returncode}")
+    rss_kb = ru.ru_maxrss if sys.platform != "darwin" else ru.ru_maxrss // 1024
+    return {"wall_s": round(wall, 3), "cpu_s": round(ru.ru_utime + ru.ru_stime, 3), "peak_rss_mb": round(rss_kb / 1024, 1)}
+
+def timed(fn, repeat: int = 3) -> dict:
+    """Best-of-N wall and CPU time of an in-process stage."""
+    best_cpu = best_wall = float("inf")
+    for _ in range(repeat):
+        c0, w0 = time.process_time(), time.perf_counter()
+        fn()
+        best_cpu = min(best_cpu, time.process_time() - c0)
+        best_wall = min(best_wall, time.perf_counter() - w0)
+    return {"wall_s": round(best_wall, 4), "cpu_s": round(best_cpu, 4)}
+
+def micro_stages() -> dict:
+    """The per-call CPU work of the runners and the judge, without any I/O to the API."""
+    import assets, artifact_store
+    from templating import load_template
+    from prompt_blocks import build_content
+    from json_extract import extract_json
+    from analyzer import auto_metrics
+
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        assets.SNAPSHOT_CACHE = pathlib.Path(tmp) / "snap.json"
+        assets.INDEX_CACHE = pathlib.Path(tmp) / "index.json"
+
+        def cold_assets():
+            assets.snapshot.cache_clear()
+            assets.load_assets.cache_clear()
+            assets.SNAPSHOT_CACHE.unlink(missing_ok=True)
+            assets.INDEX_CACHE.unlink(missing_ok=True)
+            assets.load_assets()
+        out["assets_cold"] = timed(cold_assets)
+
+        def warm_assets():
+            assets.snapshot.cache_clear()
+            assets.load_assets.cache_clear()
+            assets.load_assets()
+        out["assets_warm"] = timed(warm_assets)
+
+    a = assets.load_assets()
+    templates = sorted((ROOT / "agent_e_prompts").glob("*.txt"))
+
+    def templating():
+        for p in templates:
+            t = load_template(p)
+            query = t.source + "\n" + a.BRD
+            build_content(t, {"RULES_TEXT": a.RULES, "SCHEMA": a.SCHEMA, "GUARDRAILS_TEXT": a.GUARD, "BRD_TEXT": a.BRD,
+                              "TF_TEMPLATES": a.tf_index.pack(query, assets.TF_TOKEN_BUDGET),
+                              "PY_SOURCES": a.py_index.pack(query, assets.PY_TOKEN_BUDGET)})
+    out["templating_and_packing"] = timed(templating)
+
+    runs = artifact_store.run_dirs(ROOT / "runs")
+    recorded = [artifact_store.read_text(d, n, errors="replace") for d in runs for n in artifact_store.list_names(d)
+                if n.endswith(".json") and n not in ("judge_prompts.json", "assets_snapshot.json")]
+
+    def coerce():
+        for text in recorded:
+            try:
+                extract_json(text)
+            except ValueError:
+                pass
+    out["json_coercion"] = timed(coerce)
+
+    xml = [artifact_store.read_text(d, n, errors="replace") for d in runs for n in artifact_store.list_names(d)
+           if n.endswith(".xml")]
+    out["auto_metrics"] = timed(lambda: [auto_metrics(t) for t in recorded + xml])
+    return out
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for group in ("pipeline", "micro"):
+        for stage, now in current.get(group, {}).items():
+            was = baseline.get(group, {}).get(stage)
+            if not was:
+                continue
+            for metric in ("cpu_s", "peak_rss_mb"):
+                if metric in now and was.get(metric):
+                    # ignore sub-50 ms noise on tiny stages
+                    if now[metric] > was[metric] * (1 + tolerance) and now[metric] - was[metric] > 0.05:
+                        regressions.append(f"{group}.{stage}.{metric}: {was[metric]} -> {now[metric]}")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--ttft", default="fixed:0.05")
+    ap.add_argument("--tps", type=float, default=2000.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--stream", action="store_true", help="run the generators with --stream")
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.3)
+    args = ap.parse_args()
+
+    server = start(0, args.ttft, args.tps, args.error_rate, retry_after=0.2)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    result = {"python": platform.python_version(), "fake": {"ttft": args.ttft, "tps": args.tps,
+                                                            "error_rate": args.error_rate}, "pipeline": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "ANTHROPIC_BASE_URL": base_url, "ANTHROPIC_API_KEY": "fake",
+               "LLM_RUNS_DIR": tmp, "LLM_CACHE_DIR": str(pathlib.Path(tmp) / ".llm_cache"),
+               "BACKOFF_BASE_S": "0.2", "BACKOFF_MAX_S": "1"}
+        gen = ["--cache", "off"] + (["--stream"] if args.stream else [])
+        for stage, script, argv in (("habeeba_run", "habeeba_run.py", gen),
+                                    ("run", "run.py", ["--stream"] if args.stream else []),
+                                    ("judge", "judge_prompts.py", ["--cache", "off", "--run", "latest:agent_e"])):
+            before = httpx.get(base_url + "/stats").json()["calls"]
+            r = run_script(script, argv, env)
+            r["calls"] = httpx.get(base_url + "/stats").json()["calls"] - before
+            r["calls_per_s"] = round(r["calls"] / r["wall_s"], 2) if r["wall_s"] else None
+            result["pipeline"][stage] = r
+    result["fake"]["stats"] = httpx.get(base_url + "/stats").json()
+    server.shutdown()
+    result["micro"] = micro_stages()
+
+    print("stage | calls | calls/s | wall_s | cpu_s | peak_rss_mb")
+    for stage, r in result["pipeline"].items():
+        print(f"{stage} | {r['calls']} | {r['calls_per_s']} | {r['wall_s']} | {r['cpu_s']} | {r['peak_rss_mb']}")
+    print("\nmicro stage | wall_s | cpu_s")
+    for stage, r in result["micro"].items():
+        print(f"{stage} | {r['wall_s']} | {r['cpu_s']}")
+
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+        print(f"\nbaseline saved: {BASELINE}")
+        return
+    if not BASELINE.exists():
+        print("\nno baseline yet (run with --save-baseline)")
+        return
+    regressions = compare(result, json.loads(BASELINE.read_text(encoding="utf-8")), args.tolerance)
+    if regressions:
+        print("\nREGRESSIONS vs baseline:\n  " + "\n  ".join(regressions))
+        raise SystemExit(1)
+    print(f"\nwithin {int(args.tolerance * 100)}% of baseline")
+
+if __name__ == "__main__":
+    main()
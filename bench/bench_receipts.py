@@ -0,0 +1,67 @@
+"""
+Receipt worker throughput against stubbed storage (no AWS):
+
+    python bench/bench_receipts.py [--sizes 1,10,100,1000,10000] [--put-ms 20] [--dup 0.1] [--fail 0.01]
+
+Each batch holds SQS-shaped ReceiptGenerated messages, --dup of them repeating
+an earlier order_id; the stub store sleeps --put-ms per receipt and fails
+--fail of them. Reports messages/s for one worker thread (the old
+one-message-at-a-time shape) and for the RECEIPT_WORKERS pool.
+"""
+import argparse, contextlib, io, json, os, pathlib, random, sys, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from src.receipts import worker
+
+def make_batch(n: int, dup: float) -> list[dict]:
+    ids, records = [], []
+    for i in range(n):
+        oid = random.choice(ids) if ids and random.random() < dup else str(uuid.uuid4())
+        ids.append(oid)
+        event = {"source": "app.orders", "detail-type": "ReceiptGenerated",
+                 "detail": {"order_id": oid, "total": round(random.uniform(1, 500), 2)}}
+        records.append({"messageId": f"m{i}", "body": json.dumps(event)})
+    return records
+
+class StubStore:
+    def __init__(self, put_ms: float, fail: float):
+        self.put_s, self.fail = put_ms / 1000, fail
+        self.puts = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, order_id, text):
+        time.sleep(self.put_s)
+        with self.lock:
+            self.puts += 1
+        if random.random() < self.fail:
+            raise RuntimeError("stub put failed")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--sizes", default="1,10,100,1000,10000")
+    ap.add_argument("--put-ms", type=float, default=20.0)
+    ap.add_argument("--dup", type=float, default=0.1)
+    ap.add_argument("--fail", type=float, default=0.01)
+    ap.add_argument("--serial-max", type=int, default=1000, help="skip the 1-thread run above this batch size")
+    args = ap.parse_args()
+
+    print("batch | mode | msgs/s | secs | puts | failed_msgs")
+    for n in (int(s) for s in args.sizes.split(",")):
+        records = make_batch(n, args.dup)
+        for mode, workers in (("1 thread", 1), (f"{worker.WORKERS} threads", worker.WORKERS)):
+            if workers == 1 and n > args.serial_max:
+                continue
+            stub = StubStore(args.put_ms, args.fail)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                t0 = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):   # the worker's ERROR log line
+                    failed = worker.process_batch(records, store=stub, pool=pool)
+                secs = time.perf_counter() - t0
+            print(f"{n} | {mode} | {n / secs:.0f} | {secs:.3f} | {stub.puts} | {len(failed)}")
+
+if __name__ == "__main__":
+    main()
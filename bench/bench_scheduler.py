@@ -0,0 +1,120 @@
+"""
+Scheduler under throttling: a local fake Messages endpoint that allows at most
+--cap concurrent requests (429 + retry-after beyond that) and answers every
+--fail-every'th request with a 529, driven by a sweep of --prompts calls.
+
+    python bench/bench_scheduler.py [--prompts 40] [--workers 16] [--cap 4] [--latency 0.2]
+
+Runs the same sweep twice: the SDK's own retries (what the runners used to do)
+and the Scheduler (SDK retries off). Reports completed/failed calls, retries,
+throttles, wall time and the AIMD limit the scheduler settled on.
+"""
+import argparse, http.server, json, pathlib, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import anthropic, httpx
+import scheduler
+from scheduler import Scheduler, GiveUp
+from response_cache import create_message
+
+class FakeMessages(http.server.BaseHTTPRequestHandler):
+    cap, latency, fail_every, retry_after = 4, 0.2, 0, 1
+    lock = threading.Lock()
+    in_flight = served = throttled = 0
+
+    def log_message(self, *a):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict | None = None) -> None:
+        b = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(b)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(b)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        cls = type(self)
+        with cls.lock:
+            cls.served += 1
+            n = cls.served
+            over = cls.in_flight >= cls.cap
+            if over:
+                cls.throttled += 1
+            else:
+                cls.in_flight += 1
+        if over:
+            return self._send(429, {"type": "error", "error": {"type": "rate_limit_error", "message": "slow down"}},
+                              {"retry-after": str(cls.retry_after)})
+        try:
+            time.sleep(cls.latency)
+            if cls.fail_every and n % cls.fail_every == 0:
+                return self._send(529, {"type": "error", "error": {"type": "overloaded_error", "message": "busy"}})
+            self._send(200, {
+                "id": f"msg_{n}", "type": "message", "role": "assistant", "model": body["model"],
+                "content": [{"type": "text", "text": '{"ok": true}'}], "stop_reason": "end_turn",
+                "stop_sequence": None, "usage": {"input_tokens": 100, "output_tokens": 20},
+            }, {"request-id": f"req_{n}"})
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+def sweep(client, n: int, workers: int, sched: Scheduler | None) -> dict:
+    request = dict(model="claude-sonnet-4-5-20250929", max_tokens=64,
+                   messages=[{"role": "user", "content": "hi"}])
+    ok = failed = retries = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal ok, failed, retries
+        try:
+            if sched:
+                record = sched.call(lambda: create_message(client, **request), 200, f"p{i}")
+            else:
+                record = create_message(client, **request)
+            with lock:
+                ok += 1
+                retries += record.get("retries") or 0
+        except (GiveUp, anthropic.APIError):
+            with lock:
+                failed += 1
+
+    t0 = time.time()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(one, range(n)))
+    return {"ok": ok, "failed": failed, "retries": retries, "secs": round(time.time() - t0, 2)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--prompts", type=int, default=40)
+    ap.add_argument("--workers", type=int, default=16)
+    ap.add_argument("--cap", type=int, default=4, help="server-side concurrency before 429s")
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--fail-every", type=int, default=7, help="every Nth admitted request returns 529 (0 = never)")
+    args = ap.parse_args()
+
+    FakeMessages.cap, FakeMessages.latency, FakeMessages.fail_every = args.cap, args.latency, args.fail_every
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeMessages)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    scheduler.BACKOFF_BASE_S, scheduler.BACKOFF_MAX_S = 0.2, 2.0  # keep the bench short
+
+    print("mode | ok | failed | retries | server_429s | secs | final_limit")
+    for mode in ("sdk-retries", "scheduler"):
+        FakeMessages.served = FakeMessages.throttled = 0
+        sched = Scheduler(args.workers, rpm=0, tpm=0) if mode == "scheduler" else None
+        client = anthropic.Anthropic(api_key="x", base_url=base_url, http_client=httpx.Client(timeout=30),
+                                     max_retries=0 if sched else 2)
+        r = sweep(client, args.prompts, args.workers, sched)
+        limit = round(sched.limit.limit, 1) if sched else "-"
+        print(f"{mode} | {r['ok']} | {r['failed']} | {r['retries']} | {FakeMessages.throttled} | {r['secs']}s | {limit}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Local fake of the Anthropic Messages API that replays recorded outputs from runs/.
+
+Each request is matched to its prompt template (by a distinctive line of the
+template text) and answered with a recorded output of that prompt; judge calls
+get a verdict built from the recorded judge_prompts.json rankings. Latency,
+output token rate, prompt caching and errors are simulated:
+
+    python bench/fake_anthropic.py [--port 8765] [--ttft fixed:0.05] [--tps 400]
+                                   [--error-rate 0.05] [--retry-after 1]
+
+--ttft takes fixed:S, uniform:A,B or lognormal:MU,SIGMA (seconds). Both plain
+and streamed (SSE) /v1/messages are served; /stats reports call counts.
+"""
+import argparse, hashlib, http.server, json, pathlib, random, re, sys, threading, time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import artifact_store
+from context_pack import estimate_tokens
+from run_store import META_FILES
+
+def parse_dist(spec: str):
+    """fixed:S | uniform:A,B | lognormal:MU,SIGMA -> zero-arg sampler (seconds)."""
+    kind, _, params = spec.partition(":")
+    vals = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda: vals[0]
+    if kind == "uniform":
+        return lambda: random.uniform(vals[0], vals[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(vals[0], vals[1])
+    raise SystemExit(f"unknown latency distribution {spec!r} (fixed:S, uniform:A,B, lognormal:MU,SIGMA)")
+
+class Recordings:
+    """Recorded outputs by prompt stem, plus recorded judge scores, and template fingerprints to recognise requests."""
+
+    def __init__(self, runs_dir: pathlib.Path = ROOT / "runs"):
+        self.outputs: dict[str, list[pathlib.Path]] = {}
+        self.scores: dict[str, list[float]] = {}
+        for d in artifact_store.run_dirs(runs_dir):
+            for name in artifact_store.list_names(d):
+                f = d / name
+                if f.suffix in (".json", ".xml") and name not in META_FILES:
+                    self.outputs.setdefault(f.stem, []).append(f)
+            try:
+                for r in json.loads(artifact_store.read_text(d, "judge_prompts.json")).get("ranking", []):
+                    self.scores.setdefault(r["prompt"], []).append(float(r["score"]))
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        # longest placeholder-free line of each template identifies the prompt in a request
+        self.fingerprints = []
+        for t in sorted(ROOT.glob("agent_*_prompts/*.txt")):
+            lines = [l.strip() for l in t.read_text(encoding="utf-8").splitlines() if "{" not in l]
+            if lines:
+                self.fingerprints.append((max(lines, key=len), t.stem))
+        self.fingerprints.sort(key=lambda fp: -len(fp[0]))
+        self._text: dict[pathlib.Path, str] = {}
+
+    def stem_for(self, text: str) -> str | None:
+        return next((stem for line, stem in self.fingerprints if line and line in text), None)
+
+    def output(self, stem: str | None, key: str, xml: bool) -> str:
+        pool = self.outputs.get(stem or "") or [f for fs in self.outputs.values() for f in fs
+                                                if (f.suffix == ".xml") == xml]
+        f = pool[int(key[:8], 16) % len(pool)]
+        if f not in self._text:
+            self._text[f] = artifact_store.read_text(f.parent, f.name, errors="replace")
+        return self._text[f]
+
+    def score(self, stem: str) -> float:
+        s = self.scores.get(stem)
+        return round(sum(s) / len(s), 1) if s else 60 + int(hashlib.sha1(stem.encode()).hexdigest()[:4], 16) % 35
+
+class FakeAnthropic(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    rec: Recordings = None
+    ttft = staticmethod(lambda: 0.05)
+    tps = 400.0
+    error_rate = 0.0
+    retry_after = 1.0
+    lock = threading.Lock()
+    prefixes: set = set()
+    stats = {"calls": 0, "errors": 0, "streamed": 0, "output_tokens": 0}
+
+    def log_message(self, *a):
+        pass
+
+    def _json(self, status: int, body: dict, headers: dict | None = None) -> None:
+        b = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(b)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(b)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            return self._json(200, dict(self.stats))
+        self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def _usage(self, body: dict) -> dict:
+        """Input tokens split like the real API: prefix up to the last cache_control is written once, then read."""
+        blocks = [b for m in body.get("messages", []) for b in (m["content"] if isinstance(m["content"], list)
+                                                                 else [{"type": "text", "text": m["content"]}])]
+        cut = max((i for i, b in enumerate(blocks) if b.get("cache_control")), default=-1)
+        prefix = "".join(b.get("text", "") for b in blocks[:cut + 1])
+        rest = "".join(b.get("text", "") for b in blocks[cut + 1:]) + str(body.get("system", ""))
+        usage = {"input_tokens": estimate_tokens(rest), "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+        if prefix:
+            h = hashlib.sha256(prefix.encode()).hexdigest()
+            with self.lock:
+                seen = h in self.prefixes
+                self.prefixes.add(h)
+            usage["cache_read_input_tokens" if seen else "cache_creation_input_tokens"] = estimate_tokens(prefix)
+        return usage
+
+    def _answer(self, body: dict) -> str:
+        text = "\n".join(b.get("text", "") if isinstance(b, dict) else str(b)
+                          for m in body.get("messages", [])
+                          for b in (m["content"] if isinstance(m["content"], list) else [m["content"]]))
+        key = hashlib.sha256(text.encode()).hexdigest()
+        system = str(body.get("system", ""))
+        if "STRICT JSON" in system:  # judge
+            stems = re.findall(r"prompt: (\w+)", text)
+            if "PAIRWISE" in text and len(stems) >= 2:
+                a, b = stems[-2], stems[-1]
+                win = a if self.rec.score(a) >= self.rec.score(b) else b
+                return json.dumps({"winner": win, "reasons": "higher recorded score"})
+            stem = stems[-1] if stems else "unknown"
+            return json.dumps({"ranking": [{"prompt": stem, "score": self.rec.score(stem), "reasons": "replayed"}],
+                               "winner": stem, "notes": "fake"})
+        return self.rec.output(self.rec.stem_for(text), key, xml="XML" in system)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        with self.lock:
+            self.stats["calls"] += 1
+            n = self.stats["calls"]
+        if random.random() < self.error_rate:
+            with self.lock:
+                self.stats["errors"] += 1
+            status = random.choice((429, 529, 500))
+            kind = {429: "rate_limit_error", 529: "overloaded_error", 500: "api_error"}[status]
+            return self._json(status, {"type": "error", "error": {"type": kind, "message": "injected"}},
+                              {"retry-after": str(self.retry_after)} if status == 429 else None)
+        text = self._answer(body)
+        out_tokens = min(estimate_tokens(text), body.get("max_tokens", 4096))
+        if out_tokens < estimate_tokens(text):  # honour max_tokens like the real API
+            text, stop = text[:int(out_tokens * 3.5)], "max_tokens"
+        else:
+            stop = "end_turn"
+        usage = {**self._usage(body), "output_tokens": out_tokens}
+        with self.lock:
+            self.stats["output_tokens"] += out_tokens
+        msg = {"id": f"msg_fake_{n}", "type": "message", "role": "assistant", "model": body["model"],
+               "content": [{"type": "text", "text": text}], "stop_reason": stop, "stop_sequence": None, "usage": usage}
+        time.sleep(self.ttft())
+        if body.get("stream"):
+            with self.lock:
+                self.stats["streamed"] += 1
+            return self._stream(msg, text, usage)
+        time.sleep(out_tokens / self.tps)
+        self._json(200, msg, {"request-id": f"req_fake_{n}"})
+
+    def _stream(self, msg: dict, text: str, usage: dict) -> None:
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("request-id", msg["id"].replace("msg_", "req_"))
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+
+        def event(name: str, data: dict) -> None:
+            chunk = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+
+        try:
+            event("message_start", {"type": "message_start", "message": {**msg, "content": [], "stop_reason": None,
+                                                                      "usage": {**usage, "output_tokens": 1}}})
+            event("content_block_start", {"type": "content_block_start", "index": 0,
+                                          "content_block": {"type": "text", "text": ""}})
+            step = max(1, int(self.tps * 3.5 * 0.05))  # ~50 ms of tokens per delta
+            for i in range(0, len(text), step):
+                event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                              "delta": {"type": "text_delta", "text": text[i:i + step]}})
+                time.sleep(0.05 * min(1.0, (len(text) - i) / step))
+            event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            event("message_delta", {"type": "message_delta", "delta": {"stop_reason": msg["stop_reason"],
+                                                                      "stop_sequence": None},
+                                    "usage": {"output_tokens": usage["output_tokens"]}})
+            event("message_stop", {"type": "message_stop"})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client aborted the stream early (stream_check)
+
+def start(port: int = 0, ttft: str = "fixed:0.05", tps: float = 400.0, error_rate: float = 0.0,
+          retry_after: float = 1.0, runs_dir: pathlib.Path = ROOT / "runs") -> http.server.ThreadingHTTPServer:
+    """Start the fake on a background thread; returns the server (server_address[1] is the port)."""
+    FakeAnthropic.rec = Recordings(runs_dir)
+    FakeAnthropic.ttft = staticmethod(parse_dist(ttft))
+    FakeAnthropic.tps, FakeAnthropic.error_rate, FakeAnthropic.retry_after = tps, error_rate, retry_after
+    FakeAnthropic.prefixes = set()
+    FakeAnthropic.stats = {"calls": 0, "errors": 0, "streamed": 0, "output_tokens": 0}
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), FakeAnthropic)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Fake Anthropic Messages API replaying runs/")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--ttft", default="fixed:0.05", help="time to first token: fixed:S | uniform:A,B | lognormal:MU,SIGMA")
+    ap.add_argument("--tps", type=float, default=400.0, help="output tokens per second")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 429/529/500")
+    ap.add_argument("--retry-after", type=float, default=1.0)
+    args = ap.parse_args()
+    server = start(args.port, args.ttft, args.tps, args.error_rate, args.retry_after)
+    print(f"fake Anthropic API on http://127.0.0.1:{server.server_address[1]} "
+          f"({sum(len(v) for v in FakeAnthropic.rec.outputs.values())} recorded outputs)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,154 @@
+import ast, hashlib, math, re
+from collections import Counter
+from dataclasses import dataclass, field
+
+# Rough chars-per-token for code/config; good enough for budgeting, not billing
+CHARS_PER_TOKEN = 3.5
+
+# Keyword fields are repeated this many times in the BM25 document so that a
+# matching resource type / env var / handler name outranks an incidental mention
+KEYWORD_BOOST = 3
+
+BM25_K1 = 1.5
+BM25_B  = 0.75
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_]+")
+_STOP = {"the", "and", "for", "with", "from", "this", "that", "are", "not", "none", "true",
+         "false", "return", "import", "def", "self", "type", "string", "value", "var", "default"}
+
+_TF_BLOCK   = re.compile(r'^\s*(resource|data)\s+"([^"]+)"\s+"([^"]+)"', re.M)
+_TF_NAMED   = re.compile(r'^\s*(variable|output|module)\s+"([^"]+)"', re.M)
+_TF_HEADER  = re.compile(r'^\s*(resource|data|variable|output|module|provider|locals|terraform)\b[^\n]*', re.M)
+_PY_ENV     = re.compile(r'''os\.(?:getenv|environ\.get)\(\s*["']([A-Z0-9_]+)["']|os\.environ\[\s*["']([A-Z0-9_]+)["']\s*\]''')
+_PY_HANDLER = re.compile(r'^def\s+([A-Za-z_]\w*)\s*\(\s*event\s*,\s*context\s*\)', re.M)
+_PY_BOTO    = re.compile(r'''boto3\.(?:client|resource)\(\s*["']([a-z0-9-]+)["']''')
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+def terms(text: str) -> list[str]:
+    """Lower-cased identifier terms; snake_case names also contribute their parts."""
+    out = []
+    for w in _WORD.findall(text):
+        w = w.lower()
+        if w in _STOP:
+            continue
+        out.append(w)
+        if "_" in w:
+            out.extend(p for p in w.split("_") if len(p) > 1 and p not in _STOP)
+    return out
+
+def extract_keywords(rel: str, text: str) -> list[str]:
+    """Resource types, names, env vars, handler names and AWS services declared by a file."""
+    kw = []
+    if rel.endswith(".tf"):
+        for kind, rtype, rname in _TF_BLOCK.findall(text):
+            kw += [rtype, rname]
+        kw += [name for _, name in _TF_NAMED.findall(text)]
+    elif rel.endswith(".py"):
+        kw += [a or b for a, b in _PY_ENV.findall(text)]
+        kw += _PY_HANDLER.findall(text)
+        kw += _PY_BOTO.findall(text)
+    return kw
+
+def summarize(rel: str, text: str) -> str:
+    """Signature-only view of a file: block headers for Terraform, defs/classes/env vars for Python."""
+    if rel.endswith(".tf"):
+        return "\n".join(m.group(0).rstrip(" {") for m in _TF_HEADER.finditer(text))
+    if rel.endswith(".py"):
+        try:
+            tree = ast.parse(text)
+        except SyntaxError:
+            return "\n".join(l for l in text.splitlines() if l.startswith(("def ", "class ", "import ", "from ")))
+        lines = []
+        for node in tree.body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                lines.append(ast.unparse(node))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                lines.append(f"def {node.name}({ast.unparse(node.args)}): ...")
+            elif isinstance(node, ast.ClassDef):
+                lines.append(f"class {node.name}:")
+                lines += [f"    def {n.name}({ast.unparse(n.args)}): ..."
+                          for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+        env = sorted({a or b for a, b in _PY_ENV.findall(text)})
+        if env:
+            lines.append(f"# env: {', '.join(env)}")
+        return "\n".join(lines)
+    return text[:400]
+
+@dataclass(frozen=True)
+class FileEntry:
+    rel: str
+    text: str
+    sha256: str
+    tokens: int
+    keywords: tuple[str, ...]
+    summary: str
+    summary_tokens: int
+    tf: Counter = field(compare=False, hash=False)   # term frequencies for BM25
+    length: int = 0                                  # BM25 document length
+
+def make_entry(rel: str, text: str) -> FileEntry:
+    kw = extract_keywords(rel, text)
+    doc = terms(rel) + terms(text) + KEYWORD_BOOST * terms(" ".join(kw))
+    summary = summarize(rel, text)
+    return FileEntry(
+        rel=rel, text=text,
+        sha256=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        tokens=estimate_tokens(text),
+        keywords=tuple(dict.fromkeys(kw)),
+        summary=summary, summary_tokens=estimate_tokens(summary),
+        tf=Counter(doc), length=len(doc),
+    )
+
+class ContextIndex:
+    """
+    Index over a set of asset files, built once per process.
+    Holds per-file token estimates, content hashes and a BM25 index over
+    identifiers (boosted for resource types, env vars and handler names).
+    """
+
+    def __init__(self, entries: list[FileEntry]):
+        self.entries = sorted(entries, key=lambda e: e.rel)
+        self.df = Counter(t for e in self.entries for t in e.tf)
+        n = len(self.entries)
+        self.avg_len = (sum(e.length for e in self.entries) / n) if n else 0.0
+        self.idf = {t: math.log((n - df + 0.5) / (df + 0.5) + 1.0) for t, df in self.df.items()}
+
+    def score(self, query: str) -> dict[str, float]:
+        q = set(terms(query))
+        scores = {}
+        for e in self.entries:
+            s = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * e.length / (self.avg_len or 1))
+            for t in q:
+                f = e.tf.get(t)
+                if f:
+                    s += self.idf[t] * f * (BM25_K1 + 1) / (f + norm)
+            scores[e.rel] = s
+        return scores
+
+    def pack(self, query: str, budget_tokens: int) -> str:
+        """
+        Whole files, most relevant first, until budget_tokens is spent; a file
+        that does not fit is sent as its signature-only summary if that fits,
+        otherwise it is listed as omitted. Output keeps path order so the same
+        selection always renders to the same bytes (stable prompt-cache prefix).
+        """
+        scores = self.score(query)
+        ranked = sorted(self.entries, key=lambda e: (-scores[e.rel], e.rel))
+        left = budget_tokens
+        chosen, omitted = {}, []
+        for e in ranked:
+            if e.tokens <= left:
+                chosen[e.rel] = f"\n===== FILE: {e.rel} =====\n{e.text}\n"
+                left -= e.tokens
+            elif e.summary and e.summary_tokens <= left:
+                chosen[e.rel] = f"\n===== FILE: {e.rel} (signatures only) =====\n{e.summary}\n"
+                left -= e.summary_tokens
+            else:
+                omitted.append(e.rel)
+        blob = "".join(chosen[rel] for rel in sorted(chosen))
+        if omitted:
+            blob += "\n===== NOTE =====\n[OMITTED to fit token budget: " + ", ".join(sorted(omitted)) + "]\n"
+        return blob
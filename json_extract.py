@@ -0,0 +1,137 @@
+import json, re
+
+_DECODER = json.JSONDecoder()
+_FENCE = re.compile(r"\A```[A-Za-z0-9_+-]*[ \t]*\n")
+_PARTIAL_LITERAL = re.compile(r"(?:-?\d+\.?\d*(?:[eE][-+]?\d*)?|t(?:r(?:ue?)?)?|f(?:a(?:l(?:se?)?)?)?|n(?:u(?:ll?)?)?)$")
+_LITERAL_FIX = {"t": "true", "tr": "true", "tru": "true", "f": "false", "fa": "false", "fal": "false",
+                "fals": "false", "n": "null", "nu": "null", "nul": "null"}
+
+class JsonExtractError(ValueError):
+    """No JSON value could be recovered from the text."""
+
+def _strip_fence(s: str, repairs: list) -> str:
+    """
+    Remove a fence wrapping the whole response: opened on the first line and
+    closed (if at all) at the very end. A ``` anywhere else may sit inside a
+    JSON string (e.g. a README in the bundle) and is left alone; a fence after
+    leading prose is handled by decoding from the first bracket.
+    """
+    m = _FENCE.match(s)
+    if not m:
+        return s
+    if s.endswith("```") and len(s) - 3 >= m.end():
+        repairs.append("stripped code fence")
+        return s[m.end():-3]
+    repairs.append("stripped unterminated code fence")
+    return s[m.end():]
+
+def _scan(s: str, start: int):
+    """
+    One pass from `start`: returns (end, stack, in_string, safe) where end is the
+    index just past the balanced top-level value (or None if it never closes),
+    stack is the open-bracket stack at the end of the text, and safe is the last
+    (index, stack) at which the text could be cut and closed cleanly, i.e. just
+    before a ',' separating two complete members.
+    """
+    stack, in_str, esc = [], False, False
+    safe = None
+    for i in range(start, len(s)):
+        ch = s[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return i + 1, [], False, safe
+        elif ch == ",":
+            safe = (i, tuple(stack))
+    return None, stack, in_str, safe
+
+def _close(stack) -> str:
+    return "".join("}" if c == "{" else "]" for c in reversed(stack))
+
+def _complete_in_place(body: str, stack, in_str: bool, notes: list) -> str:
+    """Finish a truncated document where it stopped: close the string, fix a dangling token, close brackets."""
+    if in_str:
+        if body.endswith("\\"):
+            body = body[:-1]
+        body += '"'
+        notes.append("closed unterminated string")
+    body = body.rstrip()
+    m = _PARTIAL_LITERAL.search(body)
+    if m and m.group(0) in _LITERAL_FIX:
+        body = body[:m.start()] + _LITERAL_FIX[m.group(0)]
+    elif m and m.group(0)[-1:] in ".eE-+":
+        body = body.rstrip(".eE-+")
+    if body.endswith(","):
+        body = body[:-1]
+    elif body.endswith(":"):
+        body += " null"
+        notes.append("filled dangling key with null")
+    elif stack and stack[-1] == "{" and body.endswith('"'):
+        # {"a": 1, "b"  -> a key with no value yet
+        k = body.rfind('"', 0, len(body) - 1)
+        before = body[:k].rstrip()
+        if before.endswith((",", "{")):
+            body = before.rstrip(",")
+            notes.append("dropped dangling key")
+    return body + _close(stack)
+
+def extract_json(text: str):
+    """
+    Recover the first JSON object/array from model output in linear time.
+
+    Strips a wrapping code fence and leading prose, decodes with JSONDecoder.raw_decode
+    and drops trailing garbage; if the value never closes (truncated output) it
+    is repaired by closing open strings, arrays and objects, or failing that, by
+    cutting back to the last complete member. Returns (value, repairs) where
+    repairs lists what had to be changed (empty when the text was clean JSON).
+    """
+    repairs: list[str] = []
+    if not text or not text.strip():
+        raise JsonExtractError("empty response (no text)")
+    s = _strip_fence(text.strip(), repairs)
+    start = min((i for i in (s.find("{"), s.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise JsonExtractError("no JSON object or array found")
+    if s[:start].strip():
+        repairs.append(f"dropped {start} leading chars")
+
+    try:
+        value, end = _DECODER.raw_decode(s, start)
+        if s[end:].strip():
+            repairs.append(f"dropped {len(s) - end} trailing chars")
+        return value, repairs
+    except json.JSONDecodeError as e:
+        first_error = e
+
+    end, stack, in_str, safe = _scan(s, start)
+    if end is not None:
+        # balanced but invalid inside: nothing safe to repair automatically
+        raise JsonExtractError(f"invalid JSON: {first_error}")
+
+    notes: list[str] = []
+    attempts = [(_complete_in_place(s[start:], stack, in_str, notes), notes + [f"closed {len(stack)} open bracket(s)"])]
+    if safe:
+        cut, cut_stack = safe
+        attempts.append((s[start:cut] + _close(cut_stack),
+                         [f"cut back to last complete member at char {cut} and closed {len(cut_stack)} bracket(s)"]))
+    for candidate, used in attempts:
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        repairs.extend(used)
+        return value, repairs
+    raise JsonExtractError(f"truncated JSON could not be repaired: {first_error}")
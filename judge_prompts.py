@@ -1,220 +1,195 @@
-import os, json, pathlib, re
+import os, json, pathlib, time, argparse
 from datetime import datetime
 import httpx, certifi
 from anthropic import Anthropic
 from dotenv import load_dotenv
+from response_cache import add_cache_args, cache_from_args, cache_key, create_message
+from prompt_blocks import build_content, cache_usage, CACHE_CONTROL
+from templating import load_template
+from analyzer import auto_metrics
+from json_extract import extract_json, JsonExtractError
+from prompt_pool import run_pool, MAX_CONCURRENCY
+from tournament import as_score, top_k, pairings, merge_ranking
+from assets import RUNS_DIR, load_assets, run_snapshot_id, TF_TOKEN_BUDGET, PY_TOKEN_BUDGET
+from run_store import RunStore, META_FILES
+from telemetry import Telemetry
+from scheduler import Scheduler, GiveUp
+from context_pack import estimate_tokens
+import artifact_store
 
 ROOT = pathlib.Path(__file__).resolve().parent
-RUNS_DIR = ROOT / "runs"
-PROMPT_TMPL = (ROOT / "agent_e_prompts" / "JUDGE_prompt_quality.txt").read_text(encoding="utf-8")
-SCHEMA_PATH = ROOT / "final_schema.json"
-BRD_PATH    = ROOT / "resources" / "brd_summary.md"
-GUARD_PATH  = ROOT / "resources" / "guardrails.md"
-RULES_PATH  = ROOT / "resources" / "architecture_rules.xml"
-
-# NEW: generic Terraform templates (patterns agent outputs) and translated Python (code build agent)
-TF_ROOT   = ROOT / "infra" / "patterns" / "templates"
-PY_ROOT   = ROOT / "src"
+PROMPT_TMPL = load_template(ROOT / "agent_e_prompts" / "JUDGE_prompt_quality.txt")
 
 load_dotenv()
 
-# --- optional reads (gracefully skip if missing) ---
-def safe_read(p: pathlib.Path, encoding="utf-8") -> str:
-    try:
-        return p.read_text(encoding=encoding)
-    except Exception:
-        return ""
-
-SCHEMA = safe_read(SCHEMA_PATH)
-BRD    = safe_read(BRD_PATH)
-GUARD  = safe_read(GUARD_PATH)
-RULES  = safe_read(RULES_PATH)
-
-# --- gather code assets ---
-def gather_files_text(root: pathlib.Path, globs: list[str], max_bytes: int | None = None) -> str:
-    """
-    Concatenate files matched by globs into a single string with file headers.
-    If max_bytes is set, truncate the total aggregate to this size with a clear notice.
-    """
-    if not root.exists():
-        return ""
-    parts = []
-    for pattern in globs:
-        for f in sorted(root.rglob(pattern)):
-            try:
-                txt = f.read_text(encoding="utf-8")
-            except Exception:
-                continue
-            parts.append(f"\n===== FILE: {f.relative_to(ROOT)} =====\n{txt}\n")
-    blob = "".join(parts)
-    if max_bytes is not None and len(blob.encode("utf-8")) > max_bytes:
-        # truncate on a UTF-8 boundary
-        truncated = blob.encode("utf-8")[:max_bytes]
-        try:
-            blob = truncated.decode("utf-8")
-        except UnicodeDecodeError:
-            blob = truncated.decode("utf-8", errors="ignore")
-        blob += "\n\n===== NOTE =====\n[TRUNCATED to fit token/size budget]\n"
-    return blob
-
-# Tune these budgets as needed (roughly a couple thousand tokens each)
-MAX_TF_BYTES = 350_000
-MAX_PY_BYTES = 350_000
-
-TF_TEMPLATES = gather_files_text(TF_ROOT, ["*.tf"], max_bytes=MAX_TF_BYTES)
-PY_SOURCES   = gather_files_text(PY_ROOT, ["*.py"], max_bytes=MAX_PY_BYTES)
-
-# pick latest run folder
-latest = sorted((d for d in RUNS_DIR.iterdir() if d.is_dir()), reverse=True)[0]
-xml_files = sorted([p for p in latest.glob("*.json")])
+parser = argparse.ArgumentParser(description="Judge the candidates in a runs/<STAMP>/ folder (scored in parallel, top-k tie-break)")
+add_cache_args(parser)
+pick = parser.add_mutually_exclusive_group()
+pick.add_argument("--run", default="latest",
+                  help="run to judge: a stamp, 'latest' or 'latest:<agent_family>' (default: latest)")
+pick.add_argument("--tag", help="judge the run carrying this tag (see run_store.py tag)")
+args = parser.parse_args()
+CACHE = cache_from_args(args)
+
+# --- shared asset snapshot (same memoized blobs the runner used) ---
+ASSETS = load_assets()
+SCHEMA = ASSETS.SCHEMA
+BRD    = ASSETS.BRD
+GUARD  = ASSETS.GUARD
+RULES  = ASSETS.RULES
+
+# resolve the run folder through the index (falls back to the newest folder on disk)
+STORE = RunStore()
+latest = RUNS_DIR / STORE.resolve(args.tag or args.run, RUNS_DIR)
+# candidates come from this run's manifest / loose files only (packed runs read transparently)
+xml_files = [latest / n for n in artifact_store.list_names(latest) if n.endswith(".json") and n not in META_FILES]
+TELEMETRY = Telemetry(latest, "judge")
 
 if not xml_files:
     raise SystemExit(f"No XML candidates found in {latest}")
 
-# quick auto metrics (hint features for the judge)
-REQ_TAGS = {"Context","Decisions","Patterns","NonFunctionals","Services","Constraints","CloudMapping","Risks"}
-def auto_metrics(xml_text: str):
-    m = {}
-    # shallow tag presence
-    def has(tag): return bool(re.search(fr"<{tag}\b", xml_text))
-    present = [t for t in REQ_TAGS if has(t)]
-    m["required_tags_present"] = len(present)
-    m["missing_tags"] = sorted(list(REQ_TAGS - set(present)))
-
-    # CloudMapping coverage
-    cmap = {}
-    for sec in ["Compute","Networking","Data","Messaging","Identity"]:
-        cmap[sec] = bool(re.search(fr"<{sec}\b[^>]*>.*?</{sec}>", xml_text, flags=re.S|re.I))
-    m["cloudmapping_coverage_count"] = sum(1 for v in cmap.values() if v)
-    m["cloudmapping_sections"] = cmap
-
-    # Numeric NFRs present?
-    m["nfr_p95_ms_present"] = bool(re.search(r'p95_ms="?\d+', xml_text))
-    m["nfr_rps_present"] = bool(re.search(r'Throughput[^>]*rps="?\d+', xml_text))
-    m["availability_target_present"] = bool(re.search(r'Availability[^>]*target="?\d', xml_text))
-
-    # Vendor specificity hint (helps IaC)
-    vendor_terms = ["Lambda","API Gateway","S3","DynamoDB","Aurora","EKS","KMS",
-                    "Cloud Run","GKE","Pub/Sub","Cloud SQL","Secret Manager",
-                    "Azure Functions","AKS","Event Grid","Service Bus","Key Vault","Cosmos"]
-    m["vendor_specific_hits"] = sum(1 for t in vendor_terms if re.search(fr"\b{re.escape(t)}\b", xml_text))
-    m["bytes"] = len(xml_text)
-    return m
-
-# ------- build candidate blocks with size caps to avoid context overflow -------
-MAX_XML_CHARS = int(os.environ.get("JUDGE_MAX_XML_CHARS", "20000"))  # 20k per candidate
-blocks = []
-for f in xml_files:
-    xml = f.read_text(encoding="utf-8")
-    if len(xml) > MAX_XML_CHARS:
-        xml = xml[:MAX_XML_CHARS] + "\n<!-- TRUNCATED FOR JUDGE -->"
-    stem = f.stem
-    # simple auto metrics (same as you had)
-    def auto_metrics(x: str):
-        REQ_TAGS = {"Context","Decisions","Patterns","NonFunctionals","Services","Constraints","CloudMapping","Risks"}
-        m = {}
-        def has(tag): return bool(re.search(fr"<{tag}\b", x))
-        present = [t for t in REQ_TAGS if has(t)]
-        m["required_tags_present"] = len(present)
-        m["missing_tags"] = sorted(list(REQ_TAGS - set(present)))
-        sec_ok = {}
-        for sec in ["Compute","Networking","Data","Messaging","Identity"]:
-            sec_ok[sec] = bool(re.search(fr"<{sec}\b[^>]*>.*?</{sec}>", x, flags=re.S|re.I))
-        m["cloudmapping_coverage_count"] = sum(1 for v in sec_ok.values())
-        m["cloudmapping_sections"] = sec_ok
-        m["nfr_p95_ms_present"] = bool(re.search(r'p95_ms="?\d+', x))
-        m["nfr_rps_present"] = bool(re.search(r'Throughput[^>]*rps="?\d+', x))
-        m["availability_target_present"] = bool(re.search(r'Availability[^>]*target="?\d', x))
-        vendor_terms = ["Lambda","API Gateway","S3","DynamoDB","Aurora","EKS","KMS",
-                        "Cloud Run","GKE","Pub/Sub","Cloud SQL","Secret Manager",
-                        "Azure Functions","AKS","Event Grid","Service Bus","Key Vault","Cosmos"]
-        m["vendor_specific_hits"] = sum(1 for t in vendor_terms if re.search(fr"\b{re.escape(t)}\b", x))
-        m["bytes"] = len(x)
-        return m
-
+# ------- one full (untruncated) block per candidate -------
+def candidate_block(f: pathlib.Path) -> str:
+    xml = artifact_store.read_text(f.parent, f.name)
+    # quick auto metrics (hint features for the judge)
     auto = json.dumps(auto_metrics(xml), ensure_ascii=False)
-    blocks.append(f"---BEGIN---\nprompt: {stem}\nauto_metrics_json: {auto}\nxml:\n{xml}\n---END---")
-
-filled = (
-    PROMPT_TMPL
-         .replace("{RULES_TEXT}", RULES or "")
-         .replace("{SCHEMA}", SCHEMA or "")
-         .replace("{GUARDRAILS_TEXT}", GUARD or "")
-         .replace("{BRD_TEXT}", BRD or "")
-         .replace("{TF_TEMPLATES}", TF_TEMPLATES or "")
-         .replace("{PY_SOURCES}", PY_SOURCES or "")
-    + "\n" + "\n".join(blocks)
-)
+    return f"---BEGIN---\nprompt: {f.stem}\nauto_metrics_json: {auto}\nxml:\n{xml}\n---END---"
+
+CANDIDATES = {f.stem: candidate_block(f) for f in xml_files}
+
+# shared assets first, then the rubric; all three tiers are cached so every
+# per-candidate and pairwise call after the first reads the prefix from cache
+JUDGE_QUERY = PROMPT_TMPL.source + "\n" + BRD
+PREFIX = build_content(PROMPT_TMPL, {
+    "RULES_TEXT": RULES,
+    "SCHEMA": SCHEMA,
+    "GUARDRAILS_TEXT": GUARD,
+    "BRD_TEXT": BRD,
+    "TF_TEMPLATES": ASSETS.tf_index.pack(JUDGE_QUERY, TF_TOKEN_BUDGET),
+    "PY_SOURCES": ASSETS.py_index.pack(JUDGE_QUERY, PY_TOKEN_BUDGET),
+})
+PREFIX[-1]["cache_control"] = CACHE_CONTROL
+
+PAIRWISE_INSTRUCTIONS = """PAIRWISE TIE-BREAK
+Ignore the OUTPUT format above for this request. Compare the two candidates below
+against the scoring criteria and decide which bundle is better overall.
+Return STRICT JSON only: {"winner": "<prompt_stem>", "reasons": "<one-line>"}"""
 
 # ------- call Claude with sane TLS and a deterministic judge model -------
-client = Anthropic(
-    api_key=os.environ["ANTHROPIC_API_KEY"],
-    http_client=httpx.Client(timeout=60, verify=certifi.where()),
-)
 JUDGE_MODEL = os.environ.get("ANTHROPIC_JUDGE_MODEL", "claude-sonnet-4-5-20250929")
+JUDGE_SYSTEM = "Return STRICT JSON only. No Markdown, no commentary."
+JUDGE_MAX_TOKENS = 5000
+JUDGE_TIMEOUT = float(os.environ.get("JUDGE_TIMEOUT", "260"))
+JUDGE_TOP_K = int(os.environ.get("JUDGE_TOP_K", "4"))
+
+api_key = os.environ.get("ANTHROPIC_API_KEY")
+if not api_key and CACHE.mode != "replay":
+    raise SystemExit("Please set ANTHROPIC_API_KEY in your environment.")
+# retries/backoff live in the scheduler (rate limits, retry-after, AIMD), not the SDK
+client = Anthropic(
+    api_key=api_key,
+    http_client=httpx.Client(timeout=JUDGE_TIMEOUT, verify=certifi.where()),
+    max_retries=0,
+) if api_key else None
+SCHEDULER = Scheduler(MAX_CONCURRENCY)
+
+RAW_RESPONSES = {}
 
-resp = client.messages.create(
-    model=JUDGE_MODEL,
-    max_tokens=5000,
-    temperature=0,
-    system="Return STRICT JSON only. No Markdown, no commentary.",
-    messages=[{"role": "user", "content": [{"type": "text", "text": filled}]}],
-)
-
-# ------- robust text & JSON extraction -------
-def extract_text(r):
-    parts = []
+def coerce_json(s: str, label: str):
+    # linear-time: fence/prose stripping, raw_decode, and repair of truncated output
+    try:
+        value, repairs = extract_json(s)
+    except JsonExtractError as e:
+        raise ValueError(f"Judge did not return valid JSON for {label} ({e}). See raw_judge_response.txt")
+    if repairs:
+        print(f"{label}: judge JSON repaired: {'; '.join(repairs)}")
+    return value
+
+def ask_judge(label: str, tail: list[dict]) -> tuple[dict | None, str]:
+    """One cached judge call: shared prefix + `tail` blocks. Returns (parsed JSON or None, table row)."""
+    content = PREFIX + tail
+    send = lambda: create_message(
+        client,
+        model=JUDGE_MODEL,
+        max_tokens=JUDGE_MAX_TOKENS,
+        temperature=0,
+        system=JUDGE_SYSTEM,
+        messages=[{"role": "user", "content": content}],
+    )
+    est_tokens = estimate_tokens("".join(b["text"] for b in content)) + JUDGE_MAX_TOKENS
+    t0 = time.time()
     try:
-        for b in getattr(r, "content", []) or []:
-            if getattr(b, "type", "") == "text" and hasattr(b, "text"):
-                parts.append(b.text)
-    except Exception:
-        pass
-    return "".join(parts).strip()
-
-raw_text = extract_text(resp)
-
-# Save the raw response for debugging
-latest = latest  # reuse your variable
-(latest / "raw_judge_response.txt").write_text(raw_text or str(resp), encoding="utf-8")
-
-def coerce_json(s: str):
-    if not s:
-        raise ValueError("Empty judge response (no text). Check raw_judge_response.txt")
-    s = s.strip()
-    # 1) direct parse
+        with TELEMETRY.span(label, JUDGE_MODEL) as span:
+            record, cache_status = CACHE.fetch(
+                cache_key(JUDGE_MODEL, JUDGE_SYSTEM, content, JUDGE_MAX_TOKENS, 0),
+                lambda: SCHEDULER.call(send, est_tokens, label),
+            )
+            span.record(record, cache_status)
+    except GiveUp as e:
+        RAW_RESPONSES[label] = str(e)
+        return None, f"{label} | - | - | - | {round(time.time() - t0, 2)}s | FAILED: {e}"
+    elapsed = round(time.time() - t0, 2)
+    raw_text = record["text"].strip()
+    RAW_RESPONSES[label] = raw_text or json.dumps(record)
+    cache_write, cache_read = cache_usage(record.get("usage"))
     try:
-        return json.loads(s)
-    except Exception:
-        pass
-    # 2) strip code fences if any
-    m = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", s, flags=re.S)
-    if m:
-        try:
-            return json.loads(m.group(1))
-        except Exception:
-            pass
-    # 3) greedy JSON object extraction (first balanced-ish {...})
-    m = re.search(r"\{.*\}", s, flags=re.S)
-    if m:
-        candidate = m.group(0)
-        # attempt to trim trailing garbage after last closing brace
-        # find the last closing brace index that yields valid JSON
-        for i in range(len(candidate), 0, -1):
-            try:
-                return json.loads(candidate[:i])
-            except Exception:
-                continue
-    raise ValueError("Judge did not return valid JSON. See raw_judge_response.txt")
-
-result = coerce_json(raw_text)
+        parsed, note = coerce_json(raw_text, label), "OK"
+    except ValueError as e:
+        parsed, note = None, str(e)
+    return parsed, f"{label} | {cache_status} | {cache_write} | {cache_read} | {elapsed}s | {note}"
+
+def score_candidate(stem: str) -> dict:
+    parsed, row = ask_judge(stem, [{"type": "text", "text": CANDIDATES[stem]}])
+    entry = next((r for r in (parsed or {}).get("ranking", []) if r.get("prompt") == stem), None)
+    if entry is None and parsed and parsed.get("ranking"):
+        entry = parsed["ranking"][0]
+    print(row)
+    if entry is None:
+        return {"prompt": stem, "score": 0, "reasons": "no usable judge verdict; see raw_judge_response.txt"}
+    return {"prompt": stem, "score": as_score(entry.get("score")), "reasons": entry.get("reasons", "")}
+
+def play_match(pair: tuple[str, str]) -> dict:
+    a, b = pair
+    parsed, row = ask_judge(f"{a} vs {b}", [
+        {"type": "text", "text": PAIRWISE_INSTRUCTIONS},
+        {"type": "text", "text": CANDIDATES[a] + "\n" + CANDIDATES[b]},
+    ])
+    print(row)
+    parsed = parsed or {}
+    return {"a": a, "b": b, "winner": parsed.get("winner"), "reasons": parsed.get("reasons", "")}
+
+print(f"Judging {len(CANDIDATES)} candidates in {latest.name} (max {MAX_CONCURRENCY} in flight, cache={CACHE.mode})\n")
+print("call | cache | cache_write_tok | cache_read_tok | secs | note")
+
+t_start = time.time()
+try:
+    scores = [s for _, s in run_pool(sorted(CANDIDATES), score_candidate)]
+    finalists = top_k(scores, JUDGE_TOP_K)
+    matches = [m for _, m in run_pool(pairings(finalists), play_match)] if len(finalists) > 1 else []
+finally:
+    TELEMETRY.finish()
+result = merge_ranking(scores, matches, JUDGE_TOP_K)
+print(f"\njudging: {len(scores)} scored + {len(matches)} pairwise in {round(time.time() - t_start, 2)}s")
+
+# Save the raw responses for debugging
+(latest / "raw_judge_response.txt").write_text(
+    "\n\n".join(f"===== {label} =====\n{text}" for label, text in sorted(RAW_RESPONSES.items())),
+    encoding="utf-8")
+
+# tie the verdict to the exact inputs: what the candidates saw vs. what the judge saw
+candidates_snapshot = run_snapshot_id(latest)
+result["assets_snapshot"] = {"candidates": candidates_snapshot, "judge": ASSETS.snapshot_id}
+if candidates_snapshot and candidates_snapshot != ASSETS.snapshot_id:
+    print(f"warning: assets changed since this run (run={candidates_snapshot}, judge={ASSETS.snapshot_id})")
 
 # ------- write result and print ranking -------
 out = latest / "judge_prompts.json"
 out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+STORE.record_judgement(latest.relative_to(RUNS_DIR).as_posix(), result, JUDGE_MODEL)
 
 print("Best prompt:", result.get("winner"))
 print("\nRanking:")
 for r in result.get("ranking", []):
     print(f"- {r['prompt']}: {r['score']}  — {r['reasons']}")
-print(f"\nSaved: {out}")
\ No newline at end of file
+print(f"\nSaved: {out}")
+artifact_store.autopack(latest)
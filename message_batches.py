@@ -0,0 +1,213 @@
+"""
+Message Batches for offline sweeps (the installed SDK has no batches resource,
+so this talks to /v1/messages/batches directly over httpx).
+
+The runner writes runs/<STAMP>/batch.json as soon as a batch is created, so a
+restarted `--batch --resume STAMP` polls the same batch instead of paying for
+a second one. For offline testing, run the local stand-in and point the
+runner at it:
+
+    python message_batches.py serve --port 8790 [--delay 20] [--upstream http://127.0.0.1:8765]
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8790 python habeeba_run.py --batch
+"""
+import os, re, json, hashlib, pathlib, random, threading, time, argparse, http.server
+import httpx
+import artifact_store
+
+API_URL = os.environ.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com").rstrip("/")
+API_VERSION = "2023-06-01"
+BATCH_POLL_MIN_S = float(os.environ.get("BATCH_POLL_MIN_S", "10"))
+BATCH_POLL_MAX_S = float(os.environ.get("BATCH_POLL_MAX_S", "300"))
+
+STATE_NAME = "batch.json"
+_CUSTOM_ID_OK = re.compile(r"[^A-Za-z0-9_-]")
+
+def custom_id(stem: str, model: str, temperature: float, matrix: bool) -> str:
+    """
+    Result key (and output file stem) of one prompt x model x temperature cell:
+    the bare prompt stem for a single-cell sweep, else stem__model__tN (custom_id
+    allows only [A-Za-z0-9_-], max 64 chars).
+    """
+    if not matrix:
+        return stem
+    cid = _CUSTOM_ID_OK.sub("-", f"{stem}__{model}__t{temperature}".replace(".", "p"))
+    if len(cid) > 64:
+        cid = cid[:55] + "_" + hashlib.sha1(cid.encode()).hexdigest()[:8]
+    return cid
+
+def record_from_result(result: dict, batch_id: str) -> tuple[dict | None, str | None]:
+    """(record shaped like response_cache.record_from_message, None) or (None, error) for one results line."""
+    r = result.get("result") or {}
+    if r.get("type") != "succeeded":
+        err = (r.get("error") or {}).get("error") or r.get("error") or {}
+        return None, f"{r.get('type', 'unknown')}: {err.get('type', '')} {err.get('message', '')}".strip()
+    msg = r["message"]
+    return {
+        "text": "".join(b.get("text", "") for b in msg.get("content") or [] if b.get("type") == "text"),
+        "stop_reason": msg.get("stop_reason"),
+        "model": msg.get("model"),
+        "usage": msg.get("usage") or {},
+        "request_id": msg.get("id"),
+        "batch_id": batch_id,
+    }, None
+
+def load_state(out_dir: pathlib.Path) -> dict | None:
+    try:
+        return json.loads(artifact_store.read_text(out_dir, STATE_NAME))
+    except (OSError, ValueError):
+        return None
+
+def save_state(out_dir: pathlib.Path, state: dict) -> None:
+    tmp = out_dir / f"{STATE_NAME}.tmp"
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    os.replace(tmp, out_dir / STATE_NAME)
+
+class BatchClient:
+    """create / get / cancel / results for /v1/messages/batches, plus wait() with polling backoff."""
+
+    def __init__(self, api_key: str, base_url: str = API_URL, http_client: httpx.Client | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.http = http_client or httpx.Client(timeout=120.0)
+        self.headers = {"x-api-key": api_key, "anthropic-version": API_VERSION}
+
+    def _request(self, method: str, path: str, **kw) -> dict:
+        r = self.http.request(method, self.base_url + path, headers=self.headers, **kw)
+        r.raise_for_status()
+        return r.json()
+
+    def create(self, requests: list[dict]) -> dict:
+        return self._request("POST", "/v1/messages/batches", json={"requests": requests})
+
+    def get(self, batch_id: str) -> dict:
+        return self._request("GET", f"/v1/messages/batches/{batch_id}")
+
+    def cancel(self, batch_id: str) -> dict:
+        return self._request("POST", f"/v1/messages/batches/{batch_id}/cancel")
+
+    def wait(self, batch_id: str, on_poll=None) -> dict:
+        """
+        Poll until processing_status is 'ended'. The interval starts at
+        BATCH_POLL_MIN_S and grows 1.5x (jittered) up to BATCH_POLL_MAX_S;
+        transient HTTP errors while polling are retried, not fatal.
+        """
+        delay = BATCH_POLL_MIN_S
+        while True:
+            try:
+                batch = self.get(batch_id)
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500 \
+                        and e.response.status_code != 429:
+                    raise
+                batch = None
+            if batch is not None:
+                if on_poll:
+                    on_poll(batch)
+                if batch.get("processing_status") == "ended":
+                    return batch
+            time.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(BATCH_POLL_MAX_S, delay * 1.5)
+
+    def results(self, batch: dict):
+        """Yield each results line as it streams in (the JSONL file can be large)."""
+        url = batch.get("results_url") or f"{self.base_url}/v1/messages/batches/{batch['id']}/results"
+        with self.http.stream("GET", url, headers=self.headers) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+# --- local stand-in for the batch endpoints (offline testing) ---
+class _LocalBatches(http.server.BaseHTTPRequestHandler):
+    delay = 20.0
+    upstream = ""
+    error_every = 0
+    batches: dict = {}
+    lock = threading.Lock()
+
+    def log_message(self, *a):
+        pass
+
+    def _send(self, status: int, body, content_type: str = "application/json") -> None:
+        b = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(b)))
+        self.end_headers()
+        self.wfile.write(b)
+
+    def _answer(self, i: int, req: dict) -> dict:
+        if self.error_every and (i + 1) % self.error_every == 0:
+            return {"type": "errored", "error": {"type": "error", "error": {"type": "overloaded_error", "message": "injected"}}}
+        params = req["params"]
+        if self.upstream:
+            r = httpx.post(self.upstream.rstrip("/") + "/v1/messages", json=params,
+                           headers={"x-api-key": "local", "anthropic-version": API_VERSION}, timeout=300)
+            if r.status_code != 200:
+                return {"type": "errored", "error": r.json()}
+            return {"type": "succeeded", "message": r.json()}
+        text = json.dumps({"custom_id": req["custom_id"], "stub": True})
+        return {"type": "succeeded", "message": {
+            "id": f"msg_local_{i}", "type": "message", "role": "assistant", "model": params["model"],
+            "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": len(json.dumps(params)) // 4, "output_tokens": len(text) // 4},
+        }}
+
+    def _view(self, b: dict) -> dict:
+        n = len(b["requests"])
+        if b["status"] == "in_progress" and time.time() >= b["created"] + self.delay:
+            b["results"] = [(r["custom_id"], self._answer(i, r)) for i, r in enumerate(b["requests"])]
+            b["status"] = "ended"
+        done = b["status"] == "ended"
+        counts = {"processing": 0 if done else n, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        for _, res in b.get("results", []):
+            counts[res["type"]] += 1
+        host = self.headers.get("host")
+        return {"id": b["id"], "type": "message_batch", "processing_status": b["status"],
+                "request_counts": counts, "created_at": b["created"],
+                "results_url": f"http://{host}/v1/messages/batches/{b['id']}/results" if done else None}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("content-length") or 0)) or b"{}")
+        parts = self.path.strip("/").split("/")
+        with self.lock:
+            if parts == ["v1", "messages", "batches"]:
+                bid = f"msgbatch_local_{len(self.batches) + 1:04d}"
+                self.batches[bid] = {"id": bid, "requests": body["requests"], "created": time.time(), "status": "in_progress"}
+                return self._send(200, self._view(self.batches[bid]))
+            if len(parts) == 5 and parts[4] == "cancel" and parts[3] in self.batches:
+                b = self.batches[parts[3]]
+                if b["status"] == "in_progress":
+                    b["status"] = "ended"
+                    b["results"] = [(r["custom_id"], {"type": "canceled"}) for r in b["requests"]]
+                return self._send(200, self._view(b))
+        self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        with self.lock:
+            b = self.batches.get(parts[3]) if len(parts) >= 4 else None
+            if b is None:
+                return self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            view = self._view(b)
+            if len(parts) == 4:
+                return self._send(200, view)
+            if b["status"] != "ended":
+                return self._send(400, {"type": "error", "error": {"type": "invalid_request_error", "message": "batch still processing"}})
+            lines = "".join(json.dumps({"custom_id": cid, "result": res}) + "\n" for cid, res in b["results"])
+            self._send(200, lines.encode(), "application/binary")
+
+def serve(port: int, delay: float, upstream: str = "", error_every: int = 0) -> None:
+    _LocalBatches.delay, _LocalBatches.upstream, _LocalBatches.error_every = delay, upstream, error_every
+    print(f"local Message Batches stand-in on http://127.0.0.1:{port} (batches end after {delay}s)")
+    http.server.ThreadingHTTPServer(("127.0.0.1", port), _LocalBatches).serve_forever()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Message Batches helpers")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sp = sub.add_parser("serve", help="run a local stand-in for the batch endpoints")
+    sp.add_argument("--port", type=int, default=8790)
+    sp.add_argument("--delay", type=float, default=20.0, help="seconds before a batch ends")
+    sp.add_argument("--upstream", default="", help="answer each request via <upstream>/v1/messages instead of a canned reply")
+    sp.add_argument("--error-every", type=int, default=0, help="make every Nth request of a batch error")
+    args = ap.parse_args()
+    serve(args.port, args.delay, args.upstream, args.error_every)
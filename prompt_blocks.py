@@ -0,0 +1,45 @@
+from templating import Template
+
+# Shared assets in the order they are sent. Docs change rarely, code a bit more
+# often, so each tier ends with its own cache breakpoint: a code-only change
+# still reuses the cached doc prefix.
+DOC_ASSETS  = ["RULES_TEXT", "SCHEMA", "GUARDRAILS_TEXT", "BRD_TEXT"]
+CODE_ASSETS = ["TF_TEMPLATES", "PY_SOURCES"]
+ASSET_ORDER = DOC_ASSETS + CODE_ASSETS
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+def referenced_assets(template: Template) -> list[str]:
+    """Asset placeholders used by a template, in ASSET_ORDER (not template order)."""
+    return [k for k in ASSET_ORDER if k in template.placeholders]
+
+def build_content(template: Template | str, assets: dict) -> list[dict]:
+    """
+    Split a prompt into a stable prefix of asset blocks followed by the
+    per-prompt instructions.
+
+    Every asset the template references becomes its own text block wrapped in
+    <KEY>...</KEY>, emitted in ASSET_ORDER; the last block of each tier carries
+    cache_control so identical prefixes are read from the prompt cache on every
+    call after the first. Inside the instructions each {KEY} is replaced by a
+    short pointer to its block. Unknown or unfilled placeholders raise TemplateError.
+    """
+    if isinstance(template, str):
+        template = Template(template)
+    template.check(ASSET_ORDER)
+    keys = [k for k in referenced_assets(template) if assets.get(k)]
+    blocks = [{"type": "text", "text": f"<{k}>\n{assets[k]}\n</{k}>"} for k in keys]
+    for tier in (DOC_ASSETS, CODE_ASSETS):
+        last = max((i for i, k in enumerate(keys) if k in tier), default=None)
+        if last is not None:
+            blocks[last]["cache_control"] = CACHE_CONTROL
+
+    pointers = {k: (f"[see <{k}> above]" if k in keys else "") for k in ASSET_ORDER if k in assets}
+    blocks.append({"type": "text", "text": template.render(pointers)})
+    return blocks
+
+def cache_usage(usage: dict | None) -> tuple[int, int]:
+    """(cache_creation_input_tokens, cache_read_input_tokens) from a usage dict."""
+    usage = usage or {}
+    return (usage.get("cache_creation_input_tokens") or 0,
+            usage.get("cache_read_input_tokens") or 0)
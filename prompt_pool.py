@@ -0,0 +1,26 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# How many prompts may be in flight at once (override with MAX_CONCURRENCY=N)
+MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENCY", "10"))
+
+def run_pool(items, fn, max_workers: int | None = None):
+    """
+    Run fn(item) for every item on a bounded thread pool.
+    Yields (item, result) in completion order, so callers can write/print
+    each result as soon as its call finishes. The first exception raised by
+    fn cancels anything not yet started and is re-raised here.
+    """
+    items = list(items)
+    if not items:
+        return
+    workers = max(1, min(max_workers or MAX_CONCURRENCY, len(items)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prompt")
+    try:
+        futures = {pool.submit(fn, it): it for it in items}
+        for fut in as_completed(futures):
+            yield futures[fut], fut.result()
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
@@ -0,0 +1,136 @@
+import os, json, hashlib, pathlib, threading, time
+
+ROOT = pathlib.Path(__file__).resolve().parent
+
+# On-disk cache of model responses (override with LLM_CACHE_DIR / LLM_CACHE_MAX_MB)
+CACHE_DIR = pathlib.Path(os.environ.get("LLM_CACHE_DIR", ROOT / ".llm_cache"))
+MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+MODES = ("read", "write", "off", "replay")
+
+class CacheMiss(RuntimeError):
+    """Raised in replay mode when a request has no cached response."""
+
+def cache_key(model: str, system: str, content, max_tokens: int, temperature) -> str:
+    """
+    Content address of one request: sha256 over everything that changes the answer.
+    `content` is the fully filled user content (string or list of content blocks).
+    """
+    payload = json.dumps([model, system, content, max_tokens, temperature],
+                         sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def record_from_message(msg) -> dict:
+    """Keep the parts of an Anthropic Message the runners actually use."""
+    usage = getattr(msg, "usage", None)
+    return {
+        "text": "".join(getattr(b, "text", "") for b in (msg.content or [])
+                        if getattr(b, "type", "") == "text"),
+        "stop_reason": getattr(msg, "stop_reason", None),
+        "model": getattr(msg, "model", None),
+        "usage": usage.model_dump() if hasattr(usage, "model_dump") else {},
+    }
+
+def create_message(client, **request) -> dict:
+    """messages.create through the raw response, so the record also carries the request id and retry count."""
+    raw = client.messages.with_raw_response.create(**request)
+    record = record_from_message(raw.parse())
+    record["request_id"] = raw.request_id
+    record["retries"] = raw.retries_taken
+    return record
+
+class ResponseCache:
+    """
+    Content-addressed response cache with size-based LRU eviction.
+    One JSON file per key; a hit bumps the file mtime, eviction drops the
+    least recently used entries until the directory is under max_bytes.
+
+    Modes:
+      read   - serve hits, call and store on miss (default)
+      write  - always call, overwrite the stored entry
+      off    - always call, never touch the cache
+      replay - serve hits, raise CacheMiss on miss (offline / CI)
+    """
+
+    def __init__(self, root: pathlib.Path = CACHE_DIR, max_bytes: int = MAX_BYTES, mode: str = "read"):
+        if mode not in MODES:
+            raise ValueError(f"unknown cache mode {mode!r} (expected one of {', '.join(MODES)})")
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        p = self._path(key)
+        try:
+            record = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(p)  # LRU: mark as recently used
+        except OSError:
+            pass
+        return record
+
+    def put(self, key: str, record: dict) -> None:
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({**record, "key": key, "cached_at": time.time()}, ensure_ascii=False),
+                       encoding="utf-8")
+        os.replace(tmp, p)
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently used entries until the cache fits max_bytes. Returns count removed."""
+        with self._lock:
+            entries = []
+            for f in self.root.glob("*/*.json"):
+                try:
+                    st = f.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, f))
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, f in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    f.unlink()
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            return removed
+
+    def fetch(self, key: str, call) -> tuple[dict, str]:
+        """
+        Resolve one request through the cache. `call()` performs the real request
+        and returns a record dict. Returns (record, status) where status is
+        hit | miss | write | off.
+        """
+        if self.mode == "off":
+            return call(), "off"
+        if self.mode in ("read", "replay"):
+            record = self.get(key)
+            if record is not None:
+                return record, "hit"
+            if self.mode == "replay":
+                raise CacheMiss(f"replay: no cached response for key {key[:16]}…")
+        record = call()
+        if not record.get("aborted"):  # never cache an early-aborted (invalid) generation
+            self.put(key, record)
+        return record, ("write" if self.mode == "write" else "miss")
+
+def add_cache_args(parser) -> None:
+    parser.add_argument("--cache", choices=("read", "write", "off"), default="read",
+                        help="response cache mode (default: read)")
+    parser.add_argument("--replay", action="store_true",
+                        help="serve every call from the cache and fail on a miss (no API calls)")
+
+def cache_from_args(args) -> ResponseCache:
+    return ResponseCache(mode="replay" if args.replay else args.cache)
@@ -1,7 +1,19 @@
-import os, pathlib, time
+import os, sys, pathlib, time, argparse, subprocess
 from datetime import datetime
 from anthropic import Anthropic
 from validate_xml import validate_xml
+from prompt_pool import MAX_CONCURRENCY
+from templating import load_template
+from stream_check import JsonPrefixChecker, XmlPrefixChecker, stream_message
+from json_extract import extract_json, JsonExtractError
+from run_store import RunStore, output_validity
+from assets import RUNS_DIR, snapshot
+from response_cache import create_message
+from telemetry import Telemetry
+from scheduler import Scheduler, GiveUp
+from context_pack import estimate_tokens
+from stage_graph import Stage, StageCache, run_graph, STAGE_CACHE_NAME
+import artifact_store
 import httpx
 from dotenv import load_dotenv 
 import json
@@ -18,11 +30,15 @@ OUTPUT_TYPES = {
 
 # --- setup paths ---
 ROOT = pathlib.Path(__file__).resolve().parent
-PROMPTS = (ROOT / "prompts").glob("*.txt")
-SCHEMA = (ROOT / "schema.xml").read_text(encoding="utf-8")
+PROMPTS_DIR = ROOT / "agent_a_prompts"
+PROMPTS = sorted(PROMPTS_DIR.glob("*.txt"))
+SCHEMA_PATH = ROOT / "schema.xml"
+GUARD_PATH = ROOT / "data" / "guardrails.md"
+SCHEMA = SCHEMA_PATH.read_text(encoding="utf-8")
 MONOLITH_URL = "https://github.com/jszlenk/Monolith-Training.git"
+AGENT_FAMILY = "agent_a"  # OUTPUT_TYPES are the agent_a_prompts stems
 
-GUARD = (ROOT / "data" / "guardrails.md").read_text(encoding="utf-8")
+GUARD = GUARD_PATH.read_text(encoding="utf-8")
 
 # --- model config (edit inline) ---
 MODEL = "claude-sonnet-4-5-20250929"
@@ -31,15 +47,26 @@ TEMPERATURE = 0
 SYSTEM_PROMPT = "Output XML only. No prose."
 load_dotenv()
 
-# --- output dir ---
-STAMP = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-OUT_DIR = ROOT / "runs" / STAMP
-OUT_DIR.mkdir(parents=True, exist_ok=True)
-
-
-with open(f"{OUT_DIR}/A_BRD_creation.json", 'w') as f:
-    json.dump({}, f, indent=4)
+parser = argparse.ArgumentParser(description="Run the architecture prompts and save outputs under runs/<STAMP>/")
+parser.add_argument("--stream", action="store_true",
+                    help="stream responses, validate XML/JSON as it arrives and abort bad generations early")
+parser.add_argument("--resume", metavar="STAMP",
+                    help="continue runs/<STAMP>/, running only the stages whose output is missing")
+parser.add_argument("--with-code", action="store_true",
+                    help="also run the code build (habeeba_run.py into runs/<STAMP>/code/) and judge it")
+parser.add_argument("--no-reuse", action="store_true",
+                    help=f"re-run every stage even if its inputs match a previous run (see runs/{STAGE_CACHE_NAME})")
+args = parser.parse_args()
 
+# --- output dir (a resumed sweep checkpoints on the outputs already written) ---
+STAMP = args.resume or datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+OUT_DIR = RUNS_DIR / STAMP
+if args.resume and not OUT_DIR.is_dir():
+    raise SystemExit(f"Cannot resume: {OUT_DIR} does not exist")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+STORE = RunStore()
+STORE.record_run(STAMP, "run", AGENT_FAMILY, MODEL)
+TELEMETRY = Telemetry(OUT_DIR, "run")
 
 # --- supply our own httpx client so Anthropic doesn't pass proxies ---
 httpx_client = httpx.Client(timeout=200.0)  # keep it simple; no proxies arg
@@ -48,32 +75,91 @@ httpx_client = httpx.Client(timeout=200.0)  # keep it simple; no proxies arg
 api_key = os.environ.get("ANTHROPIC_API_KEY")
 if not api_key:
     raise SystemExit("Please set ANTHROPIC_API_KEY in your environment.")
-client = Anthropic(api_key=api_key, http_client=httpx_client)
-
-def fill_template(t: str) -> str:
-    BRD = (OUT_DIR / "A_BRD_creation.json").read_text(encoding="utf-8")
-    return t.replace("{SCHEMA}", SCHEMA)\
-            .replace("{BRD_TEXT}", BRD)\
-            .replace("{GUARDRAILS_TEXT}", GUARD)\
-            .replace("{MONOLITH_URL}", MONOLITH_URL)
+# retries/backoff live in the scheduler (rate limits, retry-after, AIMD), not the SDK
+client = Anthropic(api_key=api_key, http_client=httpx_client, max_retries=0)
+SCHEDULER = Scheduler(MAX_CONCURRENCY)
 
-print(f"Running prompts... outputs -> {OUT_DIR}\n")
-print("prompt | valid_xml | bytes | secs | note | file")
+def fill_template(p: pathlib.Path) -> str:
+    t = load_template(p)
+    # only stages that declare the BRD as an input read it, after the BRD stage has written it
+    BRD = artifact_store.read_text(OUT_DIR, BRD_OUTPUT) if "BRD_TEXT" in t.placeholders else ""
+    return t.render({
+        "SCHEMA": SCHEMA,
+        "BRD_TEXT": BRD,
+        "GUARDRAILS_TEXT": GUARD,
+        "MONOLITH_URL": MONOLITH_URL,
+    })
 
-for p in sorted(PROMPTS):
+def run_prompt(p: pathlib.Path) -> tuple[str, bool]:
+    """Call the model for one prompt file, write its output, return (table row, valid)."""
     name = p.stem
-    user_text = fill_template(p.read_text(encoding="utf-8"))
+    user_text = fill_template(p)
 
-    t0 = time.time()
-    msg = client.messages.create(
+    request = dict(
         model=MODEL,
         max_tokens=MAX_TOKENS,
         temperature=TEMPERATURE,
         system=SYSTEM_PROMPT,
         messages=[{"role":"user","content":[{"type":"text","text":user_text}]}]
     )
+
+    if args.stream:
+        checker = XmlPrefixChecker() if OUTPUT_TYPES[name] == "xml" else JsonPrefixChecker()
+        send = lambda: stream_message(client, checker, **request)
+    else:
+        send = lambda: create_message(client, **request)
+
+    t0 = time.time()
+    try:
+        with TELEMETRY.span(name, MODEL) as span:
+            record = SCHEDULER.call(send, estimate_tokens(SYSTEM_PROMPT + user_text) + MAX_TOKENS, name)
+            span.record(record)
+    except GiveUp as e:
+        # keep the sweep going; --resume picks this prompt up again
+        elapsed = round(time.time() - t0, 2)
+        STORE.record_result(STAMP, name, agent_family=AGENT_FAMILY, model=MODEL, latency_s=elapsed,
+                            valid=False, note=f"FAILED: {e}")
+        return f"{name} | False | 0 | {elapsed}s | - | FAILED: {e} | -", False
     elapsed = round(time.time() - t0, 2)
-    xml_text = msg.content[0].text if msg.content else ""
+    xml_text, aborted = record["text"], record.get("aborted")
+    ttft_s = record.get("ttft_s")
+    ttft = f"{ttft_s}s" if ttft_s is not None else "-"
+    usage, stop_reason = record.get("usage") or {}, record.get("stop_reason")
+
+    def store(out_file: pathlib.Path, valid: bool, note: str) -> None:
+        STORE.record_result(
+            STAMP, name, agent_family=AGENT_FAMILY, model=MODEL, output_file=out_file.name,
+            bytes=len(xml_text), latency_s=elapsed, ttft_s=ttft_s,
+            input_tokens=usage.get("input_tokens"), output_tokens=usage.get("output_tokens"),
+            cache_read_tokens=usage.get("cache_read_input_tokens"),
+            cache_write_tokens=usage.get("cache_creation_input_tokens"),
+            stop_reason=stop_reason, valid=valid, note=note,
+        )
+
+    if aborted:
+        # partial output kept for debugging only
+        out_file = OUT_DIR / f"{name}.raw.txt"
+        out_file.write_text(xml_text, encoding="utf-8")
+        store(out_file, False, f"ABORTED: {aborted}")
+        return f"{name} | False | {len(xml_text)} | {elapsed}s | {ttft} | ABORTED: {aborted} | {out_file.name}", False
+
+    if OUTPUT_TYPES[name] == "json":
+        # linear-time extraction/repair; original kept as .raw.txt if it had to change
+        try:
+            value, repairs = extract_json(xml_text)
+        except JsonExtractError as e:
+            out_file = OUT_DIR / f"{name}.raw.txt"
+            out_file.write_text(xml_text, encoding="utf-8")
+            store(out_file, False, f"invalid JSON: {e}")
+            return f"{name} | False | {len(xml_text)} | {elapsed}s | {ttft} | invalid JSON: {e} | {out_file.name}", False
+        if repairs:
+            (OUT_DIR / f"{name}.raw.txt").write_text(xml_text, encoding="utf-8")
+        out_file = OUT_DIR / f"{name}.json"
+        out_file.write_text(json.dumps(value, indent=4, ensure_ascii=False), encoding="utf-8")
+        note = ("repaired: " + ", ".join(repairs)) if repairs else "OK"
+        store(out_file, not repairs, note)
+        # a repaired (possibly truncated) BRD is not cached, so later runs do not feed it to B..F again
+        return f"{name} | - | {len(xml_text)} | {elapsed}s | {ttft} | {note} | {out_file.name}", not repairs
 
     xml_text = xml_text.replace("```json", "").replace("```","")
 
@@ -81,4 +167,105 @@ for p in sorted(PROMPTS):
     out_file.write_text(xml_text, encoding="utf-8")
 
     ok, note = validate_xml(xml_text)
-    print(f"{name} | {ok} | {len(xml_text)} | {elapsed}s | {note} | {out_file.name}")
\ No newline at end of file
+    store(out_file, ok, note)
+    return f"{name} | {ok} | {len(xml_text)} | {elapsed}s | {ttft} | {note} | {out_file.name}", ok
+
+# --- stage graph: BRD -> architecture prompts -> (code build -> judge) ---
+BRD_OUTPUT = "A_BRD_creation.json"
+CODE_DIR = "code"
+CODE_PROMPTS = sorted((ROOT / "agent_e_prompts").glob("*.txt"))
+
+def prompt_stage(p: pathlib.Path) -> Stage:
+    """One agent_a prompt; it waits for the BRD only if its template uses {BRD_TEXT}."""
+    used = load_template(p).placeholders
+    return Stage(
+        name=p.stem,
+        run=lambda: run_prompt(p),
+        inputs=(BRD_OUTPUT,) if "BRD_TEXT" in used else (),
+        outputs=(f"{p.stem}.{OUTPUT_TYPES[p.stem]}",),
+        sources=(p,) + ((SCHEMA_PATH,) if "SCHEMA" in used else ()) + ((GUARD_PATH,) if "GUARDRAILS_TEXT" in used else ()),
+        params=json.dumps([MODEL, MAX_TOKENS, TEMPERATURE, SYSTEM_PROMPT, MONOLITH_URL if "MONOLITH_URL" in used else None]),
+        done=lambda: output_ok(OUT_DIR / f"{p.stem}.{OUTPUT_TYPES[p.stem]}"),
+    )
+
+def _stamp(run_dir: pathlib.Path) -> str:
+    return run_dir.relative_to(RUNS_DIR).as_posix()   # nested runs: STAMP/code
+
+def output_ok(out_file: pathlib.Path) -> bool:
+    """--resume check: the run index's valid flag, or validate the file when the index has no row."""
+    row = STORE.result(_stamp(out_file.parent), out_file.stem)
+    if row is not None and row["valid"] is not None:
+        return bool(row["valid"])
+    return output_validity(out_file, artifact_store.read_text(out_file.parent, out_file.name, errors="replace"))[0]
+
+def record_reused(stage: Stage, src: pathlib.Path) -> None:
+    """Index the outputs a reused stage copied in, so leaderboards and diffs see them under this stamp."""
+    for art in stage.outputs:
+        out_file, src_file = OUT_DIR / art, src / art
+        stamp, src_stamp = _stamp(out_file.parent), _stamp(src_file.parent)
+        text = artifact_store.read_text(out_file.parent, out_file.name, errors="replace")
+        if out_file.name == "judge_prompts.json":
+            STORE.record_judgement(stamp, json.loads(text))
+            continue
+        row = STORE.result(src_stamp, out_file.stem) or {}
+        valid, note = ((row["valid"], row["note"]) if row.get("valid") is not None
+                       else output_validity(out_file, text))
+        own = out_file.parent == OUT_DIR
+        family = row.get("agent_family") or (AGENT_FAMILY if own else None)
+        model = row.get("model") or (MODEL if own else None)
+        if not own:
+            STORE.record_run(stamp, "reused", family, model)
+        STORE.record_result(stamp, out_file.stem, agent_family=family, model=model,
+                            output_file=out_file.name, bytes=len(text),
+                            stop_reason=row.get("stop_reason"), valid=valid, note=f"reused from {src_stamp}: {note}")
+
+def script_stage(name: str, argv: list[str]) -> tuple[str, bool]:
+    """Run another pipeline script as a stage; its own output goes to the console as usual."""
+    t0 = time.time()
+    rc = subprocess.run([sys.executable, str(ROOT / argv[0]), *argv[1:]], cwd=ROOT).returncode
+    return f"{name} | - | - | {round(time.time() - t0, 2)}s | - | exit {rc} | {' '.join(argv)}", rc == 0
+
+def code_stages() -> list[Stage]:
+    """
+    habeeba_run.py into runs/<STAMP>/code/, then judge_prompts.py on that folder.
+    The code prompts read the shared assets (not the architecture outputs), so
+    they start right away and are re-run when the asset snapshot changes.
+    """
+    (OUT_DIR / CODE_DIR).mkdir(exist_ok=True)
+    code_run = f"{STAMP}/{CODE_DIR}"
+    code_outputs = tuple(f"{CODE_DIR}/{p.stem}.json" for p in CODE_PROMPTS)
+    return [
+        Stage(name="code_build",
+              run=lambda: script_stage("code_build", ["habeeba_run.py", "--resume", code_run]),
+              outputs=code_outputs,
+              sources=(ROOT / "habeeba_run.py", *CODE_PROMPTS),
+              params=snapshot().id),
+        Stage(name="judge",
+              run=lambda: script_stage("judge", ["judge_prompts.py", "--run", code_run]),
+              inputs=code_outputs,
+              outputs=(f"{CODE_DIR}/judge_prompts.json",),
+              sources=(ROOT / "judge_prompts.py", ROOT / "tournament.py",
+                       ROOT / "agent_e_prompts" / "JUDGE_prompt_quality.txt"),
+              # same env and defaults judge_prompts.py reads; it also packs the snapshot's code
+              params=json.dumps([os.environ.get("ANTHROPIC_JUDGE_MODEL", "claude-sonnet-4-5-20250929"),
+                                 int(os.environ.get("JUDGE_TOP_K", "4")), snapshot().id])),
+    ]
+
+STAGES = [prompt_stage(p) for p in PROMPTS] + (code_stages() if args.with_code else [])
+STAGE_CACHE = None if args.no_reuse else StageCache(RUNS_DIR / STAGE_CACHE_NAME)
+
+print(f"Running {len(STAGES)} stages (max {MAX_CONCURRENCY} in flight)... outputs -> {OUT_DIR}\n")
+print("prompt | valid_xml | bytes | secs | ttft | note | file")
+
+try:
+    for stage, status, row in run_graph(STAGES, OUT_DIR, STAGE_CACHE, MAX_CONCURRENCY, resume=bool(args.resume)):
+        if status == "ran":
+            print(row)
+        elif status == "reused":
+            record_reused(stage, row)
+            print(f"{stage.name} | - | - | - | - | reused: from {_stamp(row)} | {', '.join(stage.outputs)}")
+        else:
+            print(f"{stage.name} | - | - | - | - | {status}: {row} | {', '.join(stage.outputs)}")
+finally:
+    TELEMETRY.finish()
+    artifact_store.autopack(OUT_DIR)   # includes code/ (already packed by its own runners)
@@ -0,0 +1,317 @@
+"""
+Indexed store of every sweep under runs/.
+
+The runners and the judge write one row per run / prompt result / judgement
+into runs/index.sqlite as they go; `backfill` imports existing run folders.
+Queries read the index instead of rescanning the tree:
+
+    python run_store.py backfill
+    python run_store.py runs [--family agent_e]
+    python run_store.py leaderboard [--family agent_e]
+    python run_store.py trend B_prompt [--family agent_e]
+    python run_store.py diff 20251006T142919Z 20251006T151102Z
+    python run_store.py tag baseline 20251006T151102Z
+"""
+import argparse, json, pathlib, sqlite3, threading, time
+from contextlib import closing
+
+from assets import RUNS_DIR, MANIFEST_NAME
+from telemetry import SPANS_NAME, SUMMARY_NAME
+from message_batches import STATE_NAME as BATCH_STATE_NAME
+from artifact_store import ARTIFACTS_NAME
+import artifact_store
+
+ROOT = pathlib.Path(__file__).resolve().parent
+INDEX_PATH = RUNS_DIR / "index.sqlite"
+
+# Files in a run dir that are bookkeeping, not candidates
+META_FILES = {"judge_prompts.json", MANIFEST_NAME, "raw_judge_response.txt", "judge_prompts.raw.txt",
+              SPANS_NAME, SUMMARY_NAME, BATCH_STATE_NAME, ARTIFACTS_NAME}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    stamp        TEXT PRIMARY KEY,
+    runner       TEXT,
+    agent_family TEXT,
+    model        TEXT,
+    snapshot_id  TEXT,
+    created_at   REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    stamp         TEXT,
+    prompt        TEXT,
+    agent_family  TEXT,
+    model         TEXT,
+    output_file   TEXT,
+    bytes         INTEGER,
+    latency_s     REAL,
+    ttft_s        REAL,
+    input_tokens  INTEGER,
+    output_tokens INTEGER,
+    cache_read_tokens  INTEGER,
+    cache_write_tokens INTEGER,
+    stop_reason   TEXT,
+    valid         INTEGER,
+    note          TEXT,
+    PRIMARY KEY (stamp, prompt)
+);
+CREATE TABLE IF NOT EXISTS judgements (
+    stamp       TEXT,
+    prompt      TEXT,
+    score       REAL,
+    rank        INTEGER,
+    is_winner   INTEGER,
+    reasons     TEXT,
+    judge_model TEXT,
+    PRIMARY KEY (stamp, prompt)
+);
+CREATE TABLE IF NOT EXISTS tags (
+    tag   TEXT PRIMARY KEY,
+    stamp TEXT
+);
+"""
+
+RESULT_FIELDS = ("agent_family", "model", "output_file", "bytes", "latency_s", "ttft_s", "input_tokens",
+                 "output_tokens", "cache_read_tokens", "cache_write_tokens", "stop_reason", "valid", "note")
+
+class RunStore:
+    """Thin wrapper over runs/index.sqlite; safe to call from worker threads (one connection per call)."""
+
+    def __init__(self, path: pathlib.Path = INDEX_PATH):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as db:
+            db.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _write(self, sql: str, params=()) -> None:
+        with self._lock, closing(self._conn()) as db, db:
+            db.execute(sql, params)
+
+    def _query(self, sql: str, params=()) -> list[dict]:
+        with closing(self._conn()) as db:
+            return [dict(r) for r in db.execute(sql, params).fetchall()]
+
+    # --- writers ---
+    def record_run(self, stamp: str, runner: str, agent_family: str, model: str, snapshot_id: str | None = None) -> None:
+        self._write("INSERT OR REPLACE INTO runs VALUES (?,?,?,?,?,?)",
+                    (stamp, runner, agent_family, model, snapshot_id, time.time()))
+
+    def record_result(self, stamp: str, prompt: str, **fields) -> None:
+        unknown = set(fields) - set(RESULT_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown result field(s): {', '.join(sorted(unknown))}")
+        if "valid" in fields and fields["valid"] is not None:
+            fields["valid"] = int(bool(fields["valid"]))
+        cols = ["stamp", "prompt"] + list(fields)
+        self._write(f"INSERT OR REPLACE INTO results ({','.join(cols)}) VALUES ({','.join('?' * len(cols))})",
+                    (stamp, prompt, *fields.values()))
+
+    def record_judgement(self, stamp: str, result: dict, judge_model: str | None = None) -> None:
+        winner = result.get("winner")
+        with self._lock, closing(self._conn()) as db, db:
+            db.execute("DELETE FROM judgements WHERE stamp = ?", (stamp,))
+            db.executemany("INSERT INTO judgements VALUES (?,?,?,?,?,?,?)", [
+                (stamp, r.get("prompt"), r.get("score"), i + 1, int(r.get("prompt") == winner),
+                 r.get("reasons"), judge_model)
+                for i, r in enumerate(result.get("ranking", []))
+            ])
+
+    def tag(self, tag: str, stamp: str) -> None:
+        self._write("INSERT OR REPLACE INTO tags VALUES (?,?)", (tag, stamp))
+
+    # --- lookups ---
+    def resolve(self, ref: str = "latest", runs_dir: pathlib.Path = RUNS_DIR) -> str:
+        """
+        Turn a run reference into a stamp: an exact stamp, a tag, `latest`, or
+        `latest:<agent_family>`. Falls back to the newest run folder on disk when
+        the index has nothing yet.
+        """
+        if (runs_dir / ref).is_dir():
+            return ref
+        rows = self._query("SELECT stamp FROM tags WHERE tag = ?", (ref,))
+        if rows:
+            return rows[0]["stamp"]
+        if ref == "latest" or ref.startswith("latest:"):
+            family = ref.partition(":")[2]
+            sql = "SELECT stamp FROM runs" + (" WHERE agent_family = ?" if family else "") + " ORDER BY stamp DESC LIMIT 1"
+            rows = self._query(sql, (family,) if family else ())
+            if rows and (runs_dir / rows[0]["stamp"]).is_dir():
+                return rows[0]["stamp"]
+            if not family:
+                dirs = sorted((d.name for d in runs_dir.iterdir() if d.is_dir() and not d.name.startswith(".")), reverse=True)
+                if dirs:
+                    return dirs[0]
+        raise SystemExit(f"Unknown run reference {ref!r} (expected a stamp, a tag, 'latest' or 'latest:<family>')")
+
+    # --- queries ---
+    def result(self, stamp: str, prompt: str) -> dict | None:
+        rows = self._query("SELECT * FROM results WHERE stamp = ? AND prompt = ?", (stamp, prompt))
+        return rows[0] if rows else None
+
+    def runs(self, family: str | None = None) -> list[dict]:
+        return self._query("""
+            SELECT r.stamp, r.agent_family, r.model, r.runner, r.snapshot_id,
+                   COUNT(x.prompt) AS prompts, SUM(x.valid) AS valid,
+                   (SELECT prompt FROM judgements j WHERE j.stamp = r.stamp AND j.is_winner) AS winner,
+                   (SELECT GROUP_CONCAT(tag) FROM tags t WHERE t.stamp = r.stamp) AS tags
+            FROM runs r LEFT JOIN results x ON x.stamp = r.stamp
+            WHERE (? IS NULL OR r.agent_family = ?)
+            GROUP BY r.stamp ORDER BY r.stamp""", (family, family))
+
+    def leaderboard(self, family: str | None = None) -> list[dict]:
+        return self._query("""
+            SELECT x.agent_family, x.prompt,
+                   COUNT(*) AS runs,
+                   COUNT(j.score) AS judged,
+                   COALESCE(SUM(j.is_winner), 0) AS wins,
+                   ROUND(AVG(j.score), 1) AS avg_score,
+                   ROUND(AVG(x.bytes)) AS avg_bytes,
+                   ROUND(AVG(x.latency_s), 2) AS avg_secs,
+                   ROUND(AVG(x.valid), 2) AS valid_rate
+            FROM results x LEFT JOIN judgements j ON j.stamp = x.stamp AND j.prompt = x.prompt
+            WHERE (? IS NULL OR x.agent_family = ?)
+            GROUP BY x.agent_family, x.prompt
+            ORDER BY wins DESC, avg_score DESC""", (family, family))
+
+    def trend(self, prompt: str, family: str | None = None) -> list[dict]:
+        return self._query("""
+            SELECT x.stamp, x.agent_family, x.model, x.bytes, x.latency_s, x.output_tokens, x.valid,
+                   j.score, j.rank, j.is_winner
+            FROM results x LEFT JOIN judgements j ON j.stamp = x.stamp AND j.prompt = x.prompt
+            WHERE x.prompt = ? AND (? IS NULL OR x.agent_family = ?)
+            ORDER BY x.stamp""", (prompt, family, family))
+
+    def diff(self, a: str, b: str) -> list[dict]:
+        rows = {}
+        for side, stamp in (("a", a), ("b", b)):
+            for r in self._query("""
+                SELECT x.prompt, x.bytes, x.latency_s, x.valid, j.score, j.rank
+                FROM results x LEFT JOIN judgements j ON j.stamp = x.stamp AND j.prompt = x.prompt
+                WHERE x.stamp = ?""", (stamp,)):
+                rows.setdefault(r["prompt"], {"prompt": r["prompt"]}).update({f"{k}_{side}": v for k, v in r.items() if k != "prompt"})
+        for r in rows.values():
+            for k in ("bytes", "latency_s", "score"):
+                va, vb = r.get(f"{k}_a"), r.get(f"{k}_b")
+                r[f"d_{k}"] = round(vb - va, 2) if va is not None and vb is not None else None
+        return sorted(rows.values(), key=lambda r: r["prompt"])
+
+# --- backfill ---
+AGENT_DIRS = {d.name: {p.stem for p in d.glob("*.txt")} for d in sorted(ROOT.glob("agent_*_prompts"))}
+
+def infer_family(stems: set[str], sample: str = "") -> str | None:
+    """Best guess of which agent_*_prompts folder produced a run, from its output names (and content)."""
+    stems = {s for s in stems if not s.startswith("JUDGE")}
+    matches = [d for d, names in AGENT_DIRS.items() if stems and stems <= names]
+    if len(matches) > 1 and "bundle_manifest" in sample:
+        matches = [d for d in matches if d.startswith("agent_e")] or matches
+    elif len(matches) > 1:
+        # prefer the smallest folder that still covers every stem (agent_e/agent_d before agent_c)
+        matches.sort(key=lambda d: len(AGENT_DIRS[d]))
+    return matches[0].removesuffix("_prompts") if matches else None
+
+def output_validity(p: pathlib.Path, text: str) -> tuple[bool, str]:
+    """(valid, note) for a saved output, judged the way the runners do (repaired JSON is not valid)."""
+    if p.suffix == ".xml":
+        from validate_xml import validate_xml
+        return validate_xml(text)
+    from json_extract import extract_json, JsonExtractError
+    try:
+        _, repairs = extract_json(text)
+    except JsonExtractError as e:
+        return False, f"invalid JSON: {e}"
+    return (not repairs, ("repaired: " + ", ".join(repairs)) if repairs else "OK")
+
+def backfill(store: RunStore, runs_dir: pathlib.Path = RUNS_DIR) -> int:
+    """
+    Import every run folder (outputs + judge_prompts.json) into the index.
+    Runs the runners already recorded live are left alone (they carry latency
+    and token usage the files do not). Returns the number of runs imported.
+    """
+    live = {r["stamp"] for r in store._query("SELECT stamp FROM runs WHERE runner != 'backfill'")}
+    n = 0
+    for d in sorted(p for p in runs_dir.iterdir() if p.is_dir() and not p.name.startswith(".")):
+        if d.name in live:
+            continue
+        outputs = {}
+        for f in (d / n for n in artifact_store.list_names(d)):  # loose or packed
+            if f.name in META_FILES:
+                continue
+            if f.name.endswith(".raw.txt"):
+                outputs.setdefault(f.name[:-len(".raw.txt")], f)
+            elif f.suffix in (".json", ".xml"):
+                outputs[f.stem] = f
+        if not outputs:
+            continue
+        sample = artifact_store.read_text(d, next(iter(outputs.values())).name, errors="replace")
+        family = infer_family(set(outputs), sample)
+        snapshot_id = None
+        try:
+            snapshot_id = json.loads(artifact_store.read_text(d, MANIFEST_NAME)).get("snapshot_id")
+        except Exception:
+            pass
+        store.record_run(d.name, "backfill", family, None, snapshot_id)
+        for stem, f in outputs.items():
+            text = artifact_store.read_text(d, f.name, errors="replace")
+            valid, note = (False, "raw output only") if f.name.endswith(".raw.txt") else output_validity(f, text)
+            store.record_result(d.name, stem, agent_family=family, output_file=f.name,
+                                bytes=len(text), valid=valid, note=note)
+        if artifact_store.exists(d, "judge_prompts.json"):
+            try:
+                store.record_judgement(d.name, json.loads(artifact_store.read_text(d, "judge_prompts.json")))
+            except ValueError:
+                pass
+        n += 1
+    return n
+
+def _print_table(rows: list[dict]) -> None:
+    if not rows:
+        print("(no rows)")
+        return
+    cols = list(rows[0])
+    print(" | ".join(cols))
+    for r in rows:
+        print(" | ".join("-" if r[c] is None else str(r[c]) for c in cols))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Query the runs/ index (leaderboards, trends, diffs)")
+    ap.add_argument("--index", type=pathlib.Path, default=INDEX_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("backfill", help="import existing runs/ folders into the index")
+    for name in ("runs", "leaderboard"):
+        sp = sub.add_parser(name)
+        sp.add_argument("--family")
+    sp = sub.add_parser("trend")
+    sp.add_argument("prompt")
+    sp.add_argument("--family")
+    sp = sub.add_parser("diff")
+    sp.add_argument("a")
+    sp.add_argument("b")
+    sp = sub.add_parser("tag")
+    sp.add_argument("tag")
+    sp.add_argument("run", help="stamp, tag or latest[:family]")
+    args = ap.parse_args(argv)
+
+    store = RunStore(args.index)
+    if args.cmd == "backfill":
+        print(f"imported {backfill(store)} runs into {args.index}")
+    elif args.cmd == "runs":
+        _print_table(store.runs(args.family))
+    elif args.cmd == "leaderboard":
+        _print_table(store.leaderboard(args.family))
+    elif args.cmd == "trend":
+        _print_table(store.trend(args.prompt, args.family))
+    elif args.cmd == "diff":
+        _print_table(store.diff(store.resolve(args.a), store.resolve(args.b)))
+    elif args.cmd == "tag":
+        stamp = store.resolve(args.run)
+        store.tag(args.tag, stamp)
+        print(f"{args.tag} -> {stamp}")
+
+if __name__ == "__main__":
+    main()
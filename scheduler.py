@@ -0,0 +1,212 @@
+import os, random, threading, time
+import anthropic, httpx
+import artifact_store
+
+# Account limits the sweep must stay under (override per tier; 0 disables a limit)
+RATE_LIMIT_RPM = int(os.environ.get("RATE_LIMIT_RPM", "50"))
+RATE_LIMIT_TPM = int(os.environ.get("RATE_LIMIT_TPM", "200000"))
+MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "6"))
+BACKOFF_BASE_S = float(os.environ.get("BACKOFF_BASE_S", "2"))
+BACKOFF_MAX_S = float(os.environ.get("BACKOFF_MAX_S", "90"))
+
+class GiveUp(RuntimeError):
+    """A call still failed after MAX_RETRIES retries; `last` is the final error."""
+
+    def __init__(self, label: str, attempts: int, last: BaseException):
+        super().__init__(f"{label or 'call'} failed after {attempts} attempt(s): {type(last).__name__}: {last}")
+        self.attempts = attempts
+        self.last = last
+
+class TokenBucket:
+    """
+    Continuously refilling bucket of `per_minute` units (capacity one minute's worth).
+    `take` blocks until the units are available; a request larger than the whole
+    bucket waits for a full bucket rather than forever. `refund` settles the
+    difference once the real cost is known (negative refunds go into debt).
+    """
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self._t = time.monotonic()
+        self._cv = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._t) * self.rate)
+        self._t = now
+
+    def take(self, n: float) -> float:
+        n = min(n, self.capacity)
+        with self._cv:
+            while True:
+                self._refill()
+                if self.level >= n:
+                    self.level -= n
+                    return n
+                self._cv.wait((n - self.level) / self.rate)
+
+    def refund(self, n: float) -> None:
+        with self._cv:
+            self._refill()
+            self.level = min(self.capacity, self.level + n)
+            self._cv.notify_all()
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit: +1/limit per success (about +1 per round of calls),
+    halved on throttling. Throttles from calls started before the last cut are
+    ignored, so one burst of 429s halves the limit once, not once per call.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._cut_at = 0.0
+        self._cv = threading.Condition()
+
+    def acquire(self) -> float:
+        with self._cv:
+            while self.in_flight >= int(self.limit):
+                self._cv.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, outcome: str = "ok") -> None:
+        """outcome: ok (grow), throttle (halve), anything else leaves the limit alone."""
+        with self._cv:
+            self.in_flight -= 1
+            if outcome == "throttle":
+                if started >= self._cut_at:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._cut_at = time.monotonic()
+            elif outcome == "ok":
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cv.notify_all()
+
+def retry_after(e: BaseException) -> float | None:
+    """Seconds the server asked us to wait (retry-after-ms / retry-after headers), if any."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+# error.type in the body; a mid-stream SSE error arrives as APIStatusError with the stream's status (200)
+THROTTLE_TYPES = {"overloaded_error", "rate_limit_error"}
+RETRY_TYPES = {"api_error"}
+
+def classify(e: BaseException) -> str | None:
+    """'throttle' (429/529/503: slow everyone down), 'retry' (transient), or None (give up now)."""
+    if isinstance(e, anthropic.RateLimitError):
+        return "throttle"
+    if isinstance(e, anthropic.APIStatusError):
+        error = e.body.get("error") if isinstance(e.body, dict) else None
+        kind = error.get("type") if isinstance(error, dict) else None
+        if kind in THROTTLE_TYPES:
+            return "throttle"
+        if kind in RETRY_TYPES:
+            return "retry"
+        if e.status_code in (503, 529):
+            return "throttle"
+        return "retry" if e.status_code >= 500 or e.status_code == 408 else None
+    if isinstance(e, (anthropic.APIConnectionError, httpx.TimeoutException, httpx.TransportError)):
+        return "retry"  # APITimeoutError is an APIConnectionError; mid-stream read errors come from httpx
+    return None
+
+class Scheduler:
+    """
+    Gate for every model call in a sweep: requests/min and tokens/min buckets,
+    an AIMD concurrency limit, and retries with exponential backoff (full
+    jitter) that never wait less than the server's retry-after. A throttle also
+    pauses new calls from every thread until its retry-after has passed.
+    Pair it with a client built with max_retries=0 so retries happen here.
+    """
+
+    def __init__(self, max_concurrency: int, rpm: int = RATE_LIMIT_RPM, tpm: int = RATE_LIMIT_TPM,
+                 max_retries: int = MAX_RETRIES):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.limit = AdaptiveLimit(max_concurrency)
+        self.max_retries = max_retries
+        self.throttles = 0
+        self._pause_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_pause(self) -> None:
+        while True:
+            with self._lock:
+                delay = self._pause_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _backoff(self, attempt: int, e: BaseException, throttled: bool) -> float:
+        delay = random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+        hinted = retry_after(e)
+        if hinted is not None:
+            delay = max(delay, hinted + random.uniform(0, 1))
+        if throttled:
+            with self._lock:
+                self._pause_until = max(self._pause_until, time.monotonic() + (hinted or delay))
+        return delay
+
+    def call(self, fn, est_tokens: int = 0, label: str = ""):
+        """
+        Run fn() under the limits. `est_tokens` (input estimate + max_tokens) is
+        reserved up front and settled against the usage fn's record reports.
+        Returns fn's result (a record dict gets `retries`, `api_s` - the
+        successful fn() call alone - and `queue_s` - time spent waiting for the
+        limits, in backoff and in failed attempts); raises GiveUp after
+        max_retries, or the original error if it is not retryable.
+        """
+        t_call = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            self._wait_pause()
+            started = self.limit.acquire()
+            if self.requests:
+                self.requests.take(1)
+            reserved = self.tokens.take(est_tokens) if self.tokens else 0
+            t_api = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                kind = classify(e)
+                self.limit.release(started, kind or "error")
+                if kind is None:
+                    raise
+                if kind == "throttle":
+                    self.throttles += 1
+                    if self.tokens:
+                        self.tokens.refund(reserved)  # rejected up front: nothing was consumed
+                if attempt == self.max_retries:
+                    raise GiveUp(label, attempt + 1, e) from e
+                delay = self._backoff(attempt, e, kind == "throttle")
+                print(f"{label}: {type(e).__name__} ({kind}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            api_s = time.monotonic() - t_api
+            self.limit.release(started)
+            if isinstance(result, dict):
+                if self.tokens:
+                    usage = result.get("usage") or {}
+                    used = sum(usage.get(k) or 0 for k in ("input_tokens", "output_tokens",
+                                                           "cache_creation_input_tokens"))
+                    if used:
+                        self.tokens.refund(reserved - used)
+                result["retries"] = (result.get("retries") or 0) + attempt
+                result["api_s"] = round(api_s, 3)
+                result["queue_s"] = round(time.monotonic() - t_call - api_s, 3)
+            return result
+
+def output_done(out_dir, stem: str, suffixes=(".json", ".xml")) -> bool:
+    """Checkpoint test for --resume: a prompt is done once its real output (not .raw.txt) exists, loose or packed."""
+    return any(artifact_store.exists(out_dir, f"{stem}{s}") for s in suffixes)
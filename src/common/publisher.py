@@ -0,0 +1,142 @@
+# src/common/publisher.py
+import os, json, time, random, threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_ENTRIES = 10                 # PutEvents limits per request
+MAX_BYTES = 256 * 1024
+MAX_IN_FLIGHT = int(os.getenv("EVENTS_MAX_IN_FLIGHT", "4"))
+MAX_RETRIES = int(os.getenv("EVENTS_MAX_RETRIES", "5"))
+BACKOFF_BASE_S = float(os.getenv("EVENTS_BACKOFF_BASE_S", "0.1"))
+
+def entry_size(entry):
+    """PutEvents entry size as AWS counts it (UTF-8 bytes of the string fields, +14 for Time)."""
+    n = sum(len(entry[k].encode()) for k in ("Source", "DetailType", "Detail", "EventBusName") if entry.get(k))
+    n += sum(len(r.encode()) for r in entry.get("Resources", ()))
+    return n + (14 if entry.get("Time") else 0)
+
+class EventPublisher:
+    """
+    Buffers EventBridge entries and sends them in PutEvents batches (10 entries
+    / 256 KB) from a small thread pool; put() blocks once MAX_IN_FLIGHT
+    batches are outstanding. Only the entries a response marks as failed are
+    retried (exponential backoff, full jitter); what still fails is kept in
+    `lost` and reported by flush(). Call flush() before the handler returns
+    (or wrap it with flush_on_exit) - a frozen Lambda never sends its buffer.
+    With no bus name every put() is a no-op, as before.
+    """
+
+    def __init__(self, client, bus_name, source, max_in_flight=MAX_IN_FLIGHT, max_retries=MAX_RETRIES):
+        self.client = client
+        self.bus_name = bus_name
+        self.source = source
+        self.max_retries = max_retries
+        self.lost = []                       # (entry, error code, message)
+        self.sent = self.requests = 0
+        self._buf, self._buf_bytes = [], 0
+        self._lock = threading.Lock()
+        # batches taken from the buffer and not finished yet; counted under the same lock that
+        # empties the buffer, so flush() also waits for a batch a put() is still submitting
+        self._outstanding = 0
+        self._idle = threading.Condition(self._lock)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="events")
+
+    def put(self, detail_type, detail, source=None):
+        if not self.bus_name:
+            return
+        entry = {"Source": source or self.source, "DetailType": detail_type,
+                 "Detail": detail if isinstance(detail, str) else json.dumps(detail, default=str),
+                 "EventBusName": self.bus_name}
+        size = entry_size(entry)
+        if size > MAX_BYTES:
+            with self._lock:
+                self.lost.append((entry, "EntryTooLarge", f"{size} bytes"))
+            return
+        with self._lock:
+            if len(self._buf) == MAX_ENTRIES or self._buf_bytes + size > MAX_BYTES:
+                batch, self._buf, self._buf_bytes = self._buf, [], 0
+                self._outstanding += 1
+            else:
+                batch = None
+            self._buf.append(entry)
+            self._buf_bytes += size
+        if batch:
+            self._submit(batch)
+
+    def _submit(self, batch):
+        self._slots.acquire()                # backpressure: bounded requests in flight
+        self._pool.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            self._send(batch)
+        except Exception as e:               # never drop a batch silently
+            with self._lock:
+                self.lost.extend((en, type(e).__name__, str(e)) for en in batch)
+        finally:
+            self._slots.release()
+            with self._idle:
+                self._outstanding -= 1
+                self._idle.notify_all()
+
+    def _send(self, entries):
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = self.client.put_events(Entries=entries)
+            except Exception as e:           # throttled / transport error: the whole batch is retried
+                failed = [(en, type(e).__name__, str(e)) for en in entries]
+            else:
+                results = resp.get("Entries") or []
+                failed = [(en, r.get("ErrorCode"), r.get("ErrorMessage"))
+                          for en, r in zip(entries, results) if r.get("ErrorCode")] if resp.get("FailedEntryCount") else []
+            with self._lock:
+                self.requests += 1
+                self.sent += len(entries) - len(failed)
+            if not failed:
+                return
+            if attempt == self.max_retries:
+                break
+            entries = [en for en, _, _ in failed]
+            time.sleep(random.uniform(0, BACKOFF_BASE_S * 2 ** attempt))
+        with self._lock:
+            self.lost.extend(failed)
+
+    def flush(self):
+        """Send the partial batch, wait for everything in flight; returns {"sent", "requests", "lost"} and resets them."""
+        with self._lock:
+            batch, self._buf, self._buf_bytes = self._buf, [], 0
+            self._outstanding += bool(batch)
+        if batch:
+            self._submit(batch)
+        with self._idle:
+            self._idle.wait_for(lambda: self._outstanding == 0)
+            report = {"sent": self.sent, "requests": self.requests, "lost": self.lost}
+            self.sent = self.requests = 0
+            self.lost = []
+        if report["lost"]:
+            report_lost(self.source, report["lost"])
+        return report
+
+def report_lost(source, lost):
+    """One ERROR log line per flush plus an EventsLost metric (CloudWatch embedded metric format)."""
+    print(json.dumps({
+        "level": "ERROR", "msg": "events lost", "source": source, "EventsLost": len(lost),
+        "errors": sorted({str(code) for _, code, _ in lost}),
+        "entries": [{"DetailType": en["DetailType"], "Detail": en["Detail"][:512], "ErrorCode": code,
+                     "ErrorMessage": msg} for en, code, msg in lost[:20]],
+        "_aws": {"Timestamp": int(time.time() * 1000), "CloudWatchMetrics": [{
+            "Namespace": "app/events", "Dimensions": [["source"]],
+            "Metrics": [{"Name": "EventsLost", "Unit": "Count"}]}]},
+    }))
+
+def flush_on_exit(publisher):
+    """Decorator for a Lambda handler: flush `publisher` before the response goes out, even on error."""
+    def wrap(fn):
+        def handler(event, context):
+            try:
+                return fn(event, context)
+            finally:
+                publisher.flush()
+        handler.__name__, handler.__doc__ = fn.__name__, fn.__doc__
+        return handler
+    return wrap
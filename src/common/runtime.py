@@ -0,0 +1,137 @@
+# src/common/runtime.py
+"""
+Shared Lambda runtime: AWS clients created on first use (one per container,
+all from one boto3 Session and one tuned botocore Config), with import and
+client-init durations kept in a startup profile.
+
+    s3 = runtime.client("s3")           # proxy; boto3 is imported and the client built on first attribute access
+    TABLE = runtime.lazy(lambda: runtime.resource("dynamodb").Table(NAME))
+
+STARTUP_PROFILE=1 logs each profile entry as it is recorded; RUNTIME_EAGER=1
+builds everything at import like before (e.g. to keep the work inside the
+init phase). `python -m src.common.runtime src.orders.handlers` prints the
+profile of importing a handler module.
+"""
+import os, json, time, threading, importlib
+
+MAX_POOL = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "32"))     # >= the biggest thread pool sharing a client
+MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "4"))
+RETRY_MODE = os.getenv("AWS_RETRY_MODE", "adaptive")
+CONNECT_TIMEOUT_S = float(os.getenv("AWS_CONNECT_TIMEOUT_S", "2"))
+READ_TIMEOUT_S = float(os.getenv("AWS_READ_TIMEOUT_S", "10"))
+EAGER = os.getenv("RUNTIME_EAGER", "") == "1"
+LOG_PROFILE = os.getenv("STARTUP_PROFILE", "") == "1"
+
+_T0 = time.perf_counter()
+_lock = threading.RLock()
+_clients, _resources = {}, {}
+_session = _config = None
+PROFILE = {"imports": {}, "clients": {}, "resources": {}}
+
+def record(kind, name, secs):
+    PROFILE[kind][name] = round(secs * 1000, 2)
+    if LOG_PROFILE:
+        print(json.dumps({"msg": "startup", "kind": kind, "name": name, "ms": PROFILE[kind][name],
+                          "since_init_ms": round((time.perf_counter() - _T0) * 1000, 1)}))
+
+def profile():
+    """Copy of the startup profile (milliseconds)."""
+    with _lock:
+        return json.loads(json.dumps(PROFILE))
+
+def deferred_import(name):
+    """importlib.import_module, timed into the profile the first time."""
+    with _lock:
+        if name in PROFILE["imports"]:
+            return importlib.import_module(name)
+        t = time.perf_counter()
+        mod = importlib.import_module(name)
+        record("imports", name, time.perf_counter() - t)
+        return mod
+
+def config():
+    """The one botocore Config every client uses: pooled keep-alive connections, bounded timeouts, adaptive retries."""
+    global _config
+    with _lock:
+        if _config is None:
+            Config = deferred_import("botocore.config").Config
+            _config = Config(max_pool_connections=MAX_POOL, tcp_keepalive=True,
+                             connect_timeout=CONNECT_TIMEOUT_S, read_timeout=READ_TIMEOUT_S,
+                             retries={"mode": RETRY_MODE, "max_attempts": MAX_ATTEMPTS})
+        return _config
+
+def _get_session():
+    # one Session: its loader caches the service models, so the 2nd client is much cheaper than the 1st
+    global _session
+    with _lock:
+        if _session is None:
+            _session = deferred_import("boto3").session.Session()
+        return _session
+
+def get_client(name):
+    with _lock:
+        if name not in _clients:
+            session, cfg = _get_session(), config()
+            t = time.perf_counter()
+            _clients[name] = session.client(name, config=cfg)
+            record("clients", name, time.perf_counter() - t)
+        return _clients[name]
+
+def get_resource(name):
+    with _lock:
+        if name not in _resources:
+            session, cfg = _get_session(), config()
+            t = time.perf_counter()
+            _resources[name] = session.resource(name, config=cfg)
+            record("resources", name, time.perf_counter() - t)
+        return _resources[name]
+
+class Lazy:
+    """Stands in for factory()'s result; the factory runs on first attribute access (or at once with RUNTIME_EAGER=1)."""
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_target", None)
+        if EAGER:
+            self._resolve()
+
+    def _resolve(self):
+        target = object.__getattribute__(self, "_target")
+        if target is None:
+            with _lock:
+                target = object.__getattribute__(self, "_target")
+                if target is None:
+                    target = object.__getattribute__(self, "_factory")()
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+def lazy(factory):
+    return Lazy(factory)
+
+def client(name):
+    return Lazy(lambda: get_client(name))
+
+def resource(name):
+    return Lazy(lambda: get_resource(name))
+
+if __name__ == "__main__":
+    import argparse, sys
+    ap = argparse.ArgumentParser(description="Startup profile of importing a handler module")
+    ap.add_argument("module", help="e.g. src.orders.handlers")
+    ap.add_argument("--touch", default="",
+                    help="comma-separated clients to build after the import, resources as resource:<name>, "
+                         "e.g. s3,events or resource:dynamodb,events")
+    args = ap.parse_args()
+    sys.path.insert(0, os.getcwd())
+    t = time.perf_counter()
+    importlib.import_module(args.module)
+    record("imports", args.module, time.perf_counter() - t)
+    for name in filter(None, args.touch.split(",")):
+        if name.startswith("resource:"):
+            get_resource(name.removeprefix("resource:"))
+        else:
+            get_client(name)
+    print(json.dumps(profile(), indent=2))
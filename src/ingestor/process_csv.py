@@ -1,29 +1,243 @@
 # src/ingestor/process_csv.py
-import csv, os, json, boto3
-s3 = boto3.client("s3")
-events = boto3.client("events")
+import csv, io, os, json, threading, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from src.common import runtime
+from src.common.publisher import EventPublisher, flush_on_exit
+s3 = runtime.client("s3")
+events = runtime.client("events")   # only built if EVENT_BUS_NAME is set and a row is published
+lambda_client = runtime.client("lambda")   # only built when a file needs another invocation
 
 BUS_NAME = os.getenv("EVENT_BUS_NAME", "")
+PUBLISHER = EventPublisher(events, BUS_NAME, "app.crm")
+# objects larger than this are split into byte ranges parsed in parallel (0 = one sequential stream);
+# splitting assumes no newlines inside quoted fields, which holds for the CRM export
+RANGE_BYTES = int(os.getenv("CSV_RANGE_BYTES", str(64 * 1024 * 1024)))
+WORKERS = int(os.getenv("CSV_WORKERS", "4"))
+CHECKPOINT_PREFIX = os.getenv("CSV_CHECKPOINT_PREFIX", "_checkpoints/")
+CHECKPOINT_EVERY = int(os.getenv("CSV_CHECKPOINT_EVERY", "5000"))   # rows between checkpoint writes
+SAFETY_MS = int(os.getenv("CSV_SAFETY_MS", "20000"))               # stop this long before the Lambda timeout,
+SAFETY_FRACTION = float(os.getenv("CSV_SAFETY_FRACTION", "0.1"))   # capped at this share of the invocation's budget
+MAX_CONTINUATIONS = int(os.getenv("CSV_MAX_CONTINUATIONS", "50"))  # self re-invocations per event before giving up
+HEADER_MAX = 64 * 1024
 
+class Incomplete(RuntimeError):
+    """Stopped before the deadline; the offsets are checkpointed and the next invocation resumes from them."""
+
+def safety_margin(budget_ms, safety_ms=SAFETY_MS, fraction=SAFETY_FRACTION):
+    """ms to keep in reserve: SAFETY_MS, but never more than `fraction` of the budget (15 s timeout -> 1.5 s)."""
+    return min(safety_ms, int(budget_ms * fraction))
+
+class _Raw(io.RawIOBase):
+    """StreamingBody (or any .read(n) object) as a raw stream, so BufferedReader reads it in small chunks."""
+
+    def __init__(self, body):
+        self.body = body
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.body.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        try:
+            self.body.close()
+        finally:
+            super().close()
+
+def _open(client, bucket, key, start=0):
+    obj = client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-")
+    return io.BufferedReader(_Raw(obj["Body"]), buffer_size=256 * 1024)
+
+def read_header(client, bucket, key):
+    """Column names from the first line, plus the byte offset where the data starts."""
+    with _open(client, bucket, key) as f:
+        line = f.readline(HEADER_MAX)
+    fields = next(csv.reader([line.decode("utf-8-sig")]), [])
+    return [c.strip() for c in fields], len(line)
+
+def plan_ranges(data_start, size, range_bytes=RANGE_BYTES):
+    """[(start, end)] byte ranges; each owns the lines that *start* inside it (none for a header-only file)."""
+    if data_start >= size:
+        return []
+    if range_bytes <= 0 or size - data_start <= range_bytes:
+        return [(data_start, size)]
+    return [(s, min(s + range_bytes, size)) for s in range(data_start, size, range_bytes)]
+
+def iter_rows(client, bucket, key, header, start, end, aligned, state):
+    """
+    Yield dict rows for the lines starting in [start, end), decoding line by
+    line so memory stays flat. A range that does not start on a line boundary
+    is read from start-1 and realigned past the first newline; the last line
+    may run past `end`. state["pos"] is the offset after the last yielded row.
+    An empty range yields nothing without a GET (a Range at or past the object size is a 416).
+    """
+    state["pos"] = start
+    if start >= end:
+        return
+    f = _open(client, bucket, key, start if aligned else start - 1)
+    try:
+        pos = start if aligned else start - 1 + len(f.readline())
+        state["pos"] = pos
+
+        def lines():
+            nonlocal pos
+            while pos < end:
+                line = f.readline()
+                if not line:
+                    return
+                pos += len(line)
+                yield line.decode("utf-8")
+
+        for row in csv.DictReader(lines(), fieldnames=header):
+            state["pos"] = pos
+            yield row
+    finally:
+        f.close()
+
+# --- checkpoints: {"etag", "sequencer", "emitted", "done", "ranges": {"start:end": next_offset}} ---
+# kept after completion so a retried multi-record event skips the files it already finished
+def checkpoint_key(key):
+    return f"{CHECKPOINT_PREFIX}{key}.json"
+
+def load_checkpoint(client, bucket, key, etag, sequencer):
+    try:
+        cp = json.loads(client.get_object(Bucket=bucket, Key=checkpoint_key(key))["Body"].read())
+    except Exception as e:   # botocore ClientError, without importing botocore up front
+        if (getattr(e, "response", None) or {}).get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    # a new upload (new etag / event sequencer) starts over
+    return cp if (cp.get("etag"), cp.get("sequencer")) == (etag, sequencer) else None
+
+def save_checkpoint(client, bucket, key, cp):
+    client.put_object(Bucket=bucket, Key=checkpoint_key(key), Body=json.dumps(cp).encode(),
+                      ContentType="application/json")
+
+def emit(row):
+    PUBLISHER.put("CustomerUpserted", {
+        "customer_id":row["customer_id"],
+        "email":row["email"],
+        "segment":row.get("segment","")
+    })
+
+def ingest_object(client, bucket, key, emit=emit, flush=PUBLISHER.flush, time_left_ms=None, sequencer="",
+                  workers=WORKERS, range_bytes=RANGE_BYTES, safety_ms=None):
+    """
+    Stream one CSV object through `emit`, ranges in parallel, checkpointing
+    each range's offset every CHECKPOINT_EVERY rows. `flush` runs before every
+    checkpoint so a saved offset means its rows were published (or counted as
+    lost); rows after the last checkpoint may be emitted again on resume
+    (at-least-once). Raises Incomplete when time_left_ms() drops under
+    safety_ms (default: safety_margin of the time left now); returns the
+    checkpoint (emitted / lost counts).
+    """
+    if time_left_ms and safety_ms is None:
+        safety_ms = safety_margin(time_left_ms())
+    head = client.head_object(Bucket=bucket, Key=key)
+    size, etag = head["ContentLength"], head.get("ETag", "")
+    cp = load_checkpoint(client, bucket, key, etag, sequencer)
+    if cp and cp.get("done"):
+        return cp
+    # an empty object has no header to read: a ranged GET on it is a 416
+    header, data_start = read_header(client, bucket, key) if size else ([], 0)
+    cp = cp or {
+        "etag": etag, "sequencer": sequencer, "emitted": 0, "lost": 0, "done": False,
+        "ranges": {f"{s}:{e}": None for s, e in plan_ranges(data_start, size, range_bytes)},
+    }
+    lock = threading.Lock()
+    since_save = 0
+    stop = threading.Event()
+
+    def checkpoint():
+        # called under `lock`: no row is emitted between the flush and the save
+        report = flush() if flush else None
+        cp["lost"] += len(report["lost"]) if report else 0
+        save_checkpoint(client, bucket, key, cp)
+
+    def run_range(name):
+        nonlocal since_save
+        start, end = map(int, name.split(":"))
+        offset = cp["ranges"][name]
+        if offset is not None and offset >= end:
+            return
+        state = {}
+        rows = iter_rows(client, bucket, key, header, offset if offset is not None else start, end,
+                         aligned=offset is not None or start == data_start, state=state)
+        try:
+            for row in rows:
+                ok = bool(row.get("customer_id") and row.get("email"))
+                if ok:
+                    emit(row)
+                with lock:
+                    cp["emitted"] += ok
+                    cp["ranges"][name] = state["pos"]
+                    since_save += 1
+                    if since_save >= CHECKPOINT_EVERY:
+                        since_save = 0
+                        checkpoint()
+                if time_left_ms and time_left_ms() < safety_ms:
+                    stop.set()
+                if stop.is_set():
+                    return
+            with lock:
+                cp["ranges"][name] = end
+        finally:
+            rows.close()
+
+    names = list(cp["ranges"])
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names)))) as pool:
+        list(pool.map(run_range, names))
+    if stop.is_set():
+        checkpoint()
+        raise Incomplete(f"s3://{bucket}/{key}: checkpointed after {cp['emitted']} rows")
+    cp["done"] = True
+    checkpoint()
+    return cp
+
+def continue_later(event, records, context):
+    """
+    Hand the unfinished records to a fresh async invocation of this function,
+    so a file may take more invocations than Lambda's two async retries.
+    Needs lambda:InvokeFunction on the function itself; False means the caller
+    should fall back to raising (and the async retry).
+    """
+    n = int(event.get("continuation") or 0) + 1
+    arn = getattr(context, "invoked_function_arn", None)
+    if not arn or n > MAX_CONTINUATIONS:
+        return False
+    try:
+        lambda_client.invoke(FunctionName=arn, InvocationType="Event",
+                             Payload=json.dumps({**event, "Records": records, "continuation": n}).encode())
+    except Exception as e:   # botocore ClientError / transport error
+        print(json.dumps({"level": "ERROR", "msg": "re-invoke failed", "error": f"{type(e).__name__}: {e}"}))
+        return False
+    return True
+
+@flush_on_exit(PUBLISHER)
 def handler(event, context):
-    rec = (event.get("Records") or [])[0]["s3"]
-    bucket = rec["bucket"]["name"]; key = rec["object"]["key"]
-    obj = s3.get_object(Bucket=bucket, Key=key)
-    body = obj["Body"].read().decode()
-    count = 0
-    for row in csv.DictReader(body.splitlines()):
-        if not row.get("customer_id") or not row.get("email"):
+    time_left = getattr(context, "get_remaining_time_in_millis", None)
+    # one margin for the whole invocation, from its budget (later files see less time left, not a smaller margin)
+    safety_ms = safety_margin(time_left()) if time_left else None
+    count, lost, files = 0, 0, []
+    records = event.get("Records") or []
+    for i, rec in enumerate(records):
+        bucket = rec["s3"]["bucket"]["name"]
+        key = urllib.parse.unquote_plus(rec["s3"]["object"]["key"])  # keys arrive URL-encoded
+        if key.startswith(CHECKPOINT_PREFIX):
             continue
-        count += 1
-        if BUS_NAME:
-            events.put_events(Entries=[{
-                "Source":"app.crm",
-                "DetailType":"CustomerUpserted",
-                "EventBusName":BUS_NAME,
-                "Detail": json.dumps({
-                    "customer_id":row["customer_id"],
-                    "email":row["email"],
-                    "segment":row.get("segment","")
-                })
-            }])
-    return {"ok": True, "emitted": count}
+        try:
+            cp = ingest_object(s3, bucket, key, time_left_ms=time_left, safety_ms=safety_ms,
+                               sequencer=rec["s3"]["object"].get("sequencer", ""))
+        except Incomplete as e:
+            if not continue_later(event, records[i:], context):
+                raise
+            print(json.dumps({"msg": "continuing in a new invocation", "detail": str(e),
+                              "continuation": int(event.get("continuation") or 0) + 1}))
+            return {"ok": lost == 0, "emitted": count, "lost": lost, "files": files, "continued": key}
+        count += cp["emitted"]
+        lost += cp["lost"]
+        files.append({"key": key, "emitted": cp["emitted"], "lost": cp["lost"]})
+    return {"ok": lost == 0, "emitted": count, "lost": lost, "files": files}
@@ -1,45 +1,120 @@
 # src/inventory/handlers.py
-import os, json, time, boto3
-ddb = boto3.client("dynamodb")
+import os, json, time
+from src.common import runtime
+from src.common.publisher import EventPublisher, flush_on_exit
+ddb = runtime.client("dynamodb")
 TABLE = os.getenv("INVENTORY_TABLE", "")
 BUS   = os.getenv("EVENT_BUS_NAME", "")
-events = boto3.client("events")
+events = runtime.client("events")
+PUBLISHER = EventPublisher(events, BUS, "app.inventory")
 
+MAX_TXN_ITEMS = 100   # TransactWriteItems limit; one slot goes to the idempotency marker
+READ_ATTEMPTS = 3     # batch_get_item calls per remaining-stock read (UnprocessedKeys are retried)
+
+def _marker(req):
+    return {"Put": {
+        "TableName": TABLE,
+        "Item": {"sku":{"S":f"idem#{req}"}, "ttl":{"N": str(int(time.time())+86400)}},
+        "ConditionExpression": "attribute_not_exists(sku)",
+    }}
+
+def _decrement(sku, qty):
+    return {"Update": {
+        "TableName": TABLE,
+        "Key": {"sku":{"S":sku}},
+        "UpdateExpression": "SET qty = qty - :q",
+        "ConditionExpression": "qty >= :q",
+        "ExpressionAttributeValues": {":q":{"N": str(qty)}},
+    }}
+
+def _transact(req, basket):
+    """
+    Idempotency marker + every decrement in one TransactWriteItems, so either
+    all of it lands or none of it does. Returns None on success, else the
+    (statusCode, body) to answer with.
+    """
+    try:
+        ddb.transact_write_items(TransactItems=[_marker(req)] + [_decrement(sku, qty) for sku, qty in basket])
+    except ddb.exceptions.TransactionCanceledException as e:
+        reasons = [r.get("Code") for r in e.response.get("CancellationReasons", [])]
+        if reasons and reasons[0] == "ConditionalCheckFailed":
+            return 200, {"status":"duplicate","request_id":req}
+        short = [sku for (sku, _), code in zip(basket, reasons[1:]) if code == "ConditionalCheckFailed"]
+        if short:
+            return 409, {"error":"insufficient","skus":short}
+        return 409, {"error":"conflict, retry","reasons":reasons}
+    return None
+
+def _remaining(skus):
+    """
+    Post-write snapshot of the stock (transactions can't return ALL_NEW): a
+    consistent read after the commit, so a reservation landing in between is
+    already subtracted - it is not the value this reservation produced. Costs a
+    second round trip, which callers that don't need it skip with
+    "include_remaining": false. Keys still unprocessed after READ_ATTEMPTS calls
+    come back as None.
+    """
+    got, request = {}, {TABLE: {"Keys": [{"sku":{"S":sku}} for sku in skus],
+                                "ProjectionExpression": "sku, qty", "ConsistentRead": True}}
+    for attempt in range(READ_ATTEMPTS):
+        res = ddb.batch_get_item(RequestItems=request)
+        got.update({it["sku"]["S"]: int(it["qty"]["N"]) for it in res.get("Responses", {}).get(TABLE, [])})
+        request = res.get("UnprocessedKeys") or {}
+        if not request:
+            break
+        time.sleep(0.05 * 2 ** attempt)
+    return {sku: got.get(sku) for sku in skus}
+
+@flush_on_exit(PUBLISHER)
 def reserve(event, context):
+    """
+    Reserve qty of one sku: {"sku", "qty", "request_id"}; one TransactWriteItems.
+    The response and the InventoryReserved event carry "remaining", the stock
+    left, read afterwards (see _remaining); "include_remaining": false skips it.
+    """
     body = json.loads(event.get("body") or "{}")
     sku = body.get("sku"); qty = int(body.get("qty", 0)); req = body.get("request_id")
     if not sku or qty <= 0 or not req:
         return {"statusCode":400,"body":json.dumps({"error":"sku, qty>0, request_id required"})}
 
-    # Idempotency marker: put if not exists
-    try:
-        ddb.put_item(
-          TableName=TABLE,
-          Item={"sku":{"S":f"idem#{req}"}, "ttl":{"N": str(int(time.time())+86400)}},
-          ConditionExpression="attribute_not_exists(sku)"
-        )
-    except ddb.exceptions.ConditionalCheckFailedException:
-        return {"statusCode":200,"body":json.dumps({"status":"duplicate","request_id":req})}
-
-    # Decrement stock with concurrency guard
-    try:
-        resp = ddb.update_item(
-          TableName=TABLE,
-          Key={"sku":{"S":sku}},
-          UpdateExpression="SET qty = qty - :q",
-          ConditionExpression="qty >= :q",
-          ExpressionAttributeValues={":q":{"N": str(qty)}},
-          ReturnValues="ALL_NEW"
-        )
-    except ddb.exceptions.ConditionalCheckFailedException:
-        return {"statusCode":409,"body":json.dumps({"error":"insufficient"})}
-
-    remaining = int(resp["Attributes"]["qty"]["N"])
-    if BUS:
-        events.put_events(Entries=[{
-          "Source":"app.inventory",
-          "DetailType":"InventoryReserved",
-          "EventBusName":BUS,
-          "Detail": json.dumps({"sku":sku,"qty":qty,"remaining":remaining,"request_id":req})
-        }])
-    return {"statusCode":200,"body":json.dumps({"remaining":remaining})}
+    failed = _transact(req, [(sku, qty)])
+    if failed:
+        status, out = failed
+        return {"statusCode":status,"body":json.dumps({k: v for k, v in out.items() if k != "skus"})}
+
+    detail = {"sku":sku,"qty":qty,"request_id":req}
+    if body.get("include_remaining", True):
+        detail["remaining"] = _remaining([sku])[sku]
+    PUBLISHER.put("InventoryReserved", detail)
+    return {"statusCode":200,"body":json.dumps({"status":"reserved", **detail})}
+
+@flush_on_exit(PUBLISHER)
+def reserve_many(event, context):
+    """Reserve a whole basket all-or-nothing: {"request_id", "items": [{"sku", "qty"}, ...]}; "remaining" as in reserve."""
+    body = json.loads(event.get("body") or "{}")
+    req = body.get("request_id"); items = body.get("items") or []
+    basket = {}
+    for it in items:
+        sku = it.get("sku"); qty = int(it.get("qty", 0))
+        if not sku or qty <= 0:
+            return {"statusCode":400,"body":json.dumps({"error":"each item needs sku and qty>0"})}
+        basket[sku] = basket.get(sku, 0) + qty   # one transaction can touch an item only once
+    if not req or not basket:
+        return {"statusCode":400,"body":json.dumps({"error":"request_id and items required"})}
+    if len(basket) > MAX_TXN_ITEMS - 1:
+        return {"statusCode":400,"body":json.dumps({"error":f"at most {MAX_TXN_ITEMS - 1} distinct skus per request"})}
+
+    basket = sorted(basket.items())
+    failed = _transact(req, basket)
+    if failed:
+        status, out = failed
+        return {"statusCode":status,"body":json.dumps(out)}
+
+    reserved = [{"sku":sku,"qty":qty} for sku, qty in basket]
+    if body.get("include_remaining", True):
+        remaining = _remaining([sku for sku, _ in basket])
+        for r in reserved:
+            r["remaining"] = remaining[r["sku"]]
+    for r in reserved:
+        PUBLISHER.put("InventoryReserved", {**r, "request_id":req})
+    return {"statusCode":200,"body":json.dumps({"reserved":reserved})}
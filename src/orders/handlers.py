@@ -1,37 +1,185 @@
 # src/orders/handlers.py
-import os, json, time, uuid, boto3
-dynamodb = boto3.resource("dynamodb")
-events   = boto3.client("events")
+import os, json, time, uuid, random, threading
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from src.common import runtime
+from src.common.publisher import EventPublisher, flush_on_exit
+dynamodb = runtime.resource("dynamodb")
+events   = runtime.client("events")
 
 TABLE_NAME = os.getenv("ORDERS_TABLE", "")
 BUS_NAME   = os.getenv("EVENT_BUS_NAME", "")
+PUBLISHER  = EventPublisher(events, BUS_NAME, "app.orders")
+TABLE      = runtime.lazy(lambda: dynamodb.Table(TABLE_NAME))   # built once per container, not per request
 
-def create_order(event, context):
-    body = json.loads(event.get("body") or "{}")
+WRITE_CHUNK = 25     # BatchWriteItem limit
+READ_CHUNK  = 100    # BatchGetItem limit
+MAX_BULK    = int(os.getenv("ORDERS_MAX_BULK", "1000"))
+BATCH_RETRIES = int(os.getenv("ORDERS_BATCH_RETRIES", "5"))
+CACHE_SIZE  = int(os.getenv("ORDERS_CACHE_SIZE", "10000"))
+CACHE_TTL_S = float(os.getenv("ORDERS_CACHE_TTL_S", "3600"))
+IMMUTABLE   = ("order_id", "total", "created_at")   # status changes, so it is never served from the cache
+
+def _num(v):
+    """json.dumps default for DynamoDB numbers (Decimal)."""
+    if isinstance(v, Decimal):
+        return int(v) if v == v.to_integral_value() else float(v)
+    raise TypeError(f"{type(v).__name__} is not JSON serializable")
+
+def _dumps(v):
+    return json.dumps(v, default=_num)
+
+class _TTLCache:
+    """Per-container LRU of immutable order fields; entries expire after CACHE_TTL_S."""
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL_S):
+        self.size, self.ttl = size, ttl
+        self._d = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._d.get(key)
+            if hit is None:
+                return None
+            if hit[0] < time.monotonic():
+                del self._d[key]
+                return None
+            self._d.move_to_end(key)
+            return hit[1]
+
+    def put(self, item):
+        with self._lock:
+            self._d[item["order_id"]] = (time.monotonic() + self.ttl, {k: item[k] for k in IMMUTABLE if k in item})
+            self._d.move_to_end(item["order_id"])
+            while len(self._d) > self.size:
+                self._d.popitem(last=False)
+
+CACHE = _TTLCache()
+
+def _new_order(body):
+    """Item for one order body, or None if its total is missing or not a number."""
     if "total" not in body:
-        return {"statusCode":400,"body":json.dumps({"error":"total required"})}
-    order_id = str(uuid.uuid4())
-    item = {
-        "order_id": order_id,
+        return None
+    try:
+        total = Decimal(str(body["total"]))   # boto3 rejects float; Decimal keeps the exact amount
+    except (InvalidOperation, ValueError):
+        return None
+    if not total.is_finite():
+        return None
+    return {
+        "order_id": str(uuid.uuid4()),
         "status": "CREATED",
-        "total": float(body.get("total", 0.0)),
+        "total": total,
         "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
     }
-    dynamodb.Table(TABLE_NAME).put_item(Item=item)
-    if BUS_NAME:
-        events.put_events(Entries=[{
-            "Source":"app.orders",
-            "DetailType":"ReceiptGenerated",
-            "Detail":json.dumps({"order_id":order_id,"total":item["total"]}),
-            "EventBusName": BUS_NAME
-        }])
-    return {"statusCode":201,"body":json.dumps({"order_id":order_id})}
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+def _batch_write(items):
+    """
+    BatchWriteItem in chunks of 25, retrying UnprocessedItems; returns the items
+    that never got written. A chunk whose call fails counts as failed on its
+    own, so the chunks already written are still reported (and get events).
+    """
+    failed = []
+    for i in range(0, len(items), WRITE_CHUNK):
+        requests = [{"PutRequest": {"Item": it}} for it in items[i:i + WRITE_CHUNK]]
+        try:
+            for attempt in range(BATCH_RETRIES + 1):
+                res = dynamodb.batch_write_item(RequestItems={TABLE_NAME: requests})
+                requests = res.get("UnprocessedItems", {}).get(TABLE_NAME, [])
+                if not requests or attempt == BATCH_RETRIES:
+                    break
+                _backoff(attempt)
+        except Exception as e:   # botocore ClientError / transport error: this chunk's pending writes failed
+            print(json.dumps({"level": "ERROR", "msg": "batch write failed", "items": len(requests),
+                              "error": f"{type(e).__name__}: {e}"}))
+        failed += [r["PutRequest"]["Item"] for r in requests]
+    return failed
+
+def _batch_get(order_ids):
+    """BatchGetItem in chunks of 100, retrying UnprocessedKeys; returns {order_id: item} for the ones found."""
+    found = {}
+    for i in range(0, len(order_ids), READ_CHUNK):
+        request = {TABLE_NAME: {"Keys": [{"order_id": oid} for oid in order_ids[i:i + READ_CHUNK]]}}
+        for attempt in range(BATCH_RETRIES + 1):
+            res = dynamodb.batch_get_item(RequestItems=request)
+            for item in res.get("Responses", {}).get(TABLE_NAME, []):
+                found[item["order_id"]] = item
+            request = res.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            if attempt == BATCH_RETRIES:
+                raise RuntimeError(f"{len(request[TABLE_NAME]['Keys'])} order keys still unprocessed")
+            _backoff(attempt)
+    return found
+
+@flush_on_exit(PUBLISHER)
+def create_order(event, context):
+    body = json.loads(event.get("body") or "{}")
+    if "total" not in body:
+        return {"statusCode":400,"body":json.dumps({"error":"total required"})}
+    item = _new_order(body)
+    if item is None:
+        return {"statusCode":400,"body":json.dumps({"error":"total must be a number"})}
+    TABLE.put_item(Item=item)
+    CACHE.put(item)
+    PUBLISHER.put("ReceiptGenerated", _dumps({"order_id":item["order_id"],"total":item["total"]}))
+    return {"statusCode":201,"body":json.dumps({"order_id":item["order_id"]})}
+
+@flush_on_exit(PUBLISHER)
+def create_orders(event, context):
+    """Bulk create: {"orders": [{"total": ...}, ...]} -> order ids in request order (null where the write failed)."""
+    orders = json.loads(event.get("body") or "{}").get("orders") or []
+    if not orders or len(orders) > MAX_BULK:
+        return {"statusCode":400,"body":json.dumps({"error":f"orders must hold 1..{MAX_BULK} orders"})}
+    items = [_new_order(o) for o in orders]
+    bad = [i for i, it in enumerate(items) if it is None]
+    if bad:
+        return {"statusCode":400,"body":json.dumps({"error":"total required (a number)","indexes":bad})}
+    lost = {it["order_id"] for it in _batch_write(items)}
+    for it in items:
+        if it["order_id"] not in lost:
+            CACHE.put(it)
+            PUBLISHER.put("ReceiptGenerated", _dumps({"order_id":it["order_id"],"total":it["total"]}))
+    ids = [None if it["order_id"] in lost else it["order_id"] for it in items]
+    return {"statusCode":207 if lost else 201,"body":json.dumps({"order_ids":ids,"failed":len(lost)})}
 
 def get_order(event, context):
     order_id = (event.get("pathParameters") or {}).get("order_id")
     if not order_id:
         return {"statusCode":400,"body":"order_id required"}
-    res = dynamodb.Table(TABLE_NAME).get_item(Key={"order_id": order_id})
+    res = TABLE.get_item(Key={"order_id": order_id})
     if "Item" not in res:
         return {"statusCode":404,"body":"Not found"}
-    return {"statusCode":200,"body":json.dumps(res["Item"])}
+    CACHE.put(res["Item"])
+    return {"statusCode":200,"body":_dumps(res["Item"])}
+
+def get_orders(event, context):
+    """
+    Bulk get: ?ids=a,b,c (or {"order_ids": [...]}) and optional ?fields=. When
+    only immutable fields are asked for, cached orders cost no DynamoDB read;
+    otherwise every order is read (100 per BatchGetItem) so status is current.
+    """
+    qs = event.get("queryStringParameters") or {}
+    ids = [i for i in (qs.get("ids") or "").split(",") if i] or json.loads(event.get("body") or "{}").get("order_ids") or []
+    ids = list(dict.fromkeys(ids))
+    if not ids or len(ids) > MAX_BULK:
+        return {"statusCode":400,"body":json.dumps({"error":f"1..{MAX_BULK} order ids required"})}
+    fields = [f for f in (qs.get("fields") or "").split(",") if f]
+    cacheable = bool(fields) and set(fields) <= set(IMMUTABLE)
+
+    orders = {}
+    if cacheable:
+        for oid in ids:
+            hit = CACHE.get(oid)
+            if hit is not None:
+                orders[oid] = hit
+    fetched = _batch_get([oid for oid in ids if oid not in orders])
+    for item in fetched.values():
+        CACHE.put(item)
+    orders.update(fetched)
+    out = [{k: v for k, v in orders[oid].items() if not fields or k in fields} for oid in ids if oid in orders]
+    return {"statusCode":200,"body":_dumps({"orders":out,"missing":[oid for oid in ids if oid not in orders]})}
@@ -1,6 +1,86 @@
 # src/receipts/worker.py
-import json, os
+import json, os, time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from src.common import runtime
+s3 = runtime.client("s3")
+
+BUCKET  = os.getenv("RECEIPTS_BUCKET", "")
+PREFIX  = os.getenv("RECEIPTS_PREFIX", "receipts/")
+WORKERS = int(os.getenv("RECEIPT_WORKERS", "16"))
+POOL    = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="receipt")   # reused across invocations
+# S3 rejections of the request itself: redelivering the same message fails the same way
+PERMANENT_S3 = {"KeyTooLongError", "InvalidArgument", "InvalidObjectName"}
+
+def parse(record):
+    """ReceiptGenerated detail from one SQS record (the body is the EventBridge event, or the bare detail)."""
+    body = json.loads(record["body"])
+    detail = body.get("detail", body) if isinstance(body, dict) else None
+    if not isinstance(detail, dict) or not detail.get("order_id"):
+        raise ValueError("no order_id in message")
+    return detail
+
+def render(detail):
+    try:
+        total = Decimal(str(detail.get("total", 0))).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError(f"bad total {detail.get('total')!r}")
+    return (f"RECEIPT\norder: {detail['order_id']}\ntotal: {total}\n"
+            f"issued: {time.strftime('%Y-%m-%dT%H:%M:%SZ')}\n")
+
+def store(order_id, text):
+    # key is the order id, so a redelivered or duplicate message overwrites instead of adding a receipt
+    s3.put_object(Bucket=BUCKET, Key=f"{PREFIX}{order_id}.txt", Body=text.encode(), ContentType="text/plain")
+
+def is_permanent(e):
+    """True for errors a redelivery would hit again: a bad message (parse / render) or S3 rejecting the request."""
+    if isinstance(e, (ValueError, KeyError, TypeError)) or type(e).__name__ == "ParamValidationError":
+        return True
+    # botocore ClientError, without importing botocore up front
+    return (getattr(e, "response", None) or {}).get("Error", {}).get("Code") in PERMANENT_S3
+
+def process_batch(records, store=store, pool=POOL):
+    """
+    Render and store one receipt per distinct order_id on the thread pool.
+    Returns the messageIds to redeliver: every message of an order whose
+    receipt hit a transient store error. Permanent failures (unparseable
+    message, bad total, a request S3 rejects) are logged and dropped, since
+    redelivering them would only fail again until the DLQ.
+    """
+    failed, errors, dropped, by_order = [], [], [], {}
+    for rec in records:
+        try:
+            detail = parse(rec)
+        except (ValueError, KeyError, TypeError) as e:
+            dropped.append({"messageIds": [rec.get("messageId")], "error": f"bad message: {e}"})
+            continue
+        by_order.setdefault(detail["order_id"], (detail, []))[1].append(rec["messageId"])
+
+    def one(order_id, detail):
+        store(order_id, render(detail))
+
+    futures = {pool.submit(one, oid, detail): ids for oid, (detail, ids) in by_order.items()}
+    for fut, ids in futures.items():
+        try:
+            fut.result()
+        except Exception as e:
+            if is_permanent(e):
+                dropped.append({"messageIds": ids, "error": f"{type(e).__name__}: {e}"})
+                continue
+            errors.append({"messageIds": ids, "error": f"{type(e).__name__}: {e}"})
+            failed += ids
+    if dropped:
+        print(json.dumps({"level": "ERROR", "msg": "receipts dropped", "messages": sum(len(d["messageIds"]) for d in dropped),
+                          "sample": dropped[:10]}))
+    if errors:
+        print(json.dumps({"level": "ERROR", "msg": "receipts failed", "messages": len(failed), "sample": errors[:10]}))
+    return failed
+
 def handler(event, context):
-    # EventBridge batch; no-op mock for demo.
-    _ = os.getenv("EVENT_BUS_NAME", "")
-    return {"ok": True, "records": len(event.get("Records", [])) if isinstance(event.get("Records"), list) else 0}
\ No newline at end of file
+    if not BUCKET:
+        # a misconfigured deploy fails the whole invocation (the batch is redelivered once it is fixed)
+        # instead of every put failing validation
+        raise RuntimeError("RECEIPTS_BUCKET is not set")
+    # SQS batch; needs ReportBatchItemFailures on the event source mapping so only these are redelivered
+    failed = process_batch(event.get("Records") or [])
+    return {"batchItemFailures": [{"itemIdentifier": mid} for mid in failed if mid]}
@@ -0,0 +1,163 @@
+"""
+Declarative stage graph for multi-step pipelines (BRD -> architecture -> code -> judge).
+
+Each Stage names the artifacts it reads (`inputs`, paths relative to the run
+dir that other stages produce) and writes (`outputs`), plus the files outside
+the run dir (`sources`: templates, schema, ...) and settings (`params`) its
+result depends on. Stages run on a thread pool and a stage is started the
+moment the last of its inputs lands, so independent stages overlap.
+
+Before a stage runs, its key (sha256 over inputs, sources and params) is
+looked up in runs/.stage_cache.json; on a hit the outputs of the earlier run
+are copied in and the stage is skipped. Only successful stages are recorded,
+so editing one late-stage template re-runs that stage (and whatever reads its
+outputs) and reuses everything upstream. With --resume a stage whose outputs
+are already in the run dir is skipped only if its `done` check (when given)
+accepts them, so an output that failed validation is produced again.
+"""
+import os, json, hashlib, pathlib, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+import artifact_store
+
+STAGE_CACHE_NAME = ".stage_cache.json"
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    run: object                      # () -> (row, ok); ok=False (failed or invalid output) is not cached
+    inputs: tuple = ()               # artifacts produced by other stages
+    outputs: tuple = ()
+    sources: tuple = ()              # pathlib.Paths outside the run dir
+    params: str = ""
+    done: object = None              # () -> bool: are the outputs already present usable? (default: they exist)
+
+class StageError(ValueError):
+    """Graph is not runnable: duplicate outputs, an input nobody produces, or a cycle."""
+
+def _file_digest(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _has(run_dir: pathlib.Path, art: str) -> bool:
+    # artifacts may be loose files or packed into runs/.blobs (artifact_store)
+    path = run_dir / art
+    return artifact_store.exists(path.parent, path.name)
+
+def stage_key(stage: Stage, out_dir: pathlib.Path) -> str:
+    """Content hash of everything the stage reads; equal keys mean the stage would redo the same work."""
+    h = hashlib.sha256(json.dumps([stage.name, stage.params]).encode())
+    for art in sorted(stage.inputs):
+        path = out_dir / art
+        h.update(f"\0in:{art}:{artifact_store.digest(path.parent, path.name)}".encode())
+    for src in sorted(map(str, stage.sources)):
+        h.update(f"\0src:{pathlib.Path(src).name}:{_file_digest(pathlib.Path(src))}".encode())
+    return h.hexdigest()
+
+class StageCache:
+    """stage name -> {key: run dir (relative to the cache file) whose outputs were produced from that key}."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self.entries = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def lookup(self, stage: Stage, key: str) -> pathlib.Path | None:
+        rel = self.entries.get(stage.name, {}).get(key)
+        if rel is None:
+            return None
+        src = self.path.parent / rel
+        return src if all(_has(src, art) for art in stage.outputs) else None
+
+    def store(self, stage: Stage, key: str, out_dir: pathlib.Path) -> None:
+        with self._lock:
+            self.entries.setdefault(stage.name, {})[key] = os.path.relpath(out_dir, self.path.parent)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.entries, indent=2, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+def check_graph(stages: list[Stage], out_dir: pathlib.Path) -> dict[str, list[str]]:
+    """Validate the graph; returns stage name -> names of the stages it waits for."""
+    producer = {}
+    for s in stages:
+        for art in s.outputs:
+            if art in producer:
+                raise StageError(f"{art} is written by both {producer[art]} and {s.name}")
+            producer[art] = s.name
+    deps = {}
+    for s in stages:
+        missing = [a for a in s.inputs if a not in producer and not _has(out_dir, a)]
+        if missing:
+            raise StageError(f"{s.name}: no stage produces {', '.join(missing)}")
+        deps[s.name] = sorted({producer[a] for a in s.inputs if a in producer})
+    seen, done = set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name in seen:
+            raise StageError("cycle: " + " -> ".join(path + [name]))
+        seen.add(name)
+        for d in deps[name]:
+            visit(d, path + [name])
+        done.add(name)
+
+    for s in stages:
+        visit(s.name, [])
+    return deps
+
+def run_graph(stages: list[Stage], out_dir: pathlib.Path, cache: StageCache | None = None,
+              max_workers: int = 4, resume: bool = False):
+    """
+    Run the graph, yielding (stage, status, row) as each stage settles.
+    status: ran | reused | done (--resume: outputs already here) | blocked (an input never landed).
+    row is the stage's own result for ran, the source run dir for reused, otherwise a note.
+    A stage that raises aborts the whole graph (like prompt_pool.run_pool).
+    """
+    deps = check_graph(stages, out_dir)
+    by_name = {s.name: s for s in stages}
+    waiting = dict(deps)
+    settled: set[str] = set()
+
+    def execute(stage: Stage):
+        if (resume and stage.outputs and all(_has(out_dir, a) for a in stage.outputs)
+                and (stage.done is None or stage.done())):
+            return "done", "outputs already present"
+        if any(not _has(out_dir, a) for a in stage.inputs):
+            return "blocked", "missing " + ", ".join(a for a in stage.inputs if not _has(out_dir, a))
+        key = stage_key(stage, out_dir)
+        src = cache.lookup(stage, key) if cache else None
+        if src is not None:
+            if src.resolve() != out_dir.resolve():
+                for art in stage.outputs:
+                    (out_dir / art).parent.mkdir(parents=True, exist_ok=True)
+                    (out_dir / art).write_bytes(artifact_store.read_bytes((src / art).parent, (src / art).name))
+            return "reused", src
+        row, ok = stage.run()
+        if ok and cache and all(_has(out_dir, a) for a in stage.outputs):
+            cache.store(stage, key, out_dir)
+        return "ran", row
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="stage")
+    running = {}
+    try:
+        while waiting or running:
+            for name in [n for n, d in waiting.items() if all(x in settled for x in d)]:
+                del waiting[name]
+                running[pool.submit(execute, by_name[name])] = by_name[name]
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage = running.pop(fut)
+                status, row = fut.result()
+                settled.add(stage.name)
+                yield stage, status, row
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
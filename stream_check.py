@@ -0,0 +1,179 @@
+import json, pathlib, time
+import xml.etree.ElementTree as ET
+
+from validate_xml import REQUIRED as XML_REQUIRED
+
+ROOT = pathlib.Path(__file__).resolve().parent
+FINAL_SCHEMA_PATH = ROOT / "final_schema.json"
+
+class JsonPrefixChecker:
+    """
+    Incremental structural check of a JSON document as it streams in.
+
+    Tracks strings/escapes and the bracket stack character by character, and
+    records top-level object keys. Reports an error as soon as the prefix can
+    no longer become a valid bundle: wrong opening character, mismatched
+    bracket, a top-level key the schema forbids, or a closed top-level object
+    that is missing required keys. A leading ```json fence is tolerated.
+    `complete` turns True once the top-level object has closed.
+    """
+
+    def __init__(self, required=(), allowed=None):
+        self.required = set(required)
+        self.allowed = set(allowed) if allowed is not None else None
+        self.keys: list[str] = []
+        self.error: str | None = None
+        self.complete = False
+        self._stack: list[str] = []
+        self._started = False
+        self._fence = ""            # leading text before the first '{' (fence / whitespace)
+        self._in_str = False
+        self._esc = False
+        self._str_buf: list[str] | None = None
+        self._expect_key = False    # next string at depth 1 is a key
+
+    @classmethod
+    def for_final_schema(cls, path: pathlib.Path = FINAL_SCHEMA_PATH) -> "JsonPrefixChecker":
+        try:
+            schema = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            return cls()
+        allowed = list(schema.get("properties", {})) if schema.get("additionalProperties") is False else None
+        return cls(schema.get("required", []), allowed)
+
+    def feed(self, chunk: str) -> str | None:
+        if self.error or self.complete:
+            return self.error
+        for ch in chunk:
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append("{")
+                    self._expect_key = True
+                else:
+                    self._fence += ch
+                    if not "```json".startswith(self._fence.strip()):
+                        return self._fail(f"output must start with '{{', got {self._fence.strip()[:16]!r}")
+                continue
+            if self._in_str:
+                if self._str_buf is not None:
+                    self._str_buf.append(ch)
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    if self._str_buf is not None:
+                        self._on_key("".join(self._str_buf[:-1]))
+                        self._str_buf = None
+                        if self.error:
+                            return self.error
+                continue
+            if ch == '"':
+                self._in_str = True
+                if len(self._stack) == 1 and self._expect_key:
+                    self._str_buf = []
+                    self._expect_key = False
+            elif ch in "{[":
+                self._stack.append(ch)
+            elif ch in "}]":
+                opener = "{" if ch == "}" else "["
+                if not self._stack or self._stack[-1] != opener:
+                    return self._fail(f"mismatched {ch!r}")
+                self._stack.pop()
+                if not self._stack:
+                    missing = sorted(self.required - set(self.keys))
+                    if missing:
+                        return self._fail(f"top-level object closed without: {', '.join(missing)}")
+                    self.complete = True
+                    return None
+            elif ch == "," and len(self._stack) == 1:
+                self._expect_key = True
+        return None
+
+    def _on_key(self, key: str) -> None:
+        self.keys.append(key)
+        if self.allowed is not None and key not in self.allowed:
+            self._fail(f"top-level key not allowed by schema: {key!r}")
+
+    def _fail(self, msg: str) -> str:
+        self.error = msg
+        return msg
+
+class XmlPrefixChecker:
+    """
+    Incremental XML check built on ElementTree's pull parser. Any parse error
+    aborts; when the root element closes, every validate_xml.REQUIRED section
+    must have been seen. Text before the first '<' (fences, stray prose) is dropped.
+    """
+
+    def __init__(self, required=XML_REQUIRED):
+        self.required = set(required)
+        self.seen: set[str] = set()
+        self.error: str | None = None
+        self.complete = False
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._started = False
+        self._depth = 0
+
+    def feed(self, chunk: str) -> str | None:
+        if self.error or self.complete:
+            return self.error
+        if not self._started:
+            i = chunk.find("<")
+            if i < 0:
+                return None
+            chunk, self._started = chunk[i:], True
+        try:
+            self._parser.feed(chunk)
+            for event, el in self._parser.read_events():
+                if event == "start":
+                    self._depth += 1
+                    self.seen.add(el.tag)
+                else:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        missing = [t for t in XML_REQUIRED if t in self.required and t not in self.seen]
+                        if missing:
+                            self.error = f"Missing sections: {', '.join(missing)}"
+                        else:
+                            self.complete = True
+                        return self.error
+        except ET.ParseError as e:
+            self.error = f"ParseError: {e}"
+        return self.error
+
+def stream_message(client, checker=None, **kwargs) -> dict:
+    """
+    Run one messages.stream call, feeding every text delta to `checker`.
+    Stops reading (closing the connection) as soon as the checker reports an
+    error. Returns a record shaped like response_cache.record_from_message plus
+    request_id, ttft_s / ttc_s timings and, on early abort, `aborted` with the reason.
+    """
+    t0 = time.time()
+    ttft = None
+    parts, aborted = [], None
+    with client.messages.stream(**kwargs) as stream:
+        request_id = stream.response.headers.get("request-id")
+        for text in stream.text_stream:
+            if ttft is None:
+                ttft = time.time() - t0
+            parts.append(text)
+            if checker is not None and checker.feed(text):
+                aborted = checker.error
+                break
+        msg = None if aborted else stream.get_final_message()
+    usage = getattr(msg, "usage", None)
+    record = {
+        "text": "".join(parts),
+        "stop_reason": getattr(msg, "stop_reason", None) if msg else "aborted",
+        "model": getattr(msg, "model", None) if msg else kwargs.get("model"),
+        "usage": usage.model_dump() if hasattr(usage, "model_dump") else {},
+        "ttft_s": round(ttft, 2) if ttft is not None else None,
+        "ttc_s": round(time.time() - t0, 2),
+        "request_id": request_id,
+    }
+    if aborted:
+        record["aborted"] = aborted
+    return record
@@ -0,0 +1,262 @@
+import os, json, hashlib, pathlib, threading, time, secrets
+from contextlib import contextmanager
+import artifact_store
+
+# Per-run files written next to the outputs
+SPANS_NAME = "telemetry.jsonl"
+SUMMARY_NAME = "telemetry_summary.json"
+
+# Optional OTLP/HTTP (JSON) export, e.g. OTEL_EXPORTER_OTLP_ENDPOINT=http://localhost:4318
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+
+# USD per million tokens: (input, output). Cache writes bill at 1.25x input, cache reads at 0.1x.
+# Matched by model-name prefix; override with LLM_PRICES_JSON='{"claude-x": [in, out]}'.
+PRICES = {
+    "claude-opus-4-5": (5.0, 25.0),
+    "claude-opus-4": (15.0, 75.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-haiku-4-5": (1.0, 5.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+}
+PRICES.update({k: tuple(v) for k, v in json.loads(os.environ.get("LLM_PRICES_JSON", "{}")).items()})
+
+def estimate_cost(model: str | None, usage: dict | None) -> float | None:
+    """Estimated USD for one call from its usage block; None when the model has no known price."""
+    price = next((p for prefix, p in sorted(PRICES.items(), key=lambda kv: -len(kv[0]))
+                  if (model or "").startswith(prefix)), None)
+    if price is None:
+        return None
+    usage = usage or {}
+    pin, pout = price
+    tokens = ((usage.get("input_tokens") or 0) * pin
+              + (usage.get("cache_creation_input_tokens") or 0) * pin * 1.25
+              + (usage.get("cache_read_input_tokens") or 0) * pin * 0.1
+              + (usage.get("output_tokens") or 0) * pout)
+    return round(tokens / 1_000_000, 6)
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile (q in 0..100)."""
+    if not values:
+        return None
+    s = sorted(values)
+    return s[max(0, min(len(s) - 1, int(-(-q * len(s) // 100)) - 1))]
+
+class Span:
+    """One model call. Attributes follow the OpenTelemetry gen_ai.* names where one exists."""
+
+    def __init__(self, trace_id: str, component: str, label: str, model: str):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.component = component
+        self.label = label
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self.attrs = {"gen_ai.system": "anthropic", "gen_ai.request.model": model}
+
+    def record(self, record: dict, cache: str = "off") -> None:
+        """Copy what a response record knows about the call (usage, stop reason, ids, timings)."""
+        usage = record.get("usage") or {}
+        model = record.get("model") or self.attrs["gen_ai.request.model"]
+        cost = estimate_cost(model, usage)
+        if cost and record.get("batch_id"):
+            cost = round(cost * 0.5, 6)  # Message Batches bill at half price
+        self.attrs.update({
+            "gen_ai.response.model": model,
+            "gen_ai.response.finish_reasons": record.get("stop_reason"),
+            "gen_ai.usage.input_tokens": usage.get("input_tokens"),
+            "gen_ai.usage.output_tokens": usage.get("output_tokens"),
+            "llm.usage.cache_read_tokens": usage.get("cache_read_input_tokens"),
+            "llm.usage.cache_write_tokens": usage.get("cache_creation_input_tokens"),
+            "llm.request_id": record.get("request_id"),
+            "llm.retries": record.get("retries"),
+            "llm.ttft_s": record.get("ttft_s"),
+            # the API call alone vs. rate-limit queueing, backoff and failed attempts (Scheduler.call)
+            "llm.api_s": None if cache == "hit" else record.get("api_s"),
+            "llm.queue_s": None if cache == "hit" else record.get("queue_s"),
+            "llm.aborted": record.get("aborted"),
+            "llm.response_cache": cache,
+            "llm.batch_id": record.get("batch_id"),
+            "llm.bytes": len(record.get("text") or ""),
+            # a response-cache hit made no API call and cost nothing
+            "llm.cost_usd": 0.0 if cache == "hit" else cost,
+        })
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "name": "messages.create",
+            "component": self.component,
+            "prompt": self.label,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_s": round((self.end_ns - self.start_ns) / 1e9, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": {k: v for k, v in self.attrs.items() if v is not None},
+        }
+
+class Telemetry:
+    """
+    Collects one span per model call for a component (runner or judge) and
+    appends each to <run_dir>/telemetry.jsonl as it finishes. All components
+    working on the same run share a trace id derived from the run folder name.
+    """
+
+    def __init__(self, run_dir: pathlib.Path, component: str):
+        self.run_dir = pathlib.Path(run_dir)
+        self.component = component
+        self.trace_id = hashlib.sha256(self.run_dir.name.encode("utf-8")).hexdigest()[:32]
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()
+        # a packed run gets its spans / summary back as loose files to append and merge into
+        for name in (SPANS_NAME, SUMMARY_NAME):
+            artifact_store.materialize(self.run_dir, name)
+
+    @contextmanager
+    def span(self, label: str, model: str):
+        s = Span(self.trace_id, self.component, label, model)
+        try:
+            yield s
+        except BaseException as e:
+            s.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            s.end_ns = time.time_ns()
+            self._emit(s.to_dict())
+
+    def add(self, label: str, model: str, start_ns: int, record: dict | None = None,
+            cache: str = "off", error: str | None = None) -> None:
+        """Span for a call that did not run inline (a batch result): from submission until now."""
+        s = Span(self.trace_id, self.component, label, model)
+        s.start_ns = start_ns
+        if record is not None:
+            s.record(record, cache)
+        s.error = error
+        s.end_ns = time.time_ns()
+        self._emit(s.to_dict())
+
+    def _emit(self, d: dict) -> None:
+        line = json.dumps(d, ensure_ascii=False)
+        with self._lock:
+            self.spans.append(d)
+            with open(self.run_dir / SPANS_NAME, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def run_spans(self) -> list[dict]:
+        """Every span this component appended to the run, including earlier (--resume'd) processes."""
+        try:
+            lines = (self.run_dir / SPANS_NAME).read_text(encoding="utf-8").splitlines()
+        except OSError:
+            return list(self.spans)
+        spans = []
+        for line in lines:
+            try:
+                d = json.loads(line)
+            except ValueError:
+                continue  # torn line from a killed process
+            if d.get("component") == self.component:
+                spans.append(d)
+        return spans
+
+    def summary(self, spans: list[dict] | None = None) -> dict:
+        spans = list(self.spans) if spans is None else spans
+        api = [s for s in spans if s["attributes"].get("llm.response_cache") != "hit" and s["status"] == "ok"]
+        # latency is the API call itself; spans without it (batch results) fall back to their duration
+        lat = [s["attributes"].get("llm.api_s", s["duration_s"]) for s in api]
+        queue = [s["attributes"]["llm.queue_s"] for s in api if "llm.queue_s" in s["attributes"]]
+
+        def total(key: str) -> int:  # billed calls only; cache hits replay old usage
+            return sum(s["attributes"].get(key) or 0 for s in spans if s["attributes"].get("llm.response_cache") != "hit")
+
+        costs = {s["prompt"]: s["attributes"].get("llm.cost_usd") for s in spans}
+        known = [c for c in costs.values() if c is not None]
+        return {
+            "calls": len(spans),
+            "api_calls": len(api),
+            "cache_hits": sum(1 for s in spans if s["attributes"].get("llm.response_cache") == "hit"),
+            "errors": sum(1 for s in spans if s["status"] == "error"),
+            "retries": total("llm.retries"),
+            "latency_p50_s": percentile(lat, 50),
+            "latency_p95_s": percentile(lat, 95),
+            "queue_s": round(sum(queue), 3),
+            "queue_p95_s": percentile(queue, 95),
+            "input_tokens": total("gen_ai.usage.input_tokens"),
+            "output_tokens": total("gen_ai.usage.output_tokens"),
+            "cache_read_tokens": total("llm.usage.cache_read_tokens"),
+            "cache_write_tokens": total("llm.usage.cache_write_tokens"),
+            "truncated": sum(1 for s in spans if s["attributes"].get("gen_ai.response.finish_reasons") == "max_tokens"),
+            "aborted": sum(1 for s in spans if s["attributes"].get("llm.aborted")),
+            "cost_usd": round(sum(known), 4) if known else None,
+            "cost_usd_by_prompt": dict(sorted(costs.items())),
+        }
+
+    def finish(self) -> dict:
+        """
+        Write this component's summary into telemetry_summary.json, export to OTLP
+        if configured, print it. The summary covers all of the component's spans
+        in the run, so a --resume adds to the earlier totals instead of replacing them.
+        """
+        out = self.run_dir / SUMMARY_NAME
+        with self._lock:
+            summary = self.summary(self.run_spans())
+            try:
+                merged = json.loads(out.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                merged = {}
+            merged[self.component] = summary
+            out.write_text(json.dumps(merged, indent=2), encoding="utf-8")
+        if OTLP_ENDPOINT:
+            export_otlp(self.spans, self.component)
+        cost = f"${summary['cost_usd']:.4f}" if summary["cost_usd"] is not None else "n/a"
+        p50, p95 = (f"{v}s" if v is not None else "-" for v in (summary["latency_p50_s"], summary["latency_p95_s"]))
+        print(f"telemetry: {summary['api_calls']} api calls ({summary['cache_hits']} cache hits, "
+              f"{summary['errors']} errors, {summary['retries']} retries) | "
+              f"p50 {p50} p95 {p95} (+{summary['queue_s']}s queued/backoff) | "
+              f"tokens in {summary['input_tokens']} out {summary['output_tokens']} "
+              f"cache r/w {summary['cache_read_tokens']}/{summary['cache_write_tokens']} | "
+              f"truncated {summary['truncated']} | est. cost {cost}")
+        return summary
+
+# --- OTLP/HTTP JSON export (no SDK needed; any collector with the OTLP HTTP receiver accepts it) ---
+def _otlp_value(v) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+def otlp_payload(spans: list[dict], service: str) -> dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+        "scopeSpans": [{
+            "scope": {"name": "llm-pipeline"},
+            "spans": [{
+                "traceId": s["trace_id"],
+                "spanId": s["span_id"],
+                "name": s["name"],
+                "kind": 3,  # CLIENT
+                "startTimeUnixNano": str(s["start_ns"]),
+                "endTimeUnixNano": str(s["end_ns"]),
+                "attributes": [{"key": k, "value": _otlp_value(v)}
+                               for k, v in {**s["attributes"], "llm.prompt": s["prompt"]}.items()],
+                "status": {"code": 2, "message": s["error"]} if s["error"] else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+def export_otlp(spans: list[dict], service: str, endpoint: str = OTLP_ENDPOINT) -> bool:
+    """POST the spans to <endpoint>/v1/traces. Best effort: a missing collector only prints a warning."""
+    import httpx
+    url = endpoint.rstrip("/") + "/v1/traces"
+    try:
+        httpx.post(url, json=otlp_payload(spans, service), timeout=5.0).raise_for_status()
+        return True
+    except httpx.HTTPError as e:
+        print(f"warning: OTLP export to {url} failed: {e}")
+        return False
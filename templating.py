@@ -0,0 +1,57 @@
+import pathlib, re
+from functools import lru_cache
+
+# {NAME} is a placeholder; {{NAME}} is literal text (used by the judge rubric
+# to describe its own output format) and is emitted verbatim.
+_TOKEN = re.compile(r"\{\{[A-Z][A-Z0-9_]*\}\}|\{([A-Z][A-Z0-9_]*)\}")
+
+class TemplateError(ValueError):
+    """Unknown or unfilled placeholder in a prompt template."""
+
+class Template:
+    """
+    A prompt file parsed once into alternating literal / placeholder segments.
+    Rendering is a single join over the segments, so a prompt that expands to
+    hundreds of KB is copied once instead of once per placeholder.
+    """
+
+    def __init__(self, source: str, name: str = "<template>"):
+        self.source = source
+        self.name = name
+        segments, pos = [], 0
+        for m in _TOKEN.finditer(source):
+            if m.group(1) is None:       # escaped {{NAME}}: keep as literal
+                continue
+            if m.start() > pos:
+                segments.append((False, source[pos:m.start()]))
+            segments.append((True, m.group(1)))
+            pos = m.end()
+        if pos < len(source):
+            segments.append((False, source[pos:]))
+        self.segments = tuple(segments)
+        self.placeholders = frozenset(v for is_ph, v in segments if is_ph)
+
+    def check(self, known) -> None:
+        """Raise TemplateError if the template uses a placeholder outside `known`."""
+        unknown = sorted(self.placeholders - set(known))
+        if unknown:
+            raise TemplateError(f"{self.name}: unknown placeholder(s): {', '.join('{' + u + '}' for u in unknown)}")
+
+    def render(self, values: dict) -> str:
+        """
+        Fill every placeholder from `values` in one pass. A key that is missing
+        (or None) is an error; an empty string is a valid, deliberately blank value.
+        """
+        missing = sorted(k for k in self.placeholders if values.get(k) is None)
+        if missing:
+            raise TemplateError(f"{self.name}: unfilled placeholder(s): {', '.join('{' + k + '}' for k in missing)}")
+        return "".join(values[v] if is_ph else v for is_ph, v in self.segments)
+
+@lru_cache(maxsize=None)
+def _load(path: str, mtime_ns: int) -> Template:
+    p = pathlib.Path(path)
+    return Template(p.read_text(encoding="utf-8"), name=p.name)
+
+def load_template(path: pathlib.Path) -> Template:
+    """Parse a prompt file once (re-parsed only if the file changes)."""
+    return _load(str(path), path.stat().st_mtime_ns)
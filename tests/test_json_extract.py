@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from json_extract import extract_json, JsonExtractError
+
+BUNDLE = {
+    "bundle_manifest": [{"path": "readme.md"}],
+    "readme.md": "# Deploy\n\n```bash\nterraform init\nterraform apply\n```\n",
+    "changelog.md": "- initial\n",
+    "validation": {"ok": True},
+}
+
+def test_clean_json_has_no_repairs():
+    assert extract_json(json.dumps(BUNDLE)) == (BUNDLE, [])
+
+def test_fence_inside_string_value_is_not_stripped():
+    value, repairs = extract_json(json.dumps(BUNDLE, indent=2))
+    assert value == BUNDLE
+    assert repairs == []
+
+def test_fenced_bundle_with_fence_inside_string():
+    value, repairs = extract_json("```json\n" + json.dumps(BUNDLE, indent=2) + "\n```")
+    assert value == BUNDLE
+    assert repairs == ["stripped code fence"]
+
+def test_prose_then_fence():
+    value, repairs = extract_json("Here is the bundle:\n```json\n" + json.dumps(BUNDLE) + "\n```\nDone.")
+    assert value == BUNDLE
+    assert any(r.startswith("dropped") and "leading" in r for r in repairs)
+
+def test_truncated_fenced_output_keeps_members_after_inner_fence():
+    text = "```json\n" + json.dumps(BUNDLE, indent=2)
+    value, repairs = extract_json(text[:text.index('"changelog.md"') + 30])
+    assert value["readme.md"] == BUNDLE["readme.md"]
+    assert value["changelog.md"].startswith("- initial")
+    assert repairs[0] == "stripped unterminated code fence"
+
+def test_discarded_attempt_notes_are_not_reported():
+    # closing in place leaves a dangling "b" key with a string value missing; the cut-back wins
+    value, repairs = extract_json('{"a": [1, 2], "b": {"c": "x", "d": tru')
+    assert value == {"a": [1, 2], "b": {"c": "x", "d": True}}
+    value, repairs = extract_json('{"a": 1, "b": "abc\\u00')
+    assert value == {"a": 1}
+    assert "closed unterminated string" not in repairs
+    assert repairs[-1].startswith("cut back")
+
+def test_truncated_literal_and_string():
+    assert extract_json('{"a": 1, "b": "xx') == ({"a": 1, "b": "xx"}, ["closed unterminated string", "closed 1 open bracket(s)"])
+
+def test_no_json():
+    with pytest.raises(JsonExtractError):
+        extract_json("I could not produce the bundle.")
+    with pytest.raises(JsonExtractError):
+        extract_json("   ")
@@ -0,0 +1,138 @@
+import json
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+import src.orders.handlers as h
+
+_ser, _de = TypeSerializer(), TypeDeserializer()
+
+def _wire(item):
+    """What boto3 does to an item on the way to DynamoDB and back (floats raise TypeError)."""
+    return {k: _de.deserialize(_ser.serialize(v)) for k, v in item.items()}
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def put_item(self, Item):
+        self.rows[Item["order_id"]] = _wire(Item)
+
+    def get_item(self, Key):
+        row = self.rows.get(Key["order_id"])
+        return {"Item": dict(row)} if row else {}
+
+class FakeResource:
+    """batch_write_item / batch_get_item over a dict; `unprocessed` and `fail_on` inject partial failures."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.writes, self.gets = [], []
+        self.unprocessed = 0        # leave this many puts unprocessed on the next call
+        self.fail_on = None         # index of the batch_write_item call that raises
+
+    def batch_write_item(self, RequestItems):
+        (name, requests), = RequestItems.items()
+        self.writes.append(len(requests))
+        if self.fail_on == len(self.writes) - 1:
+            raise RuntimeError("ProvisionedThroughputExceededException")
+        keep, self.unprocessed = requests[:self.unprocessed], 0
+        for r in requests[len(keep):]:
+            item = _wire(r["PutRequest"]["Item"])
+            self.rows[item["order_id"]] = item
+        return {"UnprocessedItems": {name: keep} if keep else {}}
+
+    def batch_get_item(self, RequestItems):
+        (name, req), = RequestItems.items()
+        self.gets.append(len(req["Keys"]))
+        found = [dict(self.rows[k["order_id"]]) for k in req["Keys"] if k["order_id"] in self.rows]
+        return {"Responses": {name: found}, "UnprocessedKeys": {}}
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def put(self, detail_type, detail, source=None):
+        self.events.append((detail_type, json.loads(detail)))
+
+@pytest.fixture
+def db(monkeypatch):
+    rows = {}
+    res = FakeResource(rows)
+    monkeypatch.setattr(h, "TABLE_NAME", "orders")
+    monkeypatch.setattr(h, "TABLE", FakeTable(rows))
+    monkeypatch.setattr(h, "dynamodb", res)
+    monkeypatch.setattr(h, "CACHE", h._TTLCache())
+    monkeypatch.setattr(h, "PUBLISHER", Recorder())
+    monkeypatch.setattr(h, "_backoff", lambda attempt: None)
+    return res
+
+def _body(resp):
+    return json.loads(resp["body"])
+
+def test_total_round_trips_as_decimal(db):
+    resp = h.create_order({"body": json.dumps({"total": 19.99})}, None)
+    assert resp["statusCode"] == 201
+    oid = _body(resp)["order_id"]
+    assert db.rows[oid]["total"] == Decimal("19.99")
+    got = h.get_order({"pathParameters": {"order_id": oid}}, None)
+    assert got["statusCode"] == 200
+    assert _body(got)["total"] == 19.99
+    assert h.PUBLISHER.events == [("ReceiptGenerated", {"order_id": oid, "total": 19.99})]
+
+def test_integral_total_is_an_int(db):
+    oid = _body(h.create_order({"body": json.dumps({"total": "40"})}, None))["order_id"]
+    assert _body(h.get_order({"pathParameters": {"order_id": oid}}, None))["total"] == 40
+
+@pytest.mark.parametrize("total", ["abc", "NaN", "Infinity", "-inf", None, [1]])
+def test_rejects_non_numeric_totals(db, total):
+    resp = h.create_order({"body": json.dumps({"total": total})}, None)
+    assert resp["statusCode"] == 400
+    assert db.rows == {}
+
+def test_bulk_rejects_bad_totals_by_index(db):
+    resp = h.create_orders({"body": json.dumps({"orders": [{"total": 1}, {"total": "NaN"}, {}]})}, None)
+    assert resp["statusCode"] == 400
+    assert _body(resp)["indexes"] == [1, 2]
+
+def test_batch_write_chunks_of_25_and_retries_unprocessed(db):
+    db.unprocessed = 3
+    resp = h.create_orders({"body": json.dumps({"orders": [{"total": i} for i in range(60)]})}, None)
+    assert resp["statusCode"] == 201
+    assert db.writes == [25, 3, 25, 10]
+    assert len(db.rows) == 60
+    assert len(h.PUBLISHER.events) == 60
+
+def test_batch_write_error_fails_only_that_chunk(db):
+    db.fail_on = 1
+    resp = h.create_orders({"body": json.dumps({"orders": [{"total": i} for i in range(60)]})}, None)
+    assert resp["statusCode"] == 207
+    body = _body(resp)
+    assert body["failed"] == 25
+    assert body["order_ids"][25:50] == [None] * 25
+    assert all(body["order_ids"][:25]) and all(body["order_ids"][50:])
+    assert len(h.PUBLISHER.events) == 35
+
+def test_batch_get_chunks_of_100(db):
+    ids = _body(h.create_orders({"body": json.dumps({"orders": [{"total": i} for i in range(250)]})}, None))["order_ids"]
+    resp = h.get_orders({"queryStringParameters": {"ids": ",".join(ids + ["nope"])}}, None)
+    assert db.gets == [100, 100, 51]
+    body = _body(resp)
+    assert [o["order_id"] for o in body["orders"]] == ids
+    assert body["missing"] == ["nope"]
+
+def test_cache_serves_only_immutable_fields(db):
+    ids = _body(h.create_orders({"body": json.dumps({"orders": [{"total": 5}, {"total": 6}]})}, None))["order_ids"]
+    ids_qs = ",".join(ids)
+
+    h.get_orders({"queryStringParameters": {"ids": ids_qs, "fields": "order_id,total"}}, None)
+    assert db.gets == []                      # both cached at create time
+
+    db.rows[ids[0]]["status"] = "SHIPPED"
+    resp = h.get_orders({"queryStringParameters": {"ids": ids_qs, "fields": "order_id,status"}}, None)
+    assert db.gets == [2]                     # status is mutable: always read
+    assert _body(resp)["orders"][0]["status"] == "SHIPPED"
+
+    h.get_orders({"queryStringParameters": {"ids": ids_qs}}, None)
+    assert db.gets == [2, 2]                  # no fields = whole item, read through
@@ -0,0 +1,117 @@
+import io, json
+
+import pytest
+
+import src.ingestor.process_csv as pc
+
+class Body:
+    def __init__(self, data):
+        self.buf = io.BytesIO(data)
+
+    def read(self, n=-1):
+        return self.buf.read(n)
+
+    def close(self):
+        pass
+
+class ClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+class StubS3:
+    """Objects in a dict; records every ranged GET and answers one at or past the size with a 416 like S3."""
+
+    def __init__(self, objects):
+        self.objects = dict(objects)
+        self.ranges = []                 # (key, start) of every ranged GET
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.objects[Key]), "ETag": f'"{hash(self.objects[Key])}"'}
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Key not in self.objects:
+            raise ClientError("NoSuchKey")
+        data = self.objects[Key]
+        if Range is None:
+            return {"Body": Body(data)}
+        start = int(Range.removeprefix("bytes=").split("-")[0])
+        self.ranges.append((Key, start))
+        if start >= len(data):
+            raise ClientError("InvalidRange")
+        return {"Body": Body(data[start:])}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Key] = Body
+
+def _csv(n, start=0):
+    # uneven line lengths so ranges split mid-line at different offsets
+    return ("customer_id,email,segment\n" +
+            "".join(f"c{i},c{i}@{'x' * (i % 7)}.io,s{i % 3}\n" for i in range(start, start + n))).encode()
+
+def _ingest(s3, key, **kw):
+    emitted = []
+    cp = pc.ingest_object(s3, "b", key, emit=lambda row: emitted.append(row["customer_id"]), flush=None, **kw)
+    return cp, emitted
+
+@pytest.mark.parametrize("range_bytes", [7, 13, 101])
+def test_odd_range_sizes_realign_to_whole_lines(range_bytes):
+    s3 = StubS3({"f.csv": _csv(200)})
+    cp, emitted = _ingest(s3, "f.csv", workers=3, range_bytes=range_bytes)
+    assert cp["done"] and cp["emitted"] == 200
+    assert sorted(emitted) == sorted(f"c{i}" for i in range(200))
+
+def _ingest_until(s3, seen, stop_after):
+    """Ingest f.csv until `stop_after` rows were emitted, then report no time left."""
+    def emit(row):
+        seen.append(row["customer_id"])
+    pc.ingest_object(s3, "b", "f.csv", emit=emit, flush=None, workers=2, range_bytes=1000,
+                     time_left_ms=lambda: 0 if len(seen) >= stop_after else 60_000, safety_ms=1)
+
+def test_incomplete_then_resume_loses_no_rows(monkeypatch):
+    monkeypatch.setattr(pc, "CHECKPOINT_EVERY", 10)
+    s3 = StubS3({"f.csv": _csv(500)})
+    seen = []
+    with pytest.raises(pc.Incomplete):
+        _ingest_until(s3, seen, stop_after=120)
+    cp = json.loads(s3.objects[pc.checkpoint_key("f.csv")])
+    assert not cp["done"] and cp["emitted"] >= 120
+    cp, emitted = _ingest(s3, "f.csv", workers=2, range_bytes=1000)
+    assert cp["done"]
+    assert set(seen + emitted) == {f"c{i}" for i in range(500)}
+    assert len(emitted) < 500                     # resumed from the checkpoint, not from the top
+
+def test_done_file_is_skipped_on_retry():
+    s3 = StubS3({"f.csv": _csv(20)})
+    _ingest(s3, "f.csv")
+    s3.ranges.clear()
+    cp, emitted = _ingest(s3, "f.csv")
+    assert cp["done"] and emitted == [] and s3.ranges == []
+
+@pytest.mark.parametrize("data", [b"", b"customer_id,email,segment\n", b"customer_id,email,segment"])
+def test_empty_and_header_only_files_finish_without_a_range_past_the_end(data):
+    s3 = StubS3({"f.csv": data})
+    cp, emitted = _ingest(s3, "f.csv", range_bytes=7)
+    assert cp["done"] and cp["emitted"] == 0 and emitted == []
+    assert all(start < len(data) for _, start in s3.ranges)
+
+class Recorder:
+    def __init__(self):
+        self.rows = []
+
+    def put(self, detail_type, detail, source=None):
+        self.rows.append(detail["customer_id"])
+
+def _record(key):
+    return {"s3": {"bucket": {"name": "b"}, "object": {"key": key, "sequencer": "01"}}}
+
+def test_handler_ingests_every_record_and_decodes_keys(monkeypatch):
+    s3 = StubS3({"in/a.csv": _csv(5), "in/crm export (1).csv": _csv(3, start=100), "in/empty.csv": b""})
+    monkeypatch.setattr(pc, "s3", s3)
+    monkeypatch.setattr(pc, "PUBLISHER", Recorder())
+    event = {"Records": [_record("in/a.csv"), _record("in/crm+export+%281%29.csv"), _record("in/empty.csv"),
+                         _record(pc.CHECKPOINT_PREFIX + "in/a.csv.json")]}
+    out = pc.handler(event, None)
+    assert out["ok"] and out["emitted"] == 8
+    assert [f["key"] for f in out["files"]] == ["in/a.csv", "in/crm export (1).csv", "in/empty.csv"]
+    assert sorted(pc.PUBLISHER.rows) == sorted([f"c{i}" for i in range(5)] + ["c100", "c101", "c102"])
@@ -0,0 +1,38 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import src.receipts.worker as w
+
+class ClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+def _msg(mid, body):
+    return {"messageId": mid, "body": body if isinstance(body, str) else json.dumps(body)}
+
+def _store(order_id, text):
+    if order_id == "throttled":
+        raise ClientError("SlowDown")
+    if order_id == "too-long":
+        raise ClientError("KeyTooLongError")
+
+def test_only_transient_store_errors_are_redelivered():
+    records = [_msg("bad-json", "not json"),
+               _msg("bad-total", {"detail": {"order_id": "a", "total": "abc"}}),
+               _msg("t1", {"detail": {"order_id": "throttled", "total": 1}}),
+               _msg("t2", {"order_id": "throttled", "total": 1}),
+               _msg("rejected", {"order_id": "too-long", "total": 1}),
+               _msg("ok", {"order_id": "b", "total": 2})]
+    with ThreadPoolExecutor(4) as pool:
+        assert sorted(w.process_batch(records, store=_store, pool=pool)) == ["t1", "t2"]
+
+def test_handler_fails_fast_without_a_bucket(monkeypatch):
+    monkeypatch.setattr(w, "BUCKET", "")
+    stored = []
+    monkeypatch.setattr(w, "process_batch", lambda records: stored.extend(records) or [])
+    with pytest.raises(RuntimeError, match="RECEIPTS_BUCKET"):
+        w.handler({"Records": [_msg("m", {"order_id": "a", "total": 1})]}, None)
+    assert stored == []
@@ -0,0 +1,28 @@
+from tournament import as_score, merge_ranking, pairings
+
+SCORES = [{"prompt": p, "score": s, "reasons": ""} for p, s in (("A", 90), ("B", 80), ("C", 70), ("D", 60))]
+
+def _order(result):
+    return [r["prompt"] for r in result["ranking"]]
+
+def test_wins_reorder_top_k_and_keep_the_rest_by_score():
+    matches = [{"a": "A", "b": "B", "winner": "B"}, {"a": "C", "b": "A", "winner": "C"},
+               {"a": "B", "b": "C", "winner": "B"}]
+    result = merge_ranking(SCORES, matches, 3)
+    assert _order(result) == ["B", "C", "A", "D"]
+    assert result["winner"] == "B"
+
+def test_winner_outside_the_match_counts_for_nobody():
+    matches = [{"a": "A", "b": "B", "winner": "C"},      # judge named a third candidate
+               {"a": "A", "b": "C", "winner": "C"},
+               {"a": "B", "b": "C", "winner": "B"}]
+    result = merge_ranking(SCORES, matches, 3)
+    assert "C=1" in result["notes"] and "B=1" in result["notes"]
+    assert _order(result) == ["B", "C", "A", "D"]         # B/C tie broken by score
+
+def test_pairings_alternate_sides():
+    finalists = SCORES[:3]
+    assert pairings(finalists) == [("B", "A"), ("A", "C"), ("C", "B")]
+
+def test_as_score_tolerates_junk():
+    assert [as_score(v) for v in ("85", None, "NaN", "x", 7)] == [85.0, 0.0, 0.0, 0.0, 7.0]
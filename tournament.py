@@ -0,0 +1,53 @@
+import math
+from itertools import combinations
+
+def as_score(value) -> float:
+    """Judge scores as numbers: strings like "85" are parsed, null / junk / NaN count as 0."""
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return score if math.isfinite(score) else 0.0
+
+def top_k(scores: list[dict], k: int) -> list[dict]:
+    """Best k scored candidates (score desc, then prompt name for a stable order)."""
+    return sorted(scores, key=lambda r: (-r["score"], r["prompt"]))[:k]
+
+def pairings(finalists: list[dict]) -> list[tuple[str, str]]:
+    """
+    Round-robin pairs among the finalists. Which side is shown first alternates
+    (by the parity of the two ranks) so no candidate is always "A" and the
+    judge's position bias does not decide the tie-break.
+    """
+    return [(a["prompt"], b["prompt"]) if (i + j) % 2 == 0 else (b["prompt"], a["prompt"])
+            for (i, a), (j, b) in combinations(enumerate(finalists), 2)]
+
+def merge_ranking(scores: list[dict], matches: list[dict], k: int) -> dict:
+    """
+    Final judge_prompts.json shape from per-candidate scores plus pairwise matches.
+
+    The top-k are re-ordered by pairwise wins (ties fall back to the absolute
+    score); everyone else keeps their absolute-score order below them. Each
+    match is {"a", "b", "winner", "reasons"}; a match whose winner is neither
+    side counts for nobody.
+    """
+    finalists = top_k(scores, k)
+    names = {r["prompt"] for r in finalists}
+    wins = {n: 0 for n in names}
+    for m in matches:
+        if m.get("winner") in wins and m["winner"] in (m.get("a"), m.get("b")):
+            wins[m["winner"]] += 1
+    head = sorted(finalists, key=lambda r: (-wins[r["prompt"]], -r["score"], r["prompt"]))
+    tail = [r for r in top_k(scores, len(scores)) if r["prompt"] not in names]
+    ranking = [{"prompt": r["prompt"], "score": r["score"], "reasons": r["reasons"]} for r in head + tail]
+
+    notes = f"{len(scores)} candidates scored independently"
+    if matches:
+        notes += "; top-%d re-ordered by round-robin (%s)" % (
+            len(finalists), ", ".join(f"{n}={wins[n]}" for n in (r["prompt"] for r in head)))
+    return {
+        "ranking": ranking,
+        "winner": ranking[0]["prompt"] if ranking else None,
+        "notes": notes,
+        "tournament": matches,
+    }
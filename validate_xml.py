@@ -5,12 +5,24 @@ REQUIRED = [
     "Services","Constraints","CloudMapping","Risks"
 ]
 
+CHUNK = 1 << 16
+
 def validate_xml(xml_text: str):
+    # one pull-parse pass: collect tags as they open, free elements as they close
+    seen = set()
+    parser = ET.XMLPullParser(events=("start", "end"))
     try:
-        root = ET.fromstring(xml_text)
+        for i in range(0, len(xml_text), CHUNK):
+            parser.feed(xml_text[i:i + CHUNK])
+            for event, el in parser.read_events():
+                if event == "start":
+                    seen.add(el.tag)
+                else:
+                    el.clear()
+        parser.close()
     except ET.ParseError as e:
         return False, f"ParseError: {e}"
-    missing = [t for t in REQUIRED if root.find(f".//{t}") is None]
+    missing = [t for t in REQUIRED if t not in seen]
     if missing:
         return False, f"Missing sections: {', '.join(missing)}"
     return True, "OK"